@@ -1,40 +1,100 @@
-﻿from datetime import datetime, timedelta
+﻿import hmac
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta
 from functools import wraps
 
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, session, g
+from flask import Flask, render_template, stream_template, request, redirect, url_for, flash, jsonify, session, g
+from flask import Response, abort, current_app, make_response, stream_with_context
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
+from sqlalchemy import func, select
+from sqlalchemy.orm import joinedload
 from sqlalchemy.exc import IntegrityError
 
-# Creer l'application d'abord
-app = Flask(__name__)
-
-# Importer et initialiser la base de donnees
-from database import db, init_app, ensure_schema
-
-init_app(app)
-
-# Importer les modeles APRES l'initialisation de l'application
+from config import Config, PROFILS
+from database import db, init_app, init_migrations, liberer_connexions, verifier_schema, verrouiller_ecriture
 from models import Bibliothecaire, Usager, Ouvrage, Exemplaire, Emprunt, Reservation, DemandeUsager
-
-# Creer les nouvelles tables une fois les modeles charges
-ensure_schema(app)
+from models import STATUTS_EMPRUNT_ACTIFS
+from disponibilite import disponibilites, disponibilites_par_ids
+from circulation import allouer_exemplaire, enregistrer_retour
+from file_reservations import mettre_en_file, renumeroter_file, retirer_de_file
+from demandes import accepter_demande_en_attente, refuser_demande_en_attente, verrouiller_demande
+from recherche import requete_catalogue
+from pagination import paginer, taille_page, url_curseur
+from cache_http import EMPREINTE_TEMPLATES, etag, jeton_identite, marquer, reponse_304_si_inchangee
+from controllers import GestionBibliotheque
+from diagnostics import init_diagnostics, statistiques as statistiques_sql
+from exports import EXPORTS, FORMATS as FORMATS_EXPORT, exporter, lire_date
+from identite import bibliothecaire_connecte, usager_connecte
+from fragments import init_fragments, statistiques as statistiques_fragments
+from maintenance import init_maintenance
+from metriques import exposer as exposer_metriques, init_metriques
+from registre import Registre
+from securite import HachageSature, init_securite
+
+# Vues et crochets declares ici, attaches a chaque application par create_app
+routes = Registre()
 
 # Configuration de Flask-Login (admin)
 login_manager = LoginManager()
-login_manager.init_app(app)
 login_manager.login_view = 'login'
 
+_verrou_processus = threading.Lock()
+
 
 @login_manager.user_loader
 def load_user(user_id):
-    return db.session.get(Bibliothecaire, int(user_id))
+    return bibliothecaire_connecte(user_id)
+
+
+def init_processus(app):
+    """Ressources propres au processus, ouvertes une fois dans chaque worker.
+
+    Appelee par le crochet ``post_worker_init`` de gunicorn (``gunicorn.conf.py``)
+    et, a defaut, par la premiere requete du processus : connexions heritees
+    du parent oubliees, pool de hachage recree, revision du schema lue (la
+    premiere connexion), planificateur de maintenance et publication des
+    metriques demarres.
+    """
+    etat = app.extensions['processus']
+    with _verrou_processus:
+        if etat['pid'] == os.getpid():
+            return
+        if etat['parent'] != os.getpid():
+            liberer_connexions(app)
+            init_securite(app)
+        verifier_schema(app)
+        if 'maintenance' in app.extensions:
+            app.extensions['maintenance'].demarrer()
+        app.extensions['metriques'].demarrer()
+        etat['pid'] = os.getpid()
+
+
+@routes.before_request
+def preparer_processus():
+    if current_app.extensions['processus']['pid'] != os.getpid():
+        init_processus(current_app._get_current_object())
+
+
+@routes.before_request
+def refuser_si_schema_perime():
+    """Base pas encore migree : un 503 explicite plutot que des erreurs SQL"""
+    if current_app.extensions['schema']['a_jour'] or verifier_schema(current_app, journaliser=False):
+        return None
+    return 'Base de donnees en attente de migration, reessayez dans quelques instants.', 503, {'Retry-After': '5'}
+
+
+@routes.errorhandler(HachageSature)
+def hachage_sature(erreur):
+    """Rafale de connexions : refuser tout de suite plutot que d'occuper le worker"""
+    db.session.rollback()
+    return 'Service momentanement surcharge, reessayez dans quelques secondes.', 503, {'Retry-After': '2'}
 
 
 def get_usager_session():
-    usager_id = session.get('usager_id')
-    if not usager_id:
-        return None
-    return db.session.get(Usager, usager_id)
+    return usager_connecte()
 
 
 def usager_required(view):
@@ -50,12 +110,7 @@ def usager_required(view):
     return wrapped
 
 
-@app.before_request
-def inject_request_context():
-    g.usager_session = get_usager_session()
-
-
-@app.context_processor
+@routes.context_processor
 def inject_global_context():
     return {
         'usager_session': get_usager_session(),
@@ -65,37 +120,57 @@ def inject_global_context():
 
 # ==================== ROUTES PUBLIQUES ====================
 
-@app.route('/')
+@routes.route('/')
 def index():
     """Page d'accueil publique"""
     return render_template('index.html')
 
 
-@app.route('/catalogue')
+@routes.route('/catalogue')
 def catalogue():
     """Catalogue public des livres"""
     search = request.args.get('search', '').strip()
-    if search:
-        ouvrages = Ouvrage.query.filter(
-            Ouvrage.titre.contains(search) | Ouvrage.auteur.contains(search)
-        ).all()
-    else:
-        ouvrages = Ouvrage.query.all()
+    ouvrages = page_catalogue(search)
+
+    return render_template('catalogue.html', ouvrages=ouvrages, disponibilites=disponibilites(ouvrages))
 
-    return render_template('catalogue.html', ouvrages=ouvrages)
 
+def page_catalogue(search, colonnes_repli=(Ouvrage.titre, Ouvrage.auteur)):
+    """Page d'ouvrages du catalogue pour la recherche et le curseur demandes"""
+    query, cles, element = requete_catalogue(search, colonnes_repli)
+    return paginer(query, cles, request.args.get('curseur'), taille_page(), element=element)
 
-@app.route('/catalogue/<int:id>')
+
+def version_ouvrage(id):
+    """(version, date de modification) d'un ouvrage sans charger l'objet ; 404 s'il n'existe pas"""
+    ligne = db.session.execute(
+        select(Ouvrage.version, func.coalesce(Ouvrage.date_modification, Ouvrage.date_ajout))
+        .where(Ouvrage.id == id)
+    ).first()
+    if ligne is None:
+        abort(404)
+    return ligne
+
+
+@routes.route('/catalogue/<int:id>')
 def detail_ouvrage_public(id):
     """Detail public d'un ouvrage"""
-    ouvrage = Ouvrage.query.get_or_404(id)
+    version, date_modification = version_ouvrage(id)
+    # La page affiche la barre de navigation du visiteur : le jeton en depend
+    jeton = etag('o', id, version, jeton_identite(), EMPREINTE_TEMPLATES)
+    inchangee = reponse_304_si_inchangee(jeton, date_modification, page_html=True)
+    if inchangee is not None:
+        return inchangee
+
+    ouvrage = db.session.get(Ouvrage, id)
     exemplaires = Exemplaire.query.filter_by(ouvrage_id=id).all()
-    return render_template('detail_ouvrage_public.html', ouvrage=ouvrage, exemplaires=exemplaires)
+    page = render_template('detail_ouvrage_public.html', ouvrage=ouvrage, exemplaires=exemplaires)
+    return marquer(make_response(page), jeton, date_modification)
 
 
 # ==================== ROUTES AUTH ADMIN ====================
 
-@app.route('/login', methods=['GET', 'POST'])
+@routes.route('/login', methods=['GET', 'POST'])
 def login():
     """Page de connexion admin"""
     if request.method == 'POST':
@@ -105,6 +180,7 @@ def login():
         bibliothecaire = Bibliothecaire.query.filter_by(login=login_input).first()
 
         if bibliothecaire and bibliothecaire.check_password(password):
+            db.session.commit()  # hash eventuellement mis a niveau
             login_user(bibliothecaire)
             flash('Connexion admin reussie.', 'success')
             return redirect(url_for('dashboard'))
@@ -114,7 +190,7 @@ def login():
     return render_template('login.html')
 
 
-@app.route('/logout')
+@routes.route('/logout')
 @login_required
 def logout():
     """Deconnexion admin"""
@@ -125,7 +201,7 @@ def logout():
 
 # ==================== ROUTES AUTH USAGER ====================
 
-@app.route('/espace-usager/inscription', methods=['GET', 'POST'])
+@routes.route('/espace-usager/inscription', methods=['GET', 'POST'])
 def usager_register():
     if request.method == 'POST':
         nom = request.form['nom'].strip()
@@ -164,7 +240,7 @@ def usager_register():
     return render_template('usager_register.html')
 
 
-@app.route('/espace-usager/connexion', methods=['GET', 'POST'])
+@routes.route('/espace-usager/connexion', methods=['GET', 'POST'])
 def usager_login():
     if request.method == 'POST':
         email = request.form['email'].strip().lower()
@@ -174,6 +250,7 @@ def usager_login():
         if not usager or not usager.check_password(password):
             flash('Email ou mot de passe invalide.', 'danger')
             return redirect(url_for('usager_login'))
+        db.session.commit()  # hash eventuellement mis a niveau
 
         if usager.statut != 'actif':
             flash('Votre compte est inactif. Contactez la bibliotheque.', 'warning')
@@ -188,7 +265,7 @@ def usager_login():
 
 
 
-@app.route('/espace-usager/mot-de-passe-oublie', methods=['GET', 'POST'])
+@routes.route('/espace-usager/mot-de-passe-oublie', methods=['GET', 'POST'])
 def usager_forgot_password():
     if request.method == 'POST':
         email = request.form['email'].strip().lower()
@@ -222,7 +299,7 @@ def usager_forgot_password():
 
     return render_template('usager_forgot_password.html')
 
-@app.route('/espace-usager/deconnexion')
+@routes.route('/espace-usager/deconnexion')
 def usager_logout():
     session.pop('usager_id', None)
     flash('Vous etes deconnecte de votre espace usager.', 'info')
@@ -231,22 +308,20 @@ def usager_logout():
 
 # ==================== DASHBOARD ADMIN ====================
 
-@app.route('/dashboard')
+@routes.route('/dashboard')
 @login_required
 def dashboard():
     """Tableau de bord administrateur"""
-    emprunts_en_cours = Emprunt.query.filter_by(statut='en_cours').all()
+    stats = GestionBibliotheque.get_statistiques()
 
-    stats = {
-        'total_ouvrages': Ouvrage.query.count(),
-        'total_usagers': Usager.query.count(),
-        'emprunts_en_cours': len(emprunts_en_cours),
-        'emprunts_en_retard': len([e for e in emprunts_en_cours if e.est_en_retard()]),
-        'reservations_actives': Reservation.query.filter_by(statut='active').count(),
-        'demandes_en_attente': DemandeUsager.query.filter_by(statut='en_attente').count(),
-    }
-
-    derniers_emprunts = Emprunt.query.order_by(Emprunt.date_emprunt.desc()).limit(6).all()
+    derniers_emprunts = (
+        Emprunt.query.options(
+            joinedload(Emprunt.usager), joinedload(Emprunt.exemplaire).joinedload(Exemplaire.ouvrage)
+        )
+        .order_by(Emprunt.date_emprunt.desc())
+        .limit(6)
+        .all()
+    )
 
     return render_template(
         'dashboard.html',
@@ -258,19 +333,32 @@ def dashboard():
 
 # ==================== DASHBOARD USAGER ====================
 
-@app.route('/espace-usager/dashboard')
+@routes.route('/espace-usager/dashboard')
 @usager_required
 def usager_dashboard():
     usager = g.usager_session
 
-    emprunts_en_cours = Emprunt.query.filter_by(usager_id=usager.id, statut='en_cours').all()
+    emprunts_en_cours = Emprunt.query.filter(
+        Emprunt.usager_id == usager.id, Emprunt.statut.in_(STATUTS_EMPRUNT_ACTIFS)
+    ).count()
     reservations_actives = Reservation.query.filter_by(usager_id=usager.id, statut='active').count()
-    demandes = DemandeUsager.query.filter_by(usager_id=usager.id).order_by(DemandeUsager.date_creation.desc()).all()
-    emprunts_recents = Emprunt.query.filter_by(usager_id=usager.id).order_by(Emprunt.date_emprunt.desc()).limit(10).all()
+    demandes = (
+        DemandeUsager.query.options(joinedload(DemandeUsager.ouvrage))
+        .filter_by(usager_id=usager.id)
+        .order_by(DemandeUsager.date_creation.desc())
+        .all()
+    )
+    emprunts_recents = (
+        Emprunt.query.options(joinedload(Emprunt.exemplaire).joinedload(Exemplaire.ouvrage))
+        .filter_by(usager_id=usager.id)
+        .order_by(Emprunt.date_emprunt.desc())
+        .limit(10)
+        .all()
+    )
 
     stats = {
-        'emprunts_en_cours': len(emprunts_en_cours),
-        'emprunts_en_retard': len([e for e in emprunts_en_cours if e.est_en_retard()]),
+        'emprunts_en_cours': emprunts_en_cours,
+        'emprunts_en_retard': Emprunt.query.filter(Emprunt.usager_id == usager.id, Emprunt.en_retard).count(),
         'reservations_actives': reservations_actives,
         'demandes_total': len(demandes),
         'demandes_en_attente': len([d for d in demandes if d.statut == 'en_attente']),
@@ -291,38 +379,140 @@ def usager_dashboard():
     )
 
 
-@app.route('/api/espace-usager/dashboard')
-@usager_required
-def api_usager_dashboard():
-    usager = g.usager_session
-
-    emprunts = Emprunt.query.filter_by(usager_id=usager.id, statut='en_cours').all()
-    demandes = DemandeUsager.query.filter_by(usager_id=usager.id).order_by(DemandeUsager.date_creation.desc()).limit(5).all()
+def donnees_tableau_usager(usager_id):
+    """Indicateurs et dernieres demandes d'un usager, pour l'API et le flux SSE"""
+    emprunts_en_cours = Emprunt.query.filter(
+        Emprunt.usager_id == usager_id, Emprunt.statut.in_(STATUTS_EMPRUNT_ACTIFS)
+    ).count()
+    demandes = (
+        db.session.query(DemandeUsager, Ouvrage.titre)
+        .join(Ouvrage, DemandeUsager.ouvrage_id == Ouvrage.id)
+        .filter(DemandeUsager.usager_id == usager_id)
+        .order_by(DemandeUsager.date_creation.desc())
+        .limit(5)
+        .all()
+    )
 
-    payload = {
+    return {
         'stats': {
-            'emprunts_en_cours': len(emprunts),
-            'emprunts_en_retard': len([e for e in emprunts if e.est_en_retard()]),
-            'reservations_actives': Reservation.query.filter_by(usager_id=usager.id, statut='active').count(),
-            'demandes_en_attente': DemandeUsager.query.filter_by(usager_id=usager.id, statut='en_attente').count(),
+            'emprunts_en_cours': emprunts_en_cours,
+            'emprunts_en_retard': Emprunt.query.filter(Emprunt.usager_id == usager_id, Emprunt.en_retard).count(),
+            'reservations_actives': Reservation.query.filter_by(usager_id=usager_id, statut='active').count(),
+            'demandes_en_attente': DemandeUsager.query.filter_by(usager_id=usager_id, statut='en_attente').count(),
         },
         'demandes': [
             {
                 'id': d.id,
-                'ouvrage': d.ouvrage.titre,
+                'ouvrage': titre,
                 'type_demande': d.type_demande,
                 'statut': d.statut,
                 'date_creation': d.date_creation.strftime('%d/%m/%Y %H:%M'),
             }
-            for d in demandes
+            for d, titre in demandes
         ],
     }
-    return jsonify(payload)
+
+
+def etat_tableau_usager(usager_id):
+    """Version du tableau de bord d'un usager : (version, date de modification) ou None.
+
+    ``usagers.version`` ne change pas quand un emprunt passe en retard (le
+    retard se deduit de l'heure) : la derniere date de retour prevue depassee
+    des emprunts actifs entre dans la version, et dans la date de modification.
+    """
+    depassee = (
+        select(func.max(Emprunt.date_retour_prevue))
+        .where(Emprunt.usager_id == Usager.id, Emprunt.en_retard)
+        .scalar_subquery()
+    )
+    ligne = db.session.execute(
+        select(Usager.version, Usager.date_modification, depassee).where(Usager.id == usager_id)
+    ).first()
+    if ligne is None:
+        return None
+    version, date_modification, depassee = ligne
+    if depassee is None:
+        return f'{version}', date_modification
+    if date_modification is None or depassee > date_modification:
+        date_modification = depassee
+    return f'{version}.{int(depassee.timestamp())}', date_modification
+
+
+@routes.route('/api/espace-usager/dashboard')
+def api_usager_dashboard():
+    # Lecture de la seule version : un 304 ne charge ni l'usager ni ses donnees
+    usager_id = session.get('usager_id')
+    etat = etat_tableau_usager(usager_id) if usager_id else None
+    if etat is None:
+        return jsonify({'erreur': 'Connexion usager requise'}), 401
+
+    version, date_modification = etat
+    jeton = etag('u', usager_id, version)
+    inchangee = reponse_304_si_inchangee(jeton, date_modification)
+    if inchangee is not None:
+        return inchangee
+
+    payload = donnees_tableau_usager(usager_id)
+    payload['version'] = version
+    return marquer(jsonify(payload), jeton, date_modification)
+
+
+@routes.route('/api/espace-usager/flux')
+@usager_required
+def flux_usager_dashboard():
+    """Flux SSE : pousse le tableau de bord de l'usager a chaque changement de sa version.
+
+    Chaque flux occupe un thread du worker : au-dela de ``SSE_FLUX_MAX`` flux
+    ouverts, la reponse 204 ferme l'EventSource et le navigateur se rabat sur
+    l'interrogation conditionnelle de ``/api/espace-usager/dashboard``.
+    """
+    places = current_app.extensions['flux_sse']
+    if not places.acquire(blocking=False):
+        return Response(status=204)
+
+    usager_id = g.usager_session.id
+    intervalle = current_app.config.get('SSE_INTERVALLE', 5)
+    duree_max = current_app.config.get('SSE_DUREE_MAX', 300)
+    derniere = request.headers.get('Last-Event-ID')
+
+    def evenements():
+        version_envoyee = derniere
+        debut = time.monotonic()
+        dernier_envoi = debut
+        # Le navigateur se reconnecte seul a la fin du flux (duree bornee)
+        yield f'retry: {int(intervalle * 1000)}\n\n'
+        while time.monotonic() - debut < duree_max:
+            etat = etat_tableau_usager(usager_id)
+            if etat is None:
+                break
+            version = etat[0]
+            if version != version_envoyee:
+                payload = donnees_tableau_usager(usager_id)
+                payload['version'] = version
+                version_envoyee = version
+                dernier_envoi = time.monotonic()
+                yield f'id: {version}\nevent: dashboard\ndata: {json.dumps(payload)}\n\n'
+            elif time.monotonic() - dernier_envoi >= 15:
+                dernier_envoi = time.monotonic()
+                yield ': ping\n\n'
+            # Rend la connexion au pool entre deux verifications
+            db.session.close()
+            time.sleep(intervalle)
+        db.session.close()
+
+    reponse = Response(
+        stream_with_context(evenements()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+    # Libere la place a la fermeture de la reponse, meme si le flux n'a jamais ete lu
+    reponse.call_on_close(places.release)
+    return reponse
 
 
 # ==================== DEMANDES USAGER ====================
 
-@app.route('/espace-usager/demande', methods=['POST'])
+@routes.route('/espace-usager/demande', methods=['POST'])
 @usager_required
 def creer_demande_usager():
     usager = g.usager_session
@@ -367,24 +557,17 @@ def creer_demande_usager():
 
 # ==================== GESTION DES OUVRAGES ====================
 
-@app.route('/admin/ouvrages')
+@routes.route('/admin/ouvrages')
 @login_required
 def liste_ouvrages():
     """Liste tous les ouvrages (admin)"""
     search = request.args.get('search', '').strip()
-    if search:
-        ouvrages = Ouvrage.query.filter(
-            Ouvrage.titre.contains(search)
-            | Ouvrage.auteur.contains(search)
-            | Ouvrage.isbn.contains(search)
-        ).all()
-    else:
-        ouvrages = Ouvrage.query.all()
+    ouvrages = page_catalogue(search, (Ouvrage.titre, Ouvrage.auteur, Ouvrage.isbn))
 
-    return render_template('ouvrages.html', ouvrages=ouvrages)
+    return render_template('ouvrages.html', ouvrages=ouvrages, disponibilites=disponibilites(ouvrages))
 
 
-@app.route('/admin/ouvrage/ajouter', methods=['GET', 'POST'])
+@routes.route('/admin/ouvrage/ajouter', methods=['GET', 'POST'])
 @login_required
 def ajouter_ouvrage():
     """Ajoute un nouvel ouvrage"""
@@ -420,7 +603,7 @@ def ajouter_ouvrage():
     return render_template('ajouter_ouvrage.html')
 
 
-@app.route('/admin/ouvrage/<int:id>')
+@routes.route('/admin/ouvrage/<int:id>')
 @login_required
 def detail_ouvrage(id):
     """Detail d'un ouvrage"""
@@ -431,24 +614,43 @@ def detail_ouvrage(id):
 
 # ==================== GESTION DES USAGERS ====================
 
-@app.route('/admin/usagers')
+@routes.route('/admin/usagers')
 @login_required
 def liste_usagers():
     """Liste tous les usagers"""
+    query = Usager.query
     search = request.args.get('search', '').strip()
     if search:
-        usagers = Usager.query.filter(
+        query = query.filter(
             (Usager.nom.contains(search))
             | (Usager.prenom.contains(search))
             | (Usager.email.contains(search))
-        ).all()
-    else:
-        usagers = Usager.query.all()
+        )
+
+    usagers = paginer(
+        query, [(Usager.nom, False), (Usager.id, False)], request.args.get('curseur'), taille_page()
+    )
+
+    emprunts_actifs = dict(
+        db.session.query(Emprunt.usager_id, func.count(Emprunt.id))
+        .filter(
+            Emprunt.usager_id.in_([u.id for u in usagers]),
+            Emprunt.statut.in_(STATUTS_EMPRUNT_ACTIFS),
+        )
+        .group_by(Emprunt.usager_id)
+        .all()
+    )
+    par_statut = dict(db.session.query(Usager.statut, func.count(Usager.id)).group_by(Usager.statut).all())
 
-    return render_template('usagers.html', usagers=usagers)
+    return render_template(
+        'usagers.html',
+        usagers=usagers,
+        emprunts_actifs=emprunts_actifs,
+        par_statut=par_statut,
+    )
 
 
-@app.route('/admin/usager/ajouter', methods=['GET', 'POST'])
+@routes.route('/admin/usager/ajouter', methods=['GET', 'POST'])
 @login_required
 def ajouter_usager():
     """Ajouter un nouvel usager"""
@@ -486,7 +688,7 @@ def ajouter_usager():
     return render_template('ajouter_usager.html')
 
 
-@app.route('/admin/usager/<int:id>/modifier', methods=['GET', 'POST'])
+@routes.route('/admin/usager/<int:id>/modifier', methods=['GET', 'POST'])
 @login_required
 def modifier_usager(id):
     """Modifier un usager"""
@@ -510,7 +712,7 @@ def modifier_usager(id):
     return render_template('modifier_usager.html', usager=usager)
 
 
-@app.route('/admin/usager/<int:id>/supprimer', methods=['POST'])
+@routes.route('/admin/usager/<int:id>/supprimer', methods=['POST'])
 @login_required
 def supprimer_usager(id):
     """Supprimer un usager"""
@@ -519,16 +721,23 @@ def supprimer_usager(id):
 
     emprunts_actifs = Emprunt.query.filter(
         Emprunt.usager_id == id,
-        Emprunt.statut.in_(['en_cours', 'en_retard'])
+        Emprunt.statut.in_(STATUTS_EMPRUNT_ACTIFS)
     ).count()
     if emprunts_actifs > 0:
         flash('Impossible de supprimer un usager avec des emprunts actifs.', 'danger')
         return redirect(url_for('liste_usagers'))
 
     try:
+        verrouiller_ecriture()
+        # Les files ou l'usager attendait encore sont recompactees apres suppression
+        ouvrages_en_file = db.session.scalars(
+            select(Reservation.ouvrage_id).where(Reservation.usager_id == id, Reservation.statut == 'active')
+        ).all()
         DemandeUsager.query.filter_by(usager_id=id).delete(synchronize_session=False)
         Reservation.query.filter_by(usager_id=id).delete(synchronize_session=False)
         Emprunt.query.filter_by(usager_id=id).delete(synchronize_session=False)
+        for ouvrage_id in sorted(set(ouvrages_en_file)):
+            renumeroter_file(ouvrage_id)
 
         db.session.delete(usager)
         db.session.commit()
@@ -543,15 +752,84 @@ def supprimer_usager(id):
 
 # ==================== GESTION DES EMPRUNTS ====================
 
-@app.route('/admin/emprunts')
+@routes.route('/admin/emprunts')
 @login_required
 def liste_emprunts():
-    """Liste tous les emprunts"""
-    emprunts = Emprunt.query.order_by(Emprunt.date_emprunt.desc()).all()
+    """Liste tous les emprunts avec filtrage"""
+    # Usager, exemplaire et ouvrage de chaque ligne charges avec la page
+    query = Emprunt.query.options(
+        joinedload(Emprunt.usager), joinedload(Emprunt.exemplaire).joinedload(Exemplaire.ouvrage)
+    )
+
+    statut = request.args.get('statut', 'tous')
+    if statut == 'en_cours':
+        query = query.filter(Emprunt.statut.in_(STATUTS_EMPRUNT_ACTIFS))
+    elif statut == 'retourne':
+        query = query.filter(Emprunt.statut.in_(['retourne', 'retourn\u00e9']))
+    elif statut == 'en_retard':
+        query = query.filter(Emprunt.en_retard)
+
+    search = request.args.get('search', '').strip()
+    if search:
+        query = query.join(Usager).join(Exemplaire, Emprunt.exemplaire_id == Exemplaire.id).join(Ouvrage).filter(
+            (Ouvrage.titre.ilike(f'%{search}%'))
+            | (Ouvrage.isbn.ilike(f'%{search}%'))
+            | (Usager.nom.ilike(f'%{search}%'))
+            | (Usager.prenom.ilike(f'%{search}%'))
+            | (Usager.email.ilike(f'%{search}%'))
+        )
+
+    emprunts = paginer(
+        query,
+        [(Emprunt.date_emprunt, True), (Emprunt.id, True)],
+        request.args.get('curseur'),
+        taille_page(),
+    )
     return render_template('emprunts.html', emprunts=emprunts)
 
 
-@app.route('/admin/emprunt/nouveau', methods=['GET', 'POST'])
+@routes.route('/admin/emprunts/retards')
+@login_required
+def rapport_retards():
+    """Emprunts en retard, du plus ancien au plus recent, filtrables par usager ou categorie"""
+    query = (
+        db.session.query(Emprunt, Usager, Exemplaire, Ouvrage)
+        .join(Usager, Emprunt.usager_id == Usager.id)
+        .join(Exemplaire, Emprunt.exemplaire_id == Exemplaire.id)
+        .join(Ouvrage, Exemplaire.ouvrage_id == Ouvrage.id)
+        .filter(Emprunt.en_retard)
+    )
+
+    usager_id = request.args.get('usager_id', type=int)
+    if usager_id:
+        query = query.filter(Emprunt.usager_id == usager_id)
+    categorie = request.args.get('categorie', '').strip()
+    if categorie:
+        query = query.filter(Ouvrage.categorie == categorie)
+
+    # Date de retour prevue croissante = nombre de jours de retard decroissant
+    retards = paginer(
+        query,
+        [(Emprunt.date_retour_prevue, False), (Emprunt.id, False)],
+        request.args.get('curseur'),
+        taille_page(),
+    )
+    categories = [
+        c for (c,) in db.session.query(Ouvrage.categorie).filter(Ouvrage.categorie.isnot(None)).distinct()
+        .order_by(Ouvrage.categorie)
+    ]
+    usager_filtre = db.session.get(Usager, usager_id) if usager_id else None
+
+    return stream_template(
+        'retards.html',
+        retards=retards,
+        categories=categories,
+        categorie=categorie,
+        usager_filtre=usager_filtre,
+    )
+
+
+@routes.route('/admin/emprunt/nouveau', methods=['GET', 'POST'])
 @login_required
 def nouvel_emprunt():
     """Nouvel emprunt"""
@@ -569,7 +847,9 @@ def nouvel_emprunt():
             flash(f'Usager {usager.prenom} {usager.nom} non actif.', 'danger')
             return redirect(url_for('nouvel_emprunt'))
 
-        emprunts_actifs = Emprunt.query.filter_by(usager_id=usager_id, statut='en_cours').count()
+        emprunts_actifs = Emprunt.query.filter(
+            Emprunt.usager_id == usager_id, Emprunt.statut.in_(STATUTS_EMPRUNT_ACTIFS)
+        ).count()
         if emprunts_actifs >= 5:
             flash(f'Usager {usager.prenom} {usager.nom} a deja {emprunts_actifs} emprunts en cours.', 'danger')
             return redirect(url_for('nouvel_emprunt'))
@@ -583,21 +863,17 @@ def nouvel_emprunt():
             flash(f'Ouvrage "{ouvrage.titre}" non disponible.', 'danger')
             return redirect(url_for('nouvel_emprunt'))
 
-        exemplaire = next((e for e in ouvrage.exemplaires if e.est_disponible()), None)
-        if not exemplaire:
-            flash('Aucun exemplaire disponible.', 'danger')
-            return redirect(url_for('nouvel_emprunt'))
-
-        emprunt = Emprunt(usager_id=usager_id, exemplaire_id=exemplaire.id)
-
+        date_retour = None
         if request.form.get('date_retour'):
             try:
                 date_retour = datetime.strptime(request.form['date_retour'], '%Y-%m-%d')
-                emprunt.date_retour_prevue = date_retour
             except ValueError:
                 pass
 
-        db.session.add(emprunt)
+        if allouer_exemplaire(usager.id, ouvrage.id, date_retour_prevue=date_retour) is None:
+            db.session.rollback()
+            flash('Aucun exemplaire disponible.', 'danger')
+            return redirect(url_for('nouvel_emprunt'))
         db.session.commit()
 
         flash(f'Emprunt enregistre pour {usager.prenom} {usager.nom}.', 'success')
@@ -606,30 +882,37 @@ def nouvel_emprunt():
     usagers = Usager.query.filter_by(statut='actif').order_by(Usager.nom).all()
     ouvrages = Ouvrage.query.order_by(Ouvrage.titre).all()
 
-    return render_template('nouvel_emprunt.html', usagers=usagers, ouvrages=ouvrages, now=datetime.now())
+    return render_template(
+        'nouvel_emprunt.html',
+        usagers=usagers,
+        ouvrages=ouvrages,
+        disponibilites=disponibilites(ouvrages),
+        now=datetime.now(),
+    )
 
 
-@app.route('/admin/emprunt/retour/<int:id>')
+@routes.route('/admin/emprunt/retour/<int:id>')
 @login_required
 def retourner_emprunt(id):
     """Retour d'un emprunt"""
 
     emprunt = Emprunt.query.get_or_404(id)
-    emprunt.date_retour_reelle = datetime.utcnow()
-    emprunt.statut = 'retourne'
+    if not enregistrer_retour(emprunt):
+        flash(f'Emprunt #{id} deja retourne.', 'warning')
+        return redirect(url_for('liste_emprunts'))
     db.session.commit()
 
     flash(f'Emprunt #{id} retourne avec succes.', 'success')
     return redirect(url_for('liste_emprunts'))
 
 
-@app.route('/admin/emprunt/prolonger/<int:id>')
+@routes.route('/admin/emprunt/prolonger/<int:id>')
 @login_required
 def prolonger_emprunt(id):
     """Prolonger un emprunt"""
     emprunt = Emprunt.query.get_or_404(id)
 
-    if emprunt.statut != 'en_cours':
+    if emprunt.statut not in STATUTS_EMPRUNT_ACTIFS:
         flash('Impossible de prolonger un emprunt deja retourne.', 'danger')
         return redirect(url_for('liste_emprunts'))
 
@@ -639,6 +922,9 @@ def prolonger_emprunt(id):
 
     emprunt.date_retour_prevue += timedelta(days=7)
     emprunt.prolongations += 1
+    # Echeance repassee dans le futur : l'emprunt n'est plus en retard
+    if emprunt.statut == 'en_retard' and emprunt.date_retour_prevue > datetime.utcnow():
+        emprunt.statut = 'en_cours'
     db.session.commit()
 
     flash(f'Emprunt #{id} prolonge de 7 jours.', 'success')
@@ -647,11 +933,11 @@ def prolonger_emprunt(id):
 
 # ==================== GESTION DES RESERVATIONS ====================
 
-@app.route('/admin/reservations')
+@routes.route('/admin/reservations')
 @login_required
 def liste_reservations():
     """Liste toutes les reservations avec filtrage"""
-    query = Reservation.query
+    query = Reservation.query.options(joinedload(Reservation.usager), joinedload(Reservation.ouvrage))
 
     statut = request.args.get('statut', 'active')
     if statut != 'toutes':
@@ -666,11 +952,23 @@ def liste_reservations():
             | (Usager.prenom.ilike(f'%{search}%'))
         )
 
-    reservations = query.all()
-    return render_template('reservations.html', reservations=reservations, now=datetime.now())
+    reservations = paginer(
+        query,
+        [(Reservation.date_reservation, True), (Reservation.id, True)],
+        request.args.get('curseur'),
+        taille_page(),
+    )
+    par_statut = dict(
+        db.session.query(Reservation.statut, func.count(Reservation.id)).group_by(Reservation.statut).all()
+    )
+    return render_template(
+        'reservations.html',
+        reservations=reservations,
+        par_statut=par_statut,
+    )
 
 
-@app.route('/admin/ouvrage/<int:id>/reserver', methods=['GET', 'POST'])
+@routes.route('/admin/ouvrage/<int:id>/reserver', methods=['GET', 'POST'])
 @login_required
 def reserver_ouvrage(id):
     """Formulaire et action pour creer une reservation pour un ouvrage (admin)"""
@@ -687,15 +985,11 @@ def reserver_ouvrage(id):
             flash('Usager non trouve.', 'danger')
             return redirect(url_for('reserver_ouvrage', id=id))
 
-        existante = Reservation.query.filter_by(usager_id=usager_id, ouvrage_id=id, statut='active').first()
-        if existante:
+        reservation, _ = mettre_en_file(usager.id, id)
+        if reservation is None:
+            db.session.rollback()
             flash('Cet usager a deja une reservation active pour cet ouvrage.', 'warning')
             return redirect(url_for('liste_reservations'))
-
-        priorite = Reservation.query.filter_by(ouvrage_id=id, statut='active').count() + 1
-        reservation = Reservation(usager_id=usager_id, ouvrage_id=id, priorite=priorite)
-
-        db.session.add(reservation)
         db.session.commit()
 
         flash('Reservation creee avec succes.', 'success')
@@ -705,7 +999,7 @@ def reserver_ouvrage(id):
     return render_template('reserver_ouvrage.html', ouvrage=ouvrage, usagers=usagers)
 
 
-@app.route('/admin/reservation/nouveau', methods=['GET', 'POST'])
+@routes.route('/admin/reservation/nouveau', methods=['GET', 'POST'])
 @login_required
 def nouvelle_reservation():
     """Formulaire generique pour creer une reservation (choix usager + ouvrage)"""
@@ -723,14 +1017,11 @@ def nouvelle_reservation():
             flash('Usager ou ouvrage non trouve.', 'danger')
             return redirect(url_for('nouvelle_reservation'))
 
-        existante = Reservation.query.filter_by(usager_id=usager_id, ouvrage_id=ouvrage_id, statut='active').first()
-        if existante:
-            flash('Reservation active deja existante pour cet usager et cet ouvrage.', 'warning')
+        reservation, message = mettre_en_file(usager.id, ouvrage.id)
+        if reservation is None:
+            db.session.rollback()
+            flash(f'{message}.', 'warning')
             return redirect(url_for('liste_reservations'))
-
-        priorite = Reservation.query.filter_by(ouvrage_id=ouvrage_id, statut='active').count() + 1
-        reservation = Reservation(usager_id=usager_id, ouvrage_id=ouvrage_id, priorite=priorite)
-        db.session.add(reservation)
         db.session.commit()
 
         flash('Reservation creee avec succes.', 'success')
@@ -738,26 +1029,35 @@ def nouvelle_reservation():
 
     usagers = Usager.query.order_by(Usager.nom).all()
     ouvrages = Ouvrage.query.order_by(Ouvrage.titre).all()
-    return render_template('nouvelle_reservation.html', usagers=usagers, ouvrages=ouvrages)
+    return render_template(
+        'nouvelle_reservation.html',
+        usagers=usagers,
+        ouvrages=ouvrages,
+        disponibilites=disponibilites(ouvrages),
+    )
 
 
-@app.route('/admin/reservation/honorer/<int:id>')
+@routes.route('/admin/reservation/honorer/<int:id>')
 @login_required
 def honorer_reservation(id):
     """Marque une reservation comme honoree"""
     reservation = Reservation.query.get_or_404(id)
-    reservation.statut = 'honoree'
+    if not retirer_de_file(reservation, 'honoree'):
+        flash('Cette reservation n est plus active.', 'warning')
+        return redirect(url_for('liste_reservations'))
     db.session.commit()
     flash('Reservation marquee comme honoree.', 'success')
     return redirect(url_for('liste_reservations'))
 
 
-@app.route('/admin/reservation/annuler/<int:id>')
+@routes.route('/admin/reservation/annuler/<int:id>')
 @login_required
 def annuler_reservation(id):
     """Annule une reservation"""
     reservation = Reservation.query.get_or_404(id)
-    reservation.statut = 'annulee'
+    if not retirer_de_file(reservation, 'annulee'):
+        flash('Cette reservation n est plus active.', 'warning')
+        return redirect(url_for('liste_reservations'))
     db.session.commit()
     flash('Reservation annulee.', 'info')
     return redirect(url_for('liste_reservations'))
@@ -765,108 +1065,236 @@ def annuler_reservation(id):
 
 # ==================== DEMANDES COTE ADMIN ====================
 
-@app.route('/admin/demandes')
+@routes.route('/admin/demandes')
 @login_required
 def admin_demandes():
     statut = request.args.get('statut', 'en_attente')
-    query = DemandeUsager.query.order_by(DemandeUsager.date_creation.desc())
+    query = DemandeUsager.query.options(joinedload(DemandeUsager.usager), joinedload(DemandeUsager.ouvrage))
     if statut != 'toutes':
         query = query.filter_by(statut=statut)
 
-    demandes = query.all()
+    demandes = paginer(
+        query,
+        [(DemandeUsager.date_creation, True), (DemandeUsager.id, True)],
+        request.args.get('curseur'),
+        taille_page(),
+    )
     return render_template('admin_demandes.html', demandes=demandes, statut=statut)
 
 
-@app.route('/admin/demande/<int:id>/accepter', methods=['POST'])
+@routes.route('/admin/demande/<int:id>/accepter', methods=['POST'])
 @login_required
 def accepter_demande(id):
-    demande = DemandeUsager.query.get_or_404(id)
-    commentaire_admin = request.form.get('commentaire_admin', '').strip()
+    demande = verrouiller_demande(id)
+    if demande is None:
+        DemandeUsager.query.get_or_404(id)
+        flash('Cette demande est deja traitee ou en cours de traitement.', 'warning')
+        return redirect(url_for('admin_demandes'))
 
-    if demande.statut != 'en_attente':
-        flash('Cette demande est deja traitee.', 'warning')
+    commentaire_admin = request.form.get('commentaire_admin', '').strip()
+    succes, message = accepter_demande_en_attente(demande, current_user.id, commentaire_admin)
+    if not succes:
+        db.session.rollback()
+        flash(f'{message}.', 'danger')
         return redirect(url_for('admin_demandes'))
 
-    usager = demande.usager
-    ouvrage = demande.ouvrage
+    db.session.commit()
+    flash(f'{message}.', 'success')
+    return redirect(url_for('admin_demandes'))
 
-    if demande.type_demande == 'emprunt':
-        peut, message = usager.peut_emprunter()
-        if not peut:
-            flash(f'Demande refusee automatiquement: {message}.', 'danger')
-            return redirect(url_for('admin_demandes'))
 
-        if not ouvrage.est_disponible():
-            flash('Impossible d accepter: ouvrage non disponible.', 'danger')
-            return redirect(url_for('admin_demandes'))
+@routes.route('/admin/demande/<int:id>/refuser', methods=['POST'])
+@login_required
+def refuser_demande(id):
+    demande = verrouiller_demande(id)
+    if demande is None:
+        DemandeUsager.query.get_or_404(id)
+        flash('Cette demande est deja traitee ou en cours de traitement.', 'warning')
+        return redirect(url_for('admin_demandes'))
 
-        exemplaire = next((e for e in ouvrage.exemplaires if e.est_disponible()), None)
-        if not exemplaire:
-            flash('Aucun exemplaire disponible.', 'danger')
-            return redirect(url_for('admin_demandes'))
+    commentaire_admin = request.form.get('commentaire_admin', '').strip()
+    succes, message = refuser_demande_en_attente(demande, current_user.id, commentaire_admin)
+    if not succes:
+        db.session.rollback()
+        flash(f'{message}.', 'warning')
+        return redirect(url_for('admin_demandes'))
 
-        db.session.add(Emprunt(usager_id=usager.id, exemplaire_id=exemplaire.id))
+    db.session.commit()
+    flash(f'{message}.', 'info')
+    return redirect(url_for('admin_demandes'))
 
-    elif demande.type_demande == 'reservation':
-        deja_active = Reservation.query.filter_by(
-            usager_id=usager.id,
-            ouvrage_id=ouvrage.id,
-            statut='active',
-        ).first()
-        if deja_active:
-            flash('Reservation deja active pour cet usager.', 'warning')
-            return redirect(url_for('admin_demandes'))
 
-        priorite = Reservation.query.filter_by(ouvrage_id=ouvrage.id, statut='active').count() + 1
-        db.session.add(Reservation(usager_id=usager.id, ouvrage_id=ouvrage.id, priorite=priorite))
+# ==================== EXPORTS ====================
 
-    demande.statut = 'acceptee'
-    demande.commentaire_admin = commentaire_admin
-    demande.date_traitement = datetime.utcnow()
-    demande.bibliothecaire_id = current_user.id
+@routes.route('/admin/export/<nom>.<format>')
+@login_required
+def exporter_donnees(nom, format):
+    """Export en flux : ?debut=AAAA-MM-JJ&fin=AAAA-MM-JJ&statut=a,b (filtres optionnels)"""
+    if nom not in EXPORTS or format not in FORMATS_EXPORT:
+        abort(404)
+    try:
+        debut = lire_date(request.args.get('debut'))
+        fin = lire_date(request.args.get('fin'))
+    except ValueError:
+        abort(400)
+    statuts = [s for valeur in request.args.getlist('statut') for s in valeur.split(',') if s]
+
+    morceaux = exporter(nom, format, debut, fin, statuts)
+    nom_fichier = f"{nom}_{datetime.now().strftime('%Y%m%d_%H%M')}.{format}"
+    return Response(
+        stream_with_context(morceaux),
+        content_type=FORMATS_EXPORT[format],
+        headers={
+            'Content-Disposition': f'attachment; filename="{nom_fichier}"',
+            'Cache-Control': 'no-store',
+            'X-Accel-Buffering': 'no',
+        },
+    )
 
-    db.session.commit()
-    flash('Demande acceptee et traitee.', 'success')
-    return redirect(url_for('admin_demandes'))
 
+# ==================== API ====================
 
-@app.route('/admin/demande/<int:id>/refuser', methods=['POST'])
+@routes.route('/api/admin/fragments')
 @login_required
-def refuser_demande(id):
-    demande = DemandeUsager.query.get_or_404(id)
-    commentaire_admin = request.form.get('commentaire_admin', '').strip()
+def api_statistiques_fragments():
+    """Succes / echecs du cache des fragments d'ouvrages de ce worker"""
+    return jsonify(statistiques_fragments())
 
-    if demande.statut != 'en_attente':
-        flash('Cette demande est deja traitee.', 'warning')
-        return redirect(url_for('admin_demandes'))
 
-    demande.statut = 'refusee'
-    demande.commentaire_admin = commentaire_admin
-    demande.date_traitement = datetime.utcnow()
-    demande.bibliothecaire_id = current_user.id
+@routes.route('/admin/diagnostics')
+@login_required
+def diagnostics():
+    """Requetes SQL par endpoint et repetitions (N+1) detectees dans ce worker"""
+    stats = statistiques_sql()
+    return render_template(
+        'diagnostics.html',
+        endpoints=stats.endpoints_tries(),
+        alertes=list(stats.alertes),
+        depuis=stats.depuis,
+        repetitions_max=current_app.config.get('SQL_REPETITIONS_MAX'),
+        pid=os.getpid(),
+    )
 
-    db.session.commit()
-    flash('Demande refusee.', 'info')
-    return redirect(url_for('admin_demandes'))
 
+@routes.route('/admin/diagnostics/vider', methods=['POST'])
+@login_required
+def vider_diagnostics():
+    statistiques_sql().vider()
+    flash('Compteurs remis a zero.', 'success')
+    return redirect(url_for('diagnostics'))
+
+
+@routes.route('/metrics')
+def metriques():
+    """Metriques de tous les workers au format texte de Prometheus"""
+    jeton = current_app.config.get('METRIQUES_JETON')
+    if jeton and not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {jeton}'):
+        abort(401)
+    return Response(
+        exposer_metriques(),
+        mimetype='text/plain; version=0.0.4',
+        headers={'Cache-Control': 'no-store'},
+    )
 
-# ==================== API ====================
 
-@app.route('/api/ouvrage/<int:id>/disponibilite')
+@routes.route('/api/ouvrage/<int:id>/disponibilite')
 def disponibilite_ouvrage(id):
     """API pour verifier la disponibilite d'un ouvrage"""
-    ouvrage = Ouvrage.query.get_or_404(id)
+    version, date_modification = version_ouvrage(id)
+    jeton = etag('o', id, version)
+    inchangee = reponse_304_si_inchangee(jeton, date_modification)
+    if inchangee is not None:
+        return inchangee
+
+    return marquer(jsonify(disponibilites_par_ids([id])[id]), jeton, date_modification)
+
+
+@routes.route('/api/ouvrages/disponibilites')
+def disponibilites_ouvrages():
+    """API groupee : disponibilite de plusieurs ouvrages (?ids=1,2,3) en une requete"""
+    maximum = current_app.config.get('DISPONIBILITES_MAX_IDS', 200)
+    try:
+        ids = [int(i) for i in request.args.get('ids', '').split(',') if i.strip()]
+    except ValueError:
+        return jsonify({'erreur': 'ids doit etre une liste d entiers separes par des virgules'}), 400
+    if len(ids) > maximum:
+        return jsonify({'erreur': f'{maximum} ouvrages au plus par appel'}), 400
+
+    resultat = disponibilites_par_ids(ids)
     return jsonify(
         {
-            'disponible': ouvrage.est_disponible(),
-            'exemplaires_disponibles': ouvrage.exemplaires_disponibles(),
-            'total_exemplaires': ouvrage.nombre_exemplaires,
+            'disponibilites': {str(i): d for i, d in resultat.items()},
+            'inconnus': sorted(set(ids) - set(resultat)),
+        }
+    )
+
+
+@routes.route('/api/catalogue')
+def api_catalogue():
+    """API paginee du catalogue (memes parametres que /catalogue)"""
+    search = request.args.get('search', '').strip()
+    ouvrages = page_catalogue(search)
+    dispo = disponibilites(ouvrages)
+    return jsonify(
+        {
+            'ouvrages': [
+                {
+                    'id': o.id,
+                    'titre': o.titre,
+                    'auteur': o.auteur,
+                    'isbn': o.isbn,
+                    'categorie': o.categorie,
+                    'exemplaires_disponibles': dispo[o.id],
+                    'total_exemplaires': o.nombre_exemplaires,
+                }
+                for o in ouvrages
+            ],
+            'pagination': ouvrages.meta(),
         }
     )
 
 
 # ==================== INITIALISATION ====================
 
+def create_app(config=None):
+    """Fabrique de l'application.
+
+    ``config`` complete ``Config`` : classe ou objet, nom de profil de
+    ``PROFILS``, chemin d'import (``config.Production``) ou dictionnaire ;
+    par defaut le profil ``BIBLIOTHEQUE_PROFIL``. Aucune connexion n'est
+    ouverte ici : l'application peut etre prechargee (``gunicorn --preload``)
+    puis partagee par les workers, qui ouvrent les leurs dans ``init_processus``.
+    """
+    app = Flask(__name__)
+    app.config.from_object(Config)
+    config = config if config is not None else os.environ.get('BIBLIOTHEQUE_PROFIL')
+    if isinstance(config, str):
+        config = PROFILS.get(config, config)
+    if isinstance(config, dict):
+        app.config.from_mapping(config)
+    elif config is not None:
+        app.config.from_object(config)
+    app.extensions['processus'] = {'parent': os.getpid(), 'pid': None}
+    app.extensions['schema'] = {'attendue': None, 'base': None, 'a_jour': False}
+    app.extensions['flux_sse'] = threading.BoundedSemaphore(app.config['SSE_FLUX_MAX'])
+
+    init_app(app)
+    # Le schema est migre au deploiement (migrer_base.py) ; sous la commande flask, exposer "flask db"
+    if os.environ.get('FLASK_RUN_FROM_CLI') == 'true':
+        init_migrations(app)
+    init_maintenance(app)
+    init_securite(app)
+    init_fragments(app)
+    init_diagnostics(app)
+    init_metriques(app)
+    login_manager.init_app(app)
+    app.add_template_global(url_curseur)
+    return routes.installer(app)
+
+
+app = create_app()
+
+
 def create_default_admin():
     with app.app_context():
         admin = Bibliothecaire.query.filter_by(login='admin').first()
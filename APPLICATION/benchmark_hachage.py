@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Script de mesure du coût du hachage des mots de passe
+Exécutez: python benchmark_hachage.py [--methodes pbkdf2:sha256:600000 scrypt:32768:8:1] [--connexions 40]
+
+1. Durée d'un hachage pour chaque méthode : à comparer au budget d'une
+   connexion (viser 100 à 300 ms au plus sur le serveur de production).
+2. Rafale de connexions simultanées pendant qu'un thread sert des requêtes
+   courtes : hachage dans le thread de la requête, puis dans le pool borné
+   (HACHAGE_THREADS, HACHAGE_FILE_MAX). On relève les connexions servies,
+   refusées (503) et la latence des requêtes courtes.
+"""
+
+import argparse
+import statistics
+import threading
+import time
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from app import app
+from securite import HachageSature, PoolHachage, methode_courante
+
+MOT_DE_PASSE = 'correct horse battery staple'
+
+
+def duree_hachage(methode, repetitions=5):
+    """Durée médiane (secondes) d'un hachage avec ``methode``"""
+    durees = []
+    for _ in range(repetitions):
+        debut = time.perf_counter()
+        generate_password_hash(MOT_DE_PASSE, methode)
+        durees.append(time.perf_counter() - debut)
+    return statistics.median(durees)
+
+
+def _rafale(verifier, connexions):
+    """``connexions`` threads appellent ``verifier`` pendant qu'un thread mesure des requêtes courtes"""
+    compteurs = {'servies': 0, 'refusees': 0}
+    latences = []
+    verrou = threading.Lock()
+    fini = threading.Event()
+
+    def connexion():
+        try:
+            verifier()
+            cle = 'servies'
+        except HachageSature:
+            cle = 'refusees'
+        with verrou:
+            compteurs[cle] += 1
+
+    def requete_courte():
+        while not fini.is_set():
+            debut = time.perf_counter()
+            sum(i * i for i in range(20000))
+            latences.append(time.perf_counter() - debut)
+            time.sleep(0.005)
+
+    mesure = threading.Thread(target=requete_courte)
+    mesure.start()
+    debut = time.perf_counter()
+    threads = [threading.Thread(target=connexion) for _ in range(connexions)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    duree = time.perf_counter() - debut
+    fini.set()
+    mesure.join()
+
+    latences.sort()
+    compteurs['duree'] = duree
+    compteurs['latence_p95'] = latences[int(len(latences) * 0.95)] if latences else 0.0
+    return compteurs
+
+
+def benchmark(methodes=None, connexions=40):
+    """Mesure chaque méthode puis une rafale de connexions avec et sans pool"""
+
+    with app.app_context():
+        configuree = methode_courante()
+        methodes = methodes or [configuree]
+        threads = app.config.get('HACHAGE_THREADS', 2)
+        file_max = app.config.get('HACHAGE_FILE_MAX', 16)
+
+        print("=" * 60)
+        print("🔐 COÛT D'UN HACHAGE")
+        print("=" * 60)
+        for methode in methodes:
+            marque = ' (configurée)' if methode == configuree else ''
+            print(f"  ⏱️  {methode:<28} {duree_hachage(methode) * 1000:8.1f} ms{marque}")
+
+        hash_ = generate_password_hash(MOT_DE_PASSE, configuree)
+        print("=" * 60)
+        print(f"🌊 RAFALE DE {connexions} CONNEXIONS ({configuree})")
+        print("=" * 60)
+
+        resultats = {'direct': _rafale(lambda: check_password_hash(hash_, MOT_DE_PASSE), connexions)}
+        pool = PoolHachage(threads, file_max)
+        try:
+            resultats['pool'] = _rafale(lambda: pool.executer(check_password_hash, hash_, MOT_DE_PASSE), connexions)
+        finally:
+            pool.arreter()
+
+        for nom, r in (('thread de la requête', resultats['direct']),
+                       (f'pool {threads} threads / file {file_max}', resultats['pool'])):
+            print(f"  📊 {nom:<28} {r['servies']:4d} servies, {r['refusees']:4d} refusées en {r['duree']:.2f} s, "
+                  f"requête courte p95 {r['latence_p95'] * 1000:.1f} ms")
+        print("=" * 60)
+        return resultats
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--methodes', nargs='+', help='méthodes werkzeug à comparer (configurée par défaut)')
+    parser.add_argument('--connexions', type=int, default=40, help='connexions simultanées de la rafale')
+    args = parser.parse_args()
+
+    benchmark(args.methodes, args.connexions)
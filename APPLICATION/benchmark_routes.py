@@ -0,0 +1,443 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Script de mesure de toutes les routes de l'application (client de test Flask)
+Exécutez: python benchmark_routes.py [--repetitions 20] [--sortie mesures.json] [--comparer reference.json]
+
+Chaque scénario (au moins un par route de app.py) est joué --repetitions
+fois après --echauffement appels : latence p50 / p95 / p99, requêtes SQL
+par appel et pic de mémoire Python d'un appel (tracemalloc, passe séparée
+pour ne pas fausser les latences). Sous SQLite, le banc travaille sur une
+copie temporaire de la base : les routes qui écrivent (retours, demandes,
+formulaires POST...) sont jouées chacune sur des lignes différentes, la
+base réelle n'est jamais modifiée. Ailleurs, seules les lectures sont jouées.
+
+Pour des mesures comparables d'une exécution à l'autre, générer la base
+avec generer_donnees.py (même échelle, même graine, même référence) puis
+enregistrer une référence avec --sortie et la comparer avec --comparer :
+code retour 1 si une route régresse au-delà de --seuil.
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import statistics
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from flask import url_for
+from sqlalchemy import event, func, select
+
+from app import app, create_app, init_processus
+from database import db
+from donnees_synthetiques import MOT_DE_PASSE
+from models import Bibliothecaire, DemandeUsager, Emprunt, Ouvrage, Reservation, Usager, STATUTS_EMPRUNT_ACTIFS
+
+LOGIN_BANC = 'banc'
+
+
+class Epuise(Exception):
+    """Plus de lignes disponibles pour un scénario qui en consomme une par appel."""
+
+
+class Echantillons:
+    """Identifiants tirés de la base : lignes représentatives et réserves pour les écritures."""
+
+    def __init__(self, taille_reserve):
+        premier = lambda requete: db.session.scalar(requete.limit(1))
+        liste = lambda requete: list(db.session.scalars(requete.limit(taille_reserve)))
+
+        self.ouvrage = premier(select(Ouvrage.id).order_by(Ouvrage.nombre_exemplaires.desc(), Ouvrage.id))
+        self.ouvrages = list(db.session.scalars(select(Ouvrage.id).order_by(Ouvrage.id).limit(50)))
+        # L'usager qui a le plus emprunte : le pire cas des pages usager
+        self.usager = premier(
+            select(Emprunt.usager_id).group_by(Emprunt.usager_id).order_by(func.count().desc(), Emprunt.usager_id)
+        ) or premier(select(Usager.id).order_by(Usager.id))
+        usager = db.session.get(Usager, self.usager) if self.usager else None
+        self.identite = {'email': usager.email, 'nom': usager.nom, 'prenom': usager.prenom} if usager else {}
+        self.bibliothecaire = premier(select(Bibliothecaire.id).order_by(Bibliothecaire.login != LOGIN_BANC))
+        self.debut_export = (datetime.utcnow() - timedelta(days=30)).strftime('%Y-%m-%d')
+
+        actifs = select(Emprunt.usager_id).where(Emprunt.statut.in_(STATUTS_EMPRUNT_ACTIFS))
+        # Usagers supprimés par le banc (un par appel d'un seul scénario, le quart de la réserve) :
+        # leurs réservations et demandes disparaissent avec eux, aucune autre réserve ne les contient
+        supprimes = list(db.session.scalars(
+            select(Usager.id).where(Usager.id.not_in(actifs)).order_by(Usager.id.desc()).limit(taille_reserve // 4)
+        ))
+        self._reserves = {
+            'emprunts_actifs': liste(
+                select(Emprunt.id).where(Emprunt.statut.in_(STATUTS_EMPRUNT_ACTIFS)).order_by(Emprunt.id)
+            ),
+            'reservations_actives': liste(
+                select(Reservation.id)
+                .where(Reservation.statut == 'active', Reservation.usager_id.not_in(supprimes))
+                .order_by(Reservation.id)
+            ),
+            'demandes_en_attente': liste(
+                select(DemandeUsager.id)
+                .where(DemandeUsager.statut == 'en_attente', DemandeUsager.usager_id.not_in(supprimes))
+                .order_by(DemandeUsager.id)
+            ),
+            'usagers_sans_pret': supprimes,
+            'usagers_emprunteurs': liste(
+                select(Usager.id)
+                .where(Usager.statut == 'actif', Usager.id.not_in(actifs), Usager.id.not_in(supprimes))
+                .order_by(Usager.id)
+            ),
+            'ouvrages_disponibles': liste(
+                select(Ouvrage.id).where(Ouvrage.copies_available > 0).order_by(Ouvrage.id.desc())
+            ),
+            'ouvrages': liste(select(Ouvrage.id).order_by(Ouvrage.id.desc())),
+        }
+
+    def prendre(self, reserve):
+        """Prochaine ligne inutilisée de la réserve ; deux scénarios ne partagent jamais une ligne."""
+        try:
+            return self._reserves[reserve].pop(0)
+        except IndexError:
+            raise Epuise(reserve) from None
+
+
+class Scenario:
+    """Un appel de route : endpoint, session, méthode, paramètres d'URL et formulaire."""
+
+    def __init__(self, nom, endpoint, profil='anonyme', methode='GET', params=None, formulaire=None, ecrit=False):
+        self.nom = nom
+        self.endpoint = endpoint
+        self.profil = profil
+        self.methode = methode
+        self.params = params or (lambda e, i: {})
+        self.formulaire = formulaire
+        self.ecrit = ecrit
+
+
+SCENARIOS = [
+    # Pages publiques et API
+    Scenario('accueil', 'index'),
+    Scenario('catalogue', 'catalogue'),
+    Scenario('catalogue_recherche', 'catalogue', params=lambda e, i: {'search': 'jardin'}),
+    Scenario('fiche_ouvrage', 'detail_ouvrage_public', params=lambda e, i: {'id': e.ouvrage}),
+    Scenario('api_catalogue', 'api_catalogue'),
+    Scenario('api_disponibilite', 'disponibilite_ouvrage', params=lambda e, i: {'id': e.ouvrage}),
+    Scenario('api_disponibilites', 'disponibilites_ouvrages',
+             params=lambda e, i: {'ids': ','.join(map(str, e.ouvrages))}),
+    Scenario('metriques', 'metriques'),
+    Scenario('connexion_admin_formulaire', 'login'),
+    Scenario('connexion_admin', 'login', methode='POST',
+             formulaire=lambda e, i: {'login': LOGIN_BANC, 'password': LOGIN_BANC}),
+    Scenario('connexion_usager_formulaire', 'usager_login'),
+    Scenario('connexion_usager', 'usager_login', methode='POST',
+             formulaire=lambda e, i: {'email': e.identite.get('email', ''), 'password': MOT_DE_PASSE}),
+    Scenario('inscription_formulaire', 'usager_register'),
+    Scenario('inscription', 'usager_register', methode='POST', ecrit=True, formulaire=lambda e, i: {
+        'nom': 'Banc', 'prenom': 'Inscrit', 'email': f'banc.inscrit.{i}@exemple.org', 'password': MOT_DE_PASSE,
+    }),
+    Scenario('mot_de_passe_oublie_formulaire', 'usager_forgot_password'),
+    Scenario('mot_de_passe_oublie', 'usager_forgot_password', methode='POST', ecrit=True,
+             formulaire=lambda e, i: dict(e.identite, new_password=MOT_DE_PASSE, confirm_password=MOT_DE_PASSE)),
+
+    # Espace usager
+    Scenario('tableau_usager', 'usager_dashboard', 'usager'),
+    Scenario('api_tableau_usager', 'api_usager_dashboard', 'usager'),
+    Scenario('flux_usager', 'flux_usager_dashboard', 'usager'),
+    Scenario('demande_usager', 'creer_demande_usager', 'usager', 'POST', ecrit=True,
+             formulaire=lambda e, i: {'ouvrage_id': e.prendre('ouvrages'), 'type_demande': 'emprunt'}),
+    Scenario('deconnexion_usager', 'usager_logout', 'usager'),
+
+    # Administration : listes et fiches
+    Scenario('tableau_admin', 'dashboard', 'admin'),
+    Scenario('liste_ouvrages', 'liste_ouvrages', 'admin'),
+    Scenario('detail_ouvrage', 'detail_ouvrage', 'admin', params=lambda e, i: {'id': e.ouvrage}),
+    Scenario('liste_usagers', 'liste_usagers', 'admin'),
+    Scenario('liste_emprunts', 'liste_emprunts', 'admin'),
+    Scenario('liste_emprunts_en_cours', 'liste_emprunts', 'admin', params=lambda e, i: {'statut': 'en_cours'}),
+    Scenario('rapport_retards', 'rapport_retards', 'admin'),
+    Scenario('liste_reservations', 'liste_reservations', 'admin'),
+    Scenario('demandes', 'admin_demandes', 'admin'),
+    Scenario('export_emprunts', 'exporter_donnees', 'admin',
+             params=lambda e, i: {'nom': 'emprunts', 'format': 'csv', 'debut': e.debut_export}),
+    Scenario('statistiques_fragments', 'api_statistiques_fragments', 'admin'),
+    Scenario('diagnostics', 'diagnostics', 'admin'),
+    Scenario('diagnostics_remis_a_zero', 'vider_diagnostics', 'admin', 'POST'),
+    Scenario('deconnexion_admin', 'logout', 'admin'),
+
+    # Administration : formulaires
+    Scenario('ajout_ouvrage_formulaire', 'ajouter_ouvrage', 'admin'),
+    Scenario('ajout_ouvrage', 'ajouter_ouvrage', 'admin', 'POST', ecrit=True, formulaire=lambda e, i: {
+        'titre': f'Banc {i}', 'auteur': 'Banc', 'isbn': f'BANC{i:08d}', 'nb_exemplaires': '2',
+    }),
+    Scenario('ajout_usager_formulaire', 'ajouter_usager', 'admin'),
+    Scenario('ajout_usager', 'ajouter_usager', 'admin', 'POST', ecrit=True, formulaire=lambda e, i: {
+        'nom': 'Banc', 'prenom': 'Ajoute', 'email': f'banc.ajoute.{i}@exemple.org',
+    }),
+    Scenario('modification_usager_formulaire', 'modifier_usager', 'admin', params=lambda e, i: {'id': e.usager}),
+    Scenario('modification_usager', 'modifier_usager', 'admin', 'POST', ecrit=True,
+             params=lambda e, i: {'id': e.usager},
+             formulaire=lambda e, i: dict(e.identite, statut='actif')),
+    Scenario('suppression_usager', 'supprimer_usager', 'admin', 'POST', ecrit=True,
+             params=lambda e, i: {'id': e.prendre('usagers_sans_pret')}, formulaire=lambda e, i: {}),
+    Scenario('emprunt_formulaire', 'nouvel_emprunt', 'admin'),
+    Scenario('emprunt', 'nouvel_emprunt', 'admin', 'POST', ecrit=True, formulaire=lambda e, i: {
+        'usager_id': e.prendre('usagers_emprunteurs'), 'ouvrage_id': e.prendre('ouvrages_disponibles'),
+    }),
+    Scenario('retour', 'retourner_emprunt', 'admin', ecrit=True,
+             params=lambda e, i: {'id': e.prendre('emprunts_actifs')}),
+    Scenario('prolongation', 'prolonger_emprunt', 'admin', ecrit=True,
+             params=lambda e, i: {'id': e.prendre('emprunts_actifs')}),
+    Scenario('reservation_formulaire', 'nouvelle_reservation', 'admin'),
+    Scenario('reservation', 'nouvelle_reservation', 'admin', 'POST', ecrit=True, formulaire=lambda e, i: {
+        'usager_id': e.prendre('usagers_emprunteurs'), 'ouvrage_id': e.ouvrage,
+    }),
+    Scenario('reservation_ouvrage_formulaire', 'reserver_ouvrage', 'admin', params=lambda e, i: {'id': e.ouvrage}),
+    Scenario('reservation_ouvrage', 'reserver_ouvrage', 'admin', 'POST', ecrit=True,
+             params=lambda e, i: {'id': e.ouvrage},
+             formulaire=lambda e, i: {'usager_id': e.prendre('usagers_emprunteurs')}),
+    Scenario('reservation_honoree', 'honorer_reservation', 'admin', ecrit=True,
+             params=lambda e, i: {'id': e.prendre('reservations_actives')}),
+    Scenario('reservation_annulee', 'annuler_reservation', 'admin', ecrit=True,
+             params=lambda e, i: {'id': e.prendre('reservations_actives')}),
+    Scenario('demande_acceptee', 'accepter_demande', 'admin', 'POST', ecrit=True,
+             params=lambda e, i: {'id': e.prendre('demandes_en_attente')}, formulaire=lambda e, i: {}),
+    Scenario('demande_refusee', 'refuser_demande', 'admin', 'POST', ecrit=True,
+             params=lambda e, i: {'id': e.prendre('demandes_en_attente')}, formulaire=lambda e, i: {}),
+]
+
+
+def _centile(valeurs, q):
+    valeurs = sorted(valeurs)
+    return valeurs[min(len(valeurs) - 1, int(q * len(valeurs)))]
+
+
+def _copier_base(dossier):
+    """Copie cohérente de la base courante (API de sauvegarde SQLite)"""
+    cible = os.path.join(dossier, 'banc.db')
+    with sqlite3.connect(db.engine.url.database) as origine, sqlite3.connect(cible) as copie:
+        origine.backup(copie)
+    return cible
+
+
+class Banc:
+    """Application dédiée au banc, compteur de requêtes SQL et clients authentifiés."""
+
+    def __init__(self, application, taille_reserve):
+        self.app = application
+        self.requetes = 0
+        with application.app_context():
+            if not db.session.scalar(select(Bibliothecaire.id).where(Bibliothecaire.login == LOGIN_BANC)):
+                bibliothecaire = Bibliothecaire(nom='Banc', prenom='Mesure', login=LOGIN_BANC)
+                bibliothecaire.set_password(LOGIN_BANC)
+                db.session.add(bibliothecaire)
+                db.session.commit()
+            self.echantillons = Echantillons(taille_reserve)
+            event.listen(db.engine, 'before_cursor_execute', self._compter)
+            self.urls = {}
+
+    def _compter(self, *args):
+        self.requetes += 1
+
+    def _session(self, client, profil):
+        with client.session_transaction() as session:
+            session.clear()
+            if profil == 'admin':
+                session['_user_id'] = str(self.echantillons.bibliothecaire)
+                session['_fresh'] = True
+            elif profil == 'usager':
+                session['usager_id'] = self.echantillons.usager
+
+    def appeler(self, client, scenario, i):
+        """Joue un appel ; retourne ``(statut, duree, requetes_sql, pic_memoire)``.
+
+        Le pic de mémoire (octets alloués pendant l'appel) n'est relevé que si
+        tracemalloc est actif.
+        """
+        e = self.echantillons
+        with self.app.test_request_context():
+            url = url_for(scenario.endpoint, **scenario.params(e, i))
+        donnees = scenario.formulaire(e, i) if scenario.formulaire else None
+        self.urls.setdefault(scenario.nom, url)
+        self._session(client, scenario.profil)
+
+        memoire = tracemalloc.is_tracing()
+        if memoire:
+            tracemalloc.reset_peak()
+            avant = tracemalloc.get_traced_memory()[0]
+        requetes = self.requetes
+        debut = time.perf_counter()
+        reponse = client.open(url, method=scenario.methode, data=donnees)
+        reponse.get_data()
+        duree = time.perf_counter() - debut
+        pic = tracemalloc.get_traced_memory()[1] - avant if memoire else None
+        reponse.close()
+        return reponse.status_code, duree, self.requetes - requetes, pic
+
+    def mesurer(self, scenario, repetitions, echauffement):
+        client = self.app.test_client()
+        rang = 0
+        statuts, durees, requetes = set(), [], []
+        try:
+            for _ in range(echauffement):
+                self.appeler(client, scenario, rang)
+                rang += 1
+            for _ in range(repetitions):
+                statut, duree, nombre, _ = self.appeler(client, scenario, rang)
+                rang += 1
+                statuts.add(statut)
+                durees.append(duree)
+                requetes.append(nombre)
+
+            # Pic de mémoire d'un appel, mesuré à part : tracemalloc ralentit tout
+            tracemalloc.start()
+            try:
+                memoire = self.appeler(client, scenario, rang)[3]
+            finally:
+                tracemalloc.stop()
+        except Epuise as reserve:
+            if not durees:
+                return {'endpoint': scenario.endpoint, 'mesures': 0, 'epuise': str(reserve)}
+            memoire = None
+
+        return {
+            'endpoint': scenario.endpoint,
+            'url': self.urls.get(scenario.nom),
+            'methode': scenario.methode,
+            'statuts': sorted(statuts),
+            'mesures': len(durees),
+            'p50_ms': round(_centile(durees, 0.50) * 1000, 2),
+            'p95_ms': round(_centile(durees, 0.95) * 1000, 2),
+            'p99_ms': round(_centile(durees, 0.99) * 1000, 2),
+            'moyenne_ms': round(statistics.fmean(durees) * 1000, 2),
+            'requetes_sql': statistics.median(requetes),
+            'requetes_sql_max': max(requetes),
+            'memoire_pic_kio': round(memoire / 1024, 1) if memoire is not None else None,
+        }
+
+
+def _volumes():
+    return {modele.__tablename__: db.session.scalar(select(func.count()).select_from(modele))
+            for modele in (Usager, Ouvrage, Emprunt, Reservation, DemandeUsager)}
+
+
+def comparer(mesures, reference, seuil):
+    """Affiche les écarts avec une référence ; retourne les routes en régression"""
+    regressions = []
+    print("=" * 60)
+    print(f"🔍 COMPARAISON (seuil {seuil:.0%})")
+    print("=" * 60)
+    for nom, r in mesures['routes'].items():
+        ancien = reference['routes'].get(nom)
+        if not ancien or not r['mesures'] or not ancien.get('mesures'):
+            continue
+        motifs = []
+        # Écart d'au moins 1 ms : en dessous, c'est du bruit de mesure
+        if r['p95_ms'] > ancien['p95_ms'] * (1 + seuil) and r['p95_ms'] - ancien['p95_ms'] >= 1:
+            motifs.append(f"p95 {ancien['p95_ms']} → {r['p95_ms']} ms")
+        if r['requetes_sql'] > ancien['requetes_sql']:
+            motifs.append(f"SQL {ancien['requetes_sql']} → {r['requetes_sql']}")
+        if r['memoire_pic_kio'] and ancien.get('memoire_pic_kio') \
+                and r['memoire_pic_kio'] > ancien['memoire_pic_kio'] * (1 + seuil) \
+                and r['memoire_pic_kio'] - ancien['memoire_pic_kio'] >= 64:
+            motifs.append(f"mémoire {ancien['memoire_pic_kio']} → {r['memoire_pic_kio']} Kio")
+        if motifs:
+            regressions.append(nom)
+            print(f"  ❌ {nom:<32} {', '.join(motifs)}")
+        elif r['p95_ms'] < ancien['p95_ms'] / (1 + seuil):
+            print(f"  🚀 {nom:<32} p95 {ancien['p95_ms']} → {r['p95_ms']} ms")
+    if reference.get('base') != mesures['base']:
+        print(f"  ⚠️  Volumes différents : {reference.get('base')} contre {mesures['base']}")
+    print(f"\n{'❌' if regressions else '✨'} {len(regressions)} route(s) en régression")
+    return regressions
+
+
+def benchmark(repetitions=20, echauffement=2, noms=None, sortie=None, reference=None, seuil=0.2):
+    """Mesure les scénarios ; retourne les mesures (dictionnaire sérialisable en JSON)"""
+
+    dossier = None
+    with app.app_context():
+        sqlite = db.engine.dialect.name == 'sqlite'
+        if sqlite:
+            dossier = tempfile.mkdtemp(prefix='banc_routes_')
+            application = create_app({
+                'SQLALCHEMY_DATABASE_URI': f'sqlite:///{_copier_base(dossier)}',
+                'MAINTENANCE_INTERVALLE': None,
+                'SSE_DUREE_MAX': 0,
+            })
+        else:
+            application = app
+
+    try:
+        init_processus(application)
+        banc = Banc(application, taille_reserve=4 * (repetitions + echauffement + 1))
+        scenarios = [s for s in SCENARIOS if not noms or s.nom in noms or s.endpoint in noms]
+        with application.app_context():
+            volumes = _volumes()
+
+        print("=" * 60)
+        print(f"⏱️  ROUTES ({repetitions} appels par scénario, volumes {volumes})")
+        print("=" * 60)
+        print(f"  {'scénario':<32} {'statut':>7} {'p50':>8} {'p95':>8} {'p99':>8} {'SQL':>5} {'Kio':>8}")
+
+        resultats = {}
+        for scenario in scenarios:
+            if scenario.ecrit and not sqlite:
+                resultats[scenario.nom] = {'endpoint': scenario.endpoint, 'mesures': 0, 'ignore': 'ecriture'}
+                continue
+            r = resultats[scenario.nom] = banc.mesurer(scenario, repetitions, echauffement)
+            if not r['mesures']:
+                print(f"  ⏭️  {scenario.nom:<30} aucune ligne disponible ({r['epuise']})")
+                continue
+            statut = '/'.join(map(str, r['statuts']))
+            memoire = f"{r['memoire_pic_kio']:8.0f}" if r['memoire_pic_kio'] is not None else f"{'-':>8}"
+            print(f"  {scenario.nom:<32} {statut:>7} {r['p50_ms']:8.1f} {r['p95_ms']:8.1f} "
+                  f"{r['p99_ms']:8.1f} {r['requetes_sql']:5.0f} {memoire}")
+
+        couvertes = {s.endpoint for s in SCENARIOS}
+        non_couvertes = sorted(
+            r.endpoint for r in application.url_map.iter_rules()
+            if r.endpoint != 'static' and r.endpoint not in couvertes
+        )
+        if non_couvertes:
+            print(f"  ⚠️  Routes sans scénario : {', '.join(non_couvertes)}")
+    finally:
+        if dossier:
+            with application.app_context():
+                db.engine.dispose()
+            shutil.rmtree(dossier, ignore_errors=True)
+
+    mesures = {
+        'date': datetime.utcnow().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'repetitions': repetitions,
+        'base': volumes,
+        'routes': resultats,
+    }
+    print("=" * 60)
+
+    if sortie:
+        with open(sortie, 'w', encoding='utf-8') as fichier:
+            json.dump(mesures, fichier, indent=2, ensure_ascii=False)
+        print(f"💾 Mesures enregistrées dans {sortie}")
+    if reference:
+        with open(reference, encoding='utf-8') as fichier:
+            mesures['regressions'] = comparer(mesures, json.load(fichier), seuil)
+        print("=" * 60)
+    return mesures
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repetitions', type=int, default=20, help='appels mesurés par scénario')
+    parser.add_argument('--echauffement', type=int, default=2, help='appels non mesurés avant la mesure')
+    parser.add_argument('--routes', nargs='+', help='scénarios ou endpoints à mesurer (tous par défaut)')
+    parser.add_argument('--sortie', help='fichier JSON où enregistrer les mesures')
+    parser.add_argument('--comparer', help='fichier JSON de référence')
+    parser.add_argument('--seuil', type=float, default=0.2, help='hausse tolérée avant régression (0.2 = 20 %%)')
+    args = parser.parse_args()
+
+    mesures = benchmark(args.repetitions, args.echauffement, args.routes, args.sortie, args.comparer, args.seuil)
+    raise SystemExit(1 if mesures.get('regressions') else 0)
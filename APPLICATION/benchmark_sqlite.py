@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Script de mesure du débit de lecture SQLite pendant des écritures concurrentes
+Exécutez: python benchmark_sqlite.py [--lecteurs 8] [--ecrivains 2] [--duree 10]
+
+Le banc travaille sur deux copies temporaires de la base : l'une avec les
+réglages par défaut (journal DELETE), l'autre avec le profil de production
+(WAL, busy_timeout, synchronous=NORMAL, cache, mmap). La base réelle n'est
+jamais modifiée.
+"""
+
+import argparse
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+
+from sqlalchemy import create_engine, func, select, update
+from sqlalchemy.exc import OperationalError
+
+from app import app
+from config import Config
+from database import db, installer_pragmas, options_moteur
+from models import Ouvrage
+
+
+def _copier_base(dossier, nom):
+    """Copie cohérente de la base courante (API de sauvegarde SQLite)"""
+    source = db.engine.url.database
+    cible = os.path.join(dossier, nom)
+    with sqlite3.connect(source) as origine, sqlite3.connect(cible) as copie:
+        origine.backup(copie)
+    return cible
+
+
+def _moteur(chemin, profil):
+    uri = f'sqlite:///{chemin}'
+    if not profil:
+        moteur = create_engine(uri)
+        with moteur.connect() as connexion:
+            connexion.exec_driver_sql('PRAGMA journal_mode = DELETE')
+        return moteur
+
+    config = {key: getattr(Config, key) for key in dir(Config) if key.isupper()}
+    config['SQLALCHEMY_DATABASE_URI'] = uri
+    moteur = create_engine(uri, **options_moteur(config))
+    installer_pragmas(moteur, config)
+    return moteur
+
+
+def _mesurer(moteur, lecteurs, ecrivains, duree):
+    with moteur.connect() as connexion:
+        ids = [i for (i,) in connexion.execute(select(Ouvrage.id).limit(200))]
+    compteurs = {'lectures': 0, 'ecritures': 0, 'verrous': 0, 'attente_max': 0.0}
+    verrou = threading.Lock()
+    fin = time.monotonic() + duree
+
+    def ajouter(cle, valeur=1):
+        with verrou:
+            compteurs[cle] += valeur
+
+    def lire():
+        page = select(Ouvrage.id, Ouvrage.titre, Ouvrage.copies_available).order_by(Ouvrage.titre, Ouvrage.id).limit(50)
+        dispo = select(func.sum(Ouvrage.copies_available)).where(Ouvrage.id.in_(ids))
+        while time.monotonic() < fin:
+            debut = time.monotonic()
+            try:
+                with moteur.connect() as connexion:
+                    connexion.execute(page).all()
+                    connexion.execute(dispo).scalar()
+                ajouter('lectures')
+            except OperationalError:
+                ajouter('verrous')
+            with verrou:
+                compteurs['attente_max'] = max(compteurs['attente_max'], time.monotonic() - debut)
+
+    def ecrire():
+        n = 0
+        while time.monotonic() < fin:
+            ouvrage_id = ids[n % len(ids)]
+            n += 1
+            try:
+                with moteur.begin() as connexion:
+                    connexion.execute(
+                        update(Ouvrage).where(Ouvrage.id == ouvrage_id)
+                        .values(copies_available=Ouvrage.copies_available - 1)
+                    )
+                    # Transaction d'ecriture volontairement longue (emprunt + compteurs)
+                    time.sleep(0.005)
+                    connexion.execute(
+                        update(Ouvrage).where(Ouvrage.id == ouvrage_id)
+                        .values(copies_available=Ouvrage.copies_available + 1)
+                    )
+                ajouter('ecritures')
+            except OperationalError:
+                ajouter('verrous')
+
+    threads = [threading.Thread(target=lire) for _ in range(lecteurs)]
+    threads += [threading.Thread(target=ecrire) for _ in range(ecrivains)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    moteur.dispose()
+    return compteurs
+
+
+def benchmark(lecteurs=8, ecrivains=2, duree=10):
+    """Compare le profil par défaut et le profil de production"""
+
+    with app.app_context():
+        if db.engine.dialect.name != 'sqlite':
+            print("⏭️  Banc prévu pour SQLite uniquement")
+            return None
+
+        print("=" * 60)
+        print(f"⏱️  LECTURES PENDANT ÉCRITURES ({lecteurs} lecteurs, {ecrivains} écrivains, {duree}s)")
+        print("=" * 60)
+
+        resultats = {}
+        dossier = tempfile.mkdtemp(prefix='bench_bibliotheque_')
+        try:
+            for nom, profil in (('défaut', False), ('production', True)):
+                moteur = _moteur(_copier_base(dossier, f'{"prod" if profil else "defaut"}.db'), profil)
+                r = _mesurer(moteur, lecteurs, ecrivains, duree)
+                resultats[nom] = r
+                print(f"  📊 Profil {nom:<10} : {r['lectures'] / duree:8.0f} lectures/s, "
+                      f"{r['ecritures'] / duree:6.0f} écritures/s, "
+                      f"{r['verrous']} erreur(s) de verrou, lecture la plus lente {r['attente_max'] * 1000:.0f} ms")
+        finally:
+            shutil.rmtree(dossier, ignore_errors=True)
+
+        print("=" * 60)
+        return resultats
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--lecteurs', type=int, default=8, help='threads de lecture')
+    parser.add_argument('--ecrivains', type=int, default=2, help="threads d'écriture")
+    parser.add_argument('--duree', type=float, default=10, help='durée de chaque mesure (secondes)')
+    args = parser.parse_args()
+
+    benchmark(args.lecteurs, args.ecrivains, args.duree)
@@ -0,0 +1,62 @@
+"""Cache memoire a duree de vie limitee.
+
+Chaque worker possede ses propres entrees : une ecriture validee dans ce
+worker les invalide immediatement (voir ``signaux.py``), celles des autres
+workers expirent au bout de leur duree de vie.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class CacheTTL:
+    """Dictionnaire borne dont les entrees expirent apres ``duree`` secondes."""
+
+    def __init__(self, duree=30, taille_max=256):
+        self.duree = duree
+        self.taille_max = taille_max
+        self.succes = 0
+        self.echecs = 0
+        self._entrees = OrderedDict()
+        self._verrou = threading.Lock()
+
+    def lire(self, cle):
+        """Retourne (True, valeur) si la cle est presente et fraiche."""
+        with self._verrou:
+            entree = self._entrees.get(cle)
+            if entree is not None and entree[0] > time.monotonic():
+                self._entrees.move_to_end(cle)
+                self.succes += 1
+                return True, entree[1]
+            if entree is not None:
+                del self._entrees[cle]
+            self.echecs += 1
+            return False, None
+
+    def ecrire(self, cle, valeur, duree=None):
+        expiration = time.monotonic() + (self.duree if duree is None else duree)
+        with self._verrou:
+            self._entrees[cle] = (expiration, valeur)
+            self._entrees.move_to_end(cle)
+            while len(self._entrees) > self.taille_max:
+                self._entrees.popitem(last=False)
+
+    def obtenir(self, cle, calcul, duree=None):
+        """Retourne la valeur en cache ou la calcule et la memorise."""
+        trouve, valeur = self.lire(cle)
+        if not trouve:
+            valeur = calcul()
+            self.ecrire(cle, valeur, duree)
+        return valeur
+
+    def invalider(self, cle=None):
+        """Supprime une entree, ou toutes si aucune cle n'est donnee."""
+        with self._verrou:
+            if cle is None:
+                self._entrees.clear()
+            else:
+                self._entrees.pop(cle, None)
+
+    def statistiques(self):
+        return {'succes': self.succes, 'echecs': self.echecs, 'entrees': len(self._entrees)}
@@ -0,0 +1,80 @@
+"""GET conditionnels (ETag / Last-Modified).
+
+Le jeton d'une ressource est tire d'un compteur de version en base
+(``ouvrages.version``, ``usagers.version``) lu par une simple requete sur
+la cle primaire : si le client possede deja la bonne version, la reponse 304
+est envoyee sans charger d'objet ORM ni rendre de template.
+"""
+
+import hashlib
+import os
+from datetime import timezone
+
+from flask import Response, request, session
+
+CACHE_PRIVE = 'private, no-cache'
+
+_DOSSIER_TEMPLATES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates')
+
+
+def _empreinte_templates():
+    """Change a chaque deploiement modifiant les templates (identique dans tous les workers)."""
+    try:
+        dates = [
+            os.path.getmtime(os.path.join(dossier, nom))
+            for dossier, _, fichiers in os.walk(_DOSSIER_TEMPLATES)
+            for nom in fichiers
+        ]
+    except OSError:
+        dates = []
+    return format(int(max(dates, default=0)), 'x')
+
+
+EMPREINTE_TEMPLATES = _empreinte_templates()
+
+
+def jeton_identite():
+    """Identifie le visiteur sans requete SQL : une page rendue differe selon qui la consulte."""
+    brut = f"a{session.get('_user_id') or ''}:u{session.get('usager_id') or ''}"
+    return hashlib.sha1(brut.encode()).hexdigest()[:10]
+
+
+def etag(*parties):
+    return '-'.join(str(p) for p in parties)
+
+
+def _utc(date):
+    if date is None:
+        return None
+    return date.replace(tzinfo=timezone.utc, microsecond=0) if date.tzinfo is None else date
+
+
+def reponse_304_si_inchangee(jeton, date_modification=None, page_html=False):
+    """Retourne une reponse 304 si le client possede deja cette version, sinon None.
+
+    ``If-None-Match`` prime sur ``If-Modified-Since``. Une page HTML est
+    toujours rendue tant qu'un message flash attend d'y etre affiche.
+    """
+    if page_html and session.get('_flashes'):
+        return None
+
+    if request.if_none_match:
+        inchangee = request.if_none_match.contains_weak(jeton)
+    elif request.if_modified_since and date_modification is not None:
+        inchangee = _utc(date_modification) <= request.if_modified_since
+    else:
+        inchangee = False
+
+    if not inchangee:
+        return None
+    reponse = Response(status=304)
+    return marquer(reponse, jeton, date_modification)
+
+
+def marquer(reponse, jeton, date_modification=None, cache_control=CACHE_PRIVE):
+    """Ajoute ETag, Last-Modified et Cache-Control a une reponse."""
+    reponse.set_etag(jeton)
+    if date_modification is not None:
+        reponse.last_modified = _utc(date_modification)
+    reponse.headers['Cache-Control'] = cache_control
+    return reponse
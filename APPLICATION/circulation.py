@@ -0,0 +1,95 @@
+"""Operations de circulation (emprunts et retours).
+
+Toute ecriture qui change l'etat d'un exemplaire passe par ce module afin de
+tenir a jour, dans la meme transaction, ``Exemplaire.emprunt_courant_id`` et
+``Ouvrage.copies_available``. L'appelant reste responsable du commit.
+"""
+
+from datetime import datetime
+
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+
+from database import db, verrouiller_ecriture
+from file_reservations import promouvoir
+from models import Emprunt, Exemplaire, Ouvrage, STATUTS_EMPRUNT_ACTIFS
+
+TENTATIVES_ALLOCATION = 3
+
+# Exemplaires repris par un autre emprunt entre la lecture et l'ecriture (worker courant)
+_reessais = {'allocation': 0}
+
+
+def enregistrer_emprunt(usager_id, exemplaire, date_retour_prevue=None):
+    """Cree l'emprunt d'un exemplaire et met a jour les compteurs."""
+    emprunt = Emprunt(usager_id=usager_id, exemplaire_id=exemplaire.id)
+    if date_retour_prevue:
+        emprunt.date_retour_prevue = date_retour_prevue
+
+    db.session.add(emprunt)
+    db.session.flush()
+
+    exemplaire.emprunt_courant_id = emprunt.id
+    # Expression SQL : la decrementation reste atomique entre workers
+    exemplaire.ouvrage.copies_available = Ouvrage.copies_available - 1
+    db.session.flush()
+    return emprunt
+
+
+def allouer_exemplaire(usager_id, ouvrage_id, date_retour_prevue=None, tentatives=TENTATIVES_ALLOCATION):
+    """Prete a l'usager un exemplaire libre de l'ouvrage ; retourne l'emprunt, ou None.
+
+    L'exemplaire est choisi par une seule requete sur l'index
+    ``(ouvrage_id, emprunt_courant_id)``, sans charger les exemplaires ni leur
+    historique. Sous PostgreSQL la ligne est verrouillee (SKIP LOCKED : deux
+    workers prennent deux exemplaires differents) ; sous SQLite le verrou
+    d'ecriture est pris avant la lecture. En dernier recours l'index unique
+    ``ux_emprunts_exemplaire_actif`` refuse un second emprunt actif : le point
+    de sauvegarde est annule et un autre exemplaire est tente.
+    """
+    verrouiller_ecriture()
+    essayes = []
+    for _ in range(tentatives):
+        libre = select(Exemplaire).where(
+            Exemplaire.ouvrage_id == ouvrage_id, Exemplaire.emprunt_courant_id.is_(None)
+        )
+        if essayes:
+            libre = libre.where(Exemplaire.id.not_in(essayes))
+        exemplaire = db.session.scalars(
+            libre.order_by(Exemplaire.id).limit(1).with_for_update(skip_locked=True)
+        ).first()
+        if exemplaire is None:
+            return None
+        try:
+            with db.session.begin_nested():
+                return enregistrer_emprunt(usager_id, exemplaire, date_retour_prevue)
+        except IntegrityError:
+            # Emprunt actif ecrit par ailleurs : le pointeur de cet exemplaire etait perime
+            essayes.append(exemplaire.id)
+            _reessais['allocation'] += 1
+    return None
+
+
+def enregistrer_retour(emprunt):
+    """Cloture un emprunt actif, libere son exemplaire et promeut la tete de file.
+
+    Retourne False si l'emprunt etait deja cloture (aucun compteur modifie).
+    """
+    if emprunt.statut not in STATUTS_EMPRUNT_ACTIFS:
+        return False
+
+    emprunt.date_retour_reelle = datetime.utcnow()
+    emprunt.statut = 'retourne'
+
+    exemplaire = emprunt.exemplaire
+    if exemplaire.emprunt_courant_id == emprunt.id:
+        exemplaire.emprunt_courant_id = None
+        exemplaire.ouvrage.copies_available = Ouvrage.copies_available + 1
+        db.session.flush()
+        # L'exemplaire revenu sert d'abord la tete de la file de reservation
+        promouvoir(exemplaire.ouvrage_id)
+    return True
+
+
+def statistiques():
+    return dict(_reessais)
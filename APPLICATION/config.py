@@ -0,0 +1,120 @@
+"""Configuration de l'application, lue depuis l'environnement.
+
+Chaque cle peut etre fournie par une variable d'environnement du meme nom
+(``DATABASE_URL`` pour l'URI de la base). Un chemin SQLite relatif est
+resolu dans le dossier ``instance/`` par Flask-SQLAlchemy ; une URI
+``postgresql://`` (ou ``postgres://``) fait tourner l'application sur PostgreSQL.
+
+Les profils (``Developpement``, ``Production``, ``Test``) completent ``Config`` ;
+``create_app`` accepte la classe, son nom dans ``PROFILS`` ou un chemin
+d'import (``config.Production``), et lit ``BIBLIOTHEQUE_PROFIL`` par defaut.
+"""
+
+import os
+import secrets
+
+
+def _entier(nom, defaut):
+    valeur = os.environ.get(nom)
+    return int(valeur) if valeur not in (None, '') else defaut
+
+
+def _booleen(nom, defaut):
+    valeur = os.environ.get(nom)
+    return valeur.lower() in ('1', 'true', 'oui') if valeur not in (None, '') else defaut
+
+
+def _uri_base():
+    uri = os.environ.get('DATABASE_URL', 'sqlite:///bibliotheque.db')
+    # Forme courte fournie par certains hebergeurs, refusee par SQLAlchemy
+    if uri.startswith('postgres://'):
+        uri = 'postgresql://' + uri[len('postgres://'):]
+    return uri
+
+
+class Config:
+    SQLALCHEMY_DATABASE_URI = _uri_base()
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+    SECRET_KEY = os.environ.get('SECRET_KEY') or secrets.token_hex(32)
+
+    # Profil SQLite applique a chaque connexion
+    SQLITE_JOURNAL = os.environ.get('SQLITE_JOURNAL', 'WAL')
+    SQLITE_SYNCHRONOUS = os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL')
+    SQLITE_BUSY_TIMEOUT_MS = _entier('SQLITE_BUSY_TIMEOUT_MS', 5000)
+    SQLITE_CACHE_KIO = _entier('SQLITE_CACHE_KIO', 32768)                  # 32 Mio par connexion
+    SQLITE_MMAP_OCTETS = _entier('SQLITE_MMAP_OCTETS', 256 * 1024 * 1024)
+
+    # Garde-fous PostgreSQL appliques a chaque session (millisecondes, 0 = aucun)
+    POSTGRES_LOCK_TIMEOUT_MS = _entier('POSTGRES_LOCK_TIMEOUT_MS', 5000)
+    POSTGRES_STATEMENT_TIMEOUT_MS = _entier('POSTGRES_STATEMENT_TIMEOUT_MS', 30000)
+    POSTGRES_APPLICATION = os.environ.get('POSTGRES_APPLICATION', 'bibliotheque')
+
+    # Pool de connexions de chaque worker
+    POOL_TAILLE = _entier('POOL_TAILLE', 5)
+    POOL_DEBORDEMENT = _entier('POOL_DEBORDEMENT', 10)
+    POOL_DELAI = _entier('POOL_DELAI', 10)
+    POOL_RECYCLAGE = _entier('POOL_RECYCLAGE', 1800)
+
+    # Hachage des mots de passe (syntaxe werkzeug) et pool de threads qui l'execute
+    HACHAGE_METHODE = os.environ.get('HACHAGE_METHODE', 'pbkdf2:sha256:600000')
+    HACHAGE_THREADS = _entier('HACHAGE_THREADS', 2)
+    HACHAGE_FILE_MAX = _entier('HACHAGE_FILE_MAX', 16)                      # hachages en attente au plus
+    HACHAGE_DELAI = _entier('HACHAGE_DELAI', 10)                            # secondes
+
+    # Cache des identites connectees (voir identite.py)
+    IDENTITE_TTL = _entier('IDENTITE_TTL', 60)                              # secondes, entre machines
+    IDENTITE_MARQUEUR = os.environ.get('IDENTITE_MARQUEUR')                 # defaut : instance/identites.marqueur
+
+    # Cache des fragments d'ouvrages : 'memoire' (par worker), 'fichier' (partage) ou vide
+    FRAGMENTS_STOCKAGE = os.environ.get('FRAGMENTS_STOCKAGE', 'memoire')
+    FRAGMENTS_TAILLE = _entier('FRAGMENTS_TAILLE', 4096)
+    FRAGMENTS_DOSSIER = os.environ.get('FRAGMENTS_DOSSIER')                 # defaut : instance/fragments
+
+    # Periode (secondes) des taches de maintenance executees dans le serveur ; vide = desactive
+    MAINTENANCE_INTERVALLE = os.environ.get('MAINTENANCE_INTERVALLE')
+    MAINTENANCE_VERROU = os.environ.get('MAINTENANCE_VERROU')               # defaut : instance/maintenance.verrou
+
+    # Flux SSE du tableau de bord usager : au-dela de SSE_FLUX_MAX flux par worker, interrogation
+    SSE_FLUX_MAX = _entier('SSE_FLUX_MAX', 8)
+    SSE_INTERVALLE = _entier('SSE_INTERVALLE', 5)                           # secondes entre deux verifications
+    SSE_DUREE_MAX = _entier('SSE_DUREE_MAX', 300)                           # secondes avant reconnexion
+
+    # Releve des requetes SQL de chaque requete HTTP (voir diagnostics.py)
+    SERVER_TIMING = _booleen('SERVER_TIMING', False)                       # actif en Developpement et Test
+    SQL_REPETITIONS_MAX = _entier('SQL_REPETITIONS_MAX', 10)               # executions d'une meme instruction
+    SQL_REPETITIONS_ACTION = os.environ.get('SQL_REPETITIONS_ACTION', '')  # '', 'avertir' ou 'echouer'
+
+    # Metriques Prometheus (/metrics) : instantanes des workers dans un dossier partage (voir metriques.py)
+    METRIQUES_DOSSIER = os.environ.get('METRIQUES_DOSSIER')                 # defaut : instance/metriques
+    METRIQUES_INTERVALLE = _entier('METRIQUES_INTERVALLE', 5)               # secondes entre deux publications
+    METRIQUES_JETON = os.environ.get('METRIQUES_JETON')                     # si defini : Authorization: Bearer <jeton>
+
+
+class Developpement(Config):
+    DEBUG = True
+    TEMPLATES_AUTO_RELOAD = True
+    SERVER_TIMING = _booleen('SERVER_TIMING', True)
+    SQL_REPETITIONS_ACTION = os.environ.get('SQL_REPETITIONS_ACTION', 'avertir')
+
+
+class Production(Config):
+    DEBUG = False
+    TEMPLATES_AUTO_RELOAD = False
+
+
+class Test(Config):
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = os.environ.get('TEST_DATABASE_URL', 'sqlite://')
+    # Hachage peu couteux : les tests creent des comptes a la chaine
+    HACHAGE_METHODE = 'pbkdf2:sha256:1000'
+    MAINTENANCE_INTERVALLE = None
+    SERVER_TIMING = _booleen('SERVER_TIMING', True)
+    # Un N+1 fait echouer le test qui le declenche
+    SQL_REPETITIONS_ACTION = 'echouer'
+
+
+PROFILS = {
+    'developpement': Developpement,
+    'production': Production,
+    'test': Test,
+}
@@ -1,7 +1,52 @@
 from models import *
 from database import db
-from datetime import datetime, timedelta
-from sqlalchemy import and_, or_
+from sqlalchemy import func, select
+from flask import current_app
+from cache import CacheTTL
+from circulation import allouer_exemplaire, enregistrer_retour
+from file_reservations import mettre_en_file
+from signaux import abonner
+
+DUREE_CACHE_STATISTIQUES = 30
+TABLES_STATISTIQUES = {'ouvrages', 'exemplaires', 'usagers', 'emprunts', 'reservations', 'demandes_usager'}
+
+_cache_statistiques = CacheTTL(duree=DUREE_CACHE_STATISTIQUES, taille_max=8)
+
+
+@abonner
+def _invalider_statistiques(changements):
+    """Toute ecriture validee sur une table comptee rend les statistiques obsoletes"""
+    if TABLES_STATISTIQUES & changements.keys():
+        _cache_statistiques.invalider()
+
+
+def _compte(modele, *criteres):
+    return select(func.count()).select_from(modele).where(*criteres).scalar_subquery()
+
+
+def requete_statistiques():
+    """Indicateurs du tableau de bord réunis dans une seule requête"""
+    actifs = Emprunt.statut.in_(STATUTS_EMPRUNT_ACTIFS)
+    return select(
+        _compte(Ouvrage).label('total_ouvrages'),
+        _compte(Exemplaire).label('total_exemplaires'),
+        _compte(Usager).label('total_usagers'),
+        _compte(Emprunt, actifs).label('emprunts_en_cours'),
+        _compte(Emprunt, Emprunt.en_retard).label('emprunts_en_retard'),
+        _compte(Reservation, Reservation.statut == 'active').label('reservations_actives'),
+        _compte(DemandeUsager, DemandeUsager.statut == 'en_attente').label('demandes_en_attente'),
+    )
+
+
+def calculer_statistiques():
+    """Calcule les indicateurs du tableau de bord sans passer par le cache"""
+    return dict(db.session.execute(requete_statistiques()).one()._mapping)
+
+
+def statistiques_cache():
+    """Succes / echecs du cache des statistiques du tableau de bord (worker courant)"""
+    return _cache_statistiques.statistiques()
+
 
 class GestionBibliotheque:
     """Contrôleur principal pour la gestion de la bibliothèque"""
@@ -22,7 +67,7 @@ class GestionBibliotheque:
         )
         
         db.session.add(ouvrage)
-        db.session.commit()
+        db.session.flush()  # Pour obtenir l'ID, un seul commit pour l'ouvrage et ses exemplaires
         
         # Créer les exemplaires
         for i in range(nb_exemplaires):
@@ -66,22 +111,10 @@ class GestionBibliotheque:
         if not ouvrage.est_disponible():
             return False, "Aucun exemplaire disponible"
         
-        exemplaire_dispo = None
-        for exemplaire in ouvrage.exemplaires:
-            if exemplaire.est_disponible():
-                exemplaire_dispo = exemplaire
-                break
-        
-        if not exemplaire_dispo:
+        # Réserver un exemplaire libre, créer l'emprunt et mettre à jour les compteurs
+        if allouer_exemplaire(usager_id, ouvrage_id) is None:
+            db.session.rollback()
             return False, "Erreur: aucun exemplaire disponible trouvé"
-        
-        # Créer l'emprunt
-        emprunt = Emprunt(
-            usager_id=usager_id,
-            exemplaire_id=exemplaire_dispo.id
-        )
-        
-        db.session.add(emprunt)
         db.session.commit()
         return True, "Emprunt enregistré avec succès"
     
@@ -92,20 +125,10 @@ class GestionBibliotheque:
         if not emprunt:
             return False, "Emprunt non trouvé"
         
-        emprunt.date_retour_reelle = datetime.utcnow()
-        emprunt.statut = 'retourné'
-        
-        # Vérifier s'il y a des réservations pour cet ouvrage
-        reservations = Reservation.query.filter_by(
-            ouvrage_id=emprunt.exemplaire.ouvrage_id,
-            statut='active'
-        ).order_by(Reservation.priorite, Reservation.date_reservation).all()
-        
-        if reservations:
-            # Notifier le premier usager en liste d'attente
-            reservation = reservations[0]
-            reservation.statut = 'honorée'
-            # Ici, on pourrait envoyer un email de notification
+        # Le retour promeut aussi la tete de la file de reservation
+        if not enregistrer_retour(emprunt):
+            return False, "Emprunt déjà retourné"
+        # Ici, on pourrait envoyer un email de notification
         
         db.session.commit()
         return True, "Retour enregistré avec succès"
@@ -119,42 +142,19 @@ class GestionBibliotheque:
         if not usager or not ouvrage:
             return False, "Usager ou ouvrage non trouvé"
         
-        # Vérifier si l'usager a déjà une réservation active pour cet ouvrage
-        reservation_existante = Reservation.query.filter_by(
-            usager_id=usager_id,
-            ouvrage_id=ouvrage_id,
-            statut='active'
-        ).first()
-        
-        if reservation_existante:
+        # Mise en file (refusée si l'usager a déjà une réservation active pour cet ouvrage)
+        reservation, _ = mettre_en_file(usager_id, ouvrage_id)
+        if reservation is None:
+            db.session.rollback()
             return False, "Vous avez déjà une réservation active pour cet ouvrage"
         
-        # Calculer la priorité
-        reservations_actives = Reservation.query.filter_by(
-            ouvrage_id=ouvrage_id,
-            statut='active'
-        ).count()
-        
-        reservation = Reservation(
-            usager_id=usager_id,
-            ouvrage_id=ouvrage_id,
-            priorite=reservations_actives + 1
-        )
-        
-        db.session.add(reservation)
         db.session.commit()
         return True, "Réservation créée avec succès"
     
     @staticmethod
-    def get_statistiques():
-        """Retourne des statistiques sur la bibliothèque"""
-        stats = {
-            'total_ouvrages': Ouvrage.query.count(),
-            'total_exemplaires': Exemplaire.query.count(),
-            'total_usagers': Usager.query.count(),
-            'emprunts_en_cours': Emprunt.query.filter_by(statut='en_cours').count(),
-            'emprunts_en_retard': len([e for e in Emprunt.query.filter_by(statut='en_cours').all() 
-                                      if e.est_en_retard()]),
-            'reservations_actives': Reservation.query.filter_by(statut='active').count()
-        }
-        return stats
\ No newline at end of file
+    def get_statistiques(utiliser_cache=True):
+        """Retourne des statistiques sur la bibliothèque (mises en cache quelques secondes)"""
+        if not utiliser_cache:
+            return calculer_statistiques()
+        duree = current_app.config.get('STATISTIQUES_TTL', DUREE_CACHE_STATISTIQUES)
+        return dict(_cache_statistiques.obtenir('globales', calculer_statistiques, duree))
@@ -1,37 +1,212 @@
-from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import inspect, text
+import ast
 import os
-import secrets
+import re
+import time
+
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import TimeoutError as DelaiPoolDepasse
+from sqlalchemy.pool import QueuePool
+
+from config import Config
 
 
 db = SQLAlchemy()
 
+DOSSIER_MIGRATIONS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
 
-def _ensure_legacy_compatibility(app):
-    """Ajoute les colonnes manquantes sur une base SQLite deja existante."""
-    with app.app_context():
-        inspector = inspect(db.engine)
-        tables = inspector.get_table_names()
 
-        if 'usagers' in tables:
-            columns = {col['name'] for col in inspector.get_columns('usagers')}
-            if 'password_hash' not in columns:
-                db.session.execute(text('ALTER TABLE usagers ADD COLUMN password_hash VARCHAR(200)'))
-                db.session.commit()
+def _est_sqlite_fichier(uri):
+    url = make_url(uri)
+    return url.get_backend_name() == 'sqlite' and url.database not in (None, '', ':memory:')
+
+
+def verrouiller_ecriture(connexion=None):
+    """Sous SQLite, ouvre la transaction avec BEGIN IMMEDIATE si aucune n'est en cours.
+
+    Le verrou d'ecriture est alors pris avant les lectures qui decident de
+    l'ecriture (aucun autre worker ne peut s'intercaler), et les points de
+    sauvegarde (``begin_nested``) restent internes a la transaction : le pilote
+    sqlite3 validerait sinon un SAVEPOINT ouvert hors transaction des son
+    RELEASE. Sans effet sur les autres moteurs, qui verrouillent les lignes.
+    ``connexion`` vaut par defaut celle de la session courante.
+    """
+    connexion = connexion if connexion is not None else db.session.connection()
+    if connexion.dialect.name != 'sqlite':
+        return
+    if not connexion.connection.dbapi_connection.in_transaction:
+        connexion.exec_driver_sql('BEGIN IMMEDIATE')
+
+
+class PoolMesure(QueuePool):
+    """QueuePool qui compte les emprunts de connexion, leur duree et les delais depasses.
+
+    La duree d'un emprunt comprend l'attente d'une connexion libre quand le
+    pool et son debordement sont epuises, ou l'ouverture d'une nouvelle
+    connexion. Compteurs propres au worker, lus par ``metriques.py``.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.emprunts = 0
+        self.duree_emprunts = 0.0
+        self.delais_depasses = 0
+
+    def connect(self):
+        debut = time.perf_counter()
+        try:
+            connexion = super().connect()
+        except DelaiPoolDepasse:
+            self.delais_depasses += 1
+            raise
+        self.duree_emprunts += time.perf_counter() - debut
+        self.emprunts += 1
+        return connexion
+
+
+def options_moteur(config):
+    """Options de create_engine : pool par worker, delais d'attente des verrous selon le moteur"""
+    uri = config['SQLALCHEMY_DATABASE_URI']
+    moteur = make_url(uri).get_backend_name()
+    options = {}
+    if moteur != 'sqlite' or _est_sqlite_fichier(uri):
+        options.update(
+            poolclass=PoolMesure,
+            pool_size=config.get('POOL_TAILLE', Config.POOL_TAILLE),
+            max_overflow=config.get('POOL_DEBORDEMENT', Config.POOL_DEBORDEMENT),
+            pool_timeout=config.get('POOL_DELAI', Config.POOL_DELAI),
+            pool_recycle=config.get('POOL_RECYCLAGE', Config.POOL_RECYCLAGE),
+        )
+    if moteur == 'sqlite':
+        delai = config.get('SQLITE_BUSY_TIMEOUT_MS', Config.SQLITE_BUSY_TIMEOUT_MS)
+        options['connect_args'] = {'timeout': delai / 1000}
+    elif moteur == 'postgresql':
+        # Un serveur redemarre ou une connexion coupee par un pare-feu ne remonte pas en 500
+        options['pool_pre_ping'] = True
+        verrou = int(config.get('POSTGRES_LOCK_TIMEOUT_MS', Config.POSTGRES_LOCK_TIMEOUT_MS))
+        requete = int(config.get('POSTGRES_STATEMENT_TIMEOUT_MS', Config.POSTGRES_STATEMENT_TIMEOUT_MS))
+        options['connect_args'] = {
+            'application_name': config.get('POSTGRES_APPLICATION', Config.POSTGRES_APPLICATION),
+            'options': f'-c lock_timeout={verrou} -c statement_timeout={requete}',
+        }
+    return options
+
+
+def installer_pragmas(engine, config):
+    """Applique le profil SQLite (WAL, synchronous, cache, mmap) a chaque nouvelle connexion."""
+    if engine.dialect.name != 'sqlite':
+        return
+
+    pragmas = [
+        f"PRAGMA busy_timeout = {int(config.get('SQLITE_BUSY_TIMEOUT_MS', Config.SQLITE_BUSY_TIMEOUT_MS))}",
+        f"PRAGMA synchronous = {config.get('SQLITE_SYNCHRONOUS', Config.SQLITE_SYNCHRONOUS)}",
+        # Valeur negative : taille en Kio et non en pages
+        f"PRAGMA cache_size = -{int(config.get('SQLITE_CACHE_KIO', Config.SQLITE_CACHE_KIO))}",
+        f"PRAGMA mmap_size = {int(config.get('SQLITE_MMAP_OCTETS', Config.SQLITE_MMAP_OCTETS))}",
+        'PRAGMA temp_store = MEMORY',
+    ]
+    if _est_sqlite_fichier(str(engine.url)):
+        pragmas.insert(0, f"PRAGMA journal_mode = {config.get('SQLITE_JOURNAL', Config.SQLITE_JOURNAL)}")
+
+    @event.listens_for(engine, 'connect')
+    def _a_la_connexion(connexion_dbapi, _):
+        curseur = connexion_dbapi.cursor()
+        for pragma in pragmas:
+            curseur.execute(pragma)
+        # Statistiques du planificateur rafraichies a l'ouverture, bornees en cout
+        curseur.execute('PRAGMA analysis_limit = 400')
+        curseur.execute('PRAGMA optimize = 0x10002')
+        curseur.close()
+
+    @event.listens_for(engine, 'close')
+    def _a_la_fermeture(connexion_dbapi, _):
+        try:
+            connexion_dbapi.execute('PRAGMA optimize')
+        except Exception:
+            pass
 
 
 def init_app(app):
-    """Initialise l'application avec la base de donnees"""
-    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///bibliotheque.db'
-    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-    app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY') or secrets.token_hex(32)
+    """Initialise l'application avec la base de donnees (configuration deja chargee).
+
+    Le moteur est cree sans ouvrir de connexion : la premiere l'est dans le
+    worker, apres le fork (voir ``liberer_connexions``).
+    """
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', options_moteur(app.config))
 
     db.init_app(app)
 
+    with app.app_context():
+        installer_pragmas(db.engine, app.config)
+
 
-def ensure_schema(app):
-    """Cree les tables manquantes et applique les ajustements legacy."""
+def liberer_connexions(app):
+    """Oublie, sans les fermer, les connexions heritees du processus parent.
+
+    A appeler dans un processus issu d'un fork : les sockets et fichiers
+    ouverts avant le fork appartiennent encore au parent, le pool en ouvrira
+    de nouveaux a la demande.
+    """
     with app.app_context():
-        db.create_all()
+        for moteur in db.engines.values():
+            moteur.dispose(close=False)
+
+
+def init_migrations(app):
+    """Attache Flask-Migrate (commande ``flask db``) ; alembic n'est importe qu'ici."""
+    from flask_migrate import Migrate
+    return Migrate(app, db, directory=DOSSIER_MIGRATIONS, render_as_batch=True)
+
 
-    _ensure_legacy_compatibility(app)
+_ENTETE_REVISION = re.compile(r'^(revision|down_revision)\s*(?::[^=]+)?=\s*(.+)$', re.MULTILINE)
+
+
+def version_attendue(dossier=DOSSIER_MIGRATIONS):
+    """Revision la plus recente des scripts de migration.
+
+    Lue dans les en-tetes ``revision`` / ``down_revision`` des scripts plutot
+    qu'avec ``alembic.script`` : le demarrage d'un worker n'importe pas alembic.
+    """
+    revisions, parents = set(), set()
+    dossier_versions = os.path.join(dossier, 'versions')
+    for nom in os.listdir(dossier_versions):
+        if not nom.endswith('.py'):
+            continue
+        with open(os.path.join(dossier_versions, nom), encoding='utf-8') as script:
+            for cle, valeur in _ENTETE_REVISION.findall(script.read()):
+                valeur = ast.literal_eval(valeur.strip())
+                if cle == 'revision':
+                    revisions.add(valeur)
+                elif valeur:
+                    parents.update([valeur] if isinstance(valeur, str) else valeur)
+    tetes = revisions - parents
+    if len(tetes) > 1:
+        raise RuntimeError(f'Plusieurs revisions de tete : {sorted(tetes)} (flask db merge)')
+    return tetes.pop() if tetes else None
+
+
+def version_base():
+    """Revision enregistree dans la base (table alembic_version), None si jamais migree."""
+    with db.engine.connect() as connexion:
+        if not connexion.dialect.has_table(connexion, 'alembic_version'):
+            return None
+        return connexion.exec_driver_sql('SELECT version_num FROM alembic_version').scalar()
+
+
+def verifier_schema(app, journaliser=True):
+    """Compare la revision de la base a celle du code, sans rien modifier.
+
+    Une requete au demarrage du worker (``init_processus``) : les migrations
+    sont appliquees une seule fois, au deploiement, par ``migrer_base.py``. Le resultat est garde
+    dans ``app.extensions['schema']``.
+    """
+    with app.app_context():
+        etat = {'attendue': version_attendue(), 'base': version_base()}
+    etat['a_jour'] = etat['base'] == etat['attendue']
+    app.extensions['schema'] = etat
+    if journaliser and not etat['a_jour']:
+        app.logger.error(
+            'Base en revision %s, le code attend %s : lancez python migrer_base.py', etat['base'], etat['attendue']
+        )
+    return etat['a_jour']
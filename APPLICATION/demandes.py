@@ -0,0 +1,128 @@
+"""Traitement des demandes usager (file des demandes en attente).
+
+Plusieurs administrateurs ou workers peuvent traiter la file en parallele :
+sous PostgreSQL, une demande est prise avec ``SELECT ... FOR UPDATE SKIP
+LOCKED``, si bien qu'une demande deja en cours de traitement est sautee au
+lieu de bloquer. SQLite ignore ce verrou de ligne (un seul ecrivain a la
+fois) ; dans les deux cas, la cloture de la demande est un ``UPDATE``
+conditionnel sur ``statut = 'en_attente'`` qui empeche de la traiter deux fois.
+L'appelant reste responsable du commit.
+"""
+
+from datetime import datetime
+
+from sqlalchemy import select, update
+
+from circulation import allouer_exemplaire
+from database import db, verrouiller_ecriture
+from file_reservations import mettre_en_file
+from models import DemandeUsager, incrementer_versions_usagers
+from signaux import noter
+
+
+def _en_attente():
+    return select(DemandeUsager).where(DemandeUsager.statut == 'en_attente')
+
+
+def verrouiller_demande(demande_id):
+    """Retourne la demande si elle est en attente et libre, sinon None."""
+    requete = _en_attente().where(DemandeUsager.id == demande_id).with_for_update(skip_locked=True)
+    return db.session.execute(requete).scalar_one_or_none()
+
+
+def reclamer_demandes(limite=20, type_demande=None, exclure=()):
+    """Verrouille les plus anciennes demandes en attente que personne d'autre ne traite.
+
+    ``exclure`` ecarte les demandes deja examinees dans la passe en cours.
+    """
+    requete = _en_attente()
+    if type_demande:
+        requete = requete.where(DemandeUsager.type_demande == type_demande)
+    if exclure:
+        requete = requete.where(DemandeUsager.id.not_in(exclure))
+    requete = (
+        requete.order_by(DemandeUsager.date_creation, DemandeUsager.id)
+        .limit(limite)
+        .with_for_update(skip_locked=True)
+    )
+    return db.session.execute(requete).scalars().all()
+
+
+def _cloturer(demande, statut, bibliothecaire_id=None, commentaire_admin=None):
+    """Passe la demande a ``statut`` si elle est toujours en attente ; retourne False sinon."""
+    resultat = db.session.execute(
+        update(DemandeUsager)
+        .where(DemandeUsager.id == demande.id, DemandeUsager.statut == 'en_attente')
+        .values(
+            statut=statut,
+            commentaire_admin=commentaire_admin,
+            date_traitement=datetime.utcnow(),
+            bibliothecaire_id=bibliothecaire_id,
+        )
+        .execution_options(synchronize_session='evaluate')
+    )
+    if resultat.rowcount != 1:
+        return False
+    incrementer_versions_usagers(db.session.connection(), [demande.usager_id])
+    noter(db.session, DemandeUsager.__tablename__, [demande.id])
+    return True
+
+
+def accepter_demande_en_attente(demande, bibliothecaire_id=None, commentaire_admin=None):
+    """Accepte une demande : cree l'emprunt ou la reservation correspondante.
+
+    Retourne ``(succes, message)`` ; en cas d'echec rien n'est ecrit et la
+    demande reste en attente.
+    """
+    if demande.statut != 'en_attente':
+        return False, 'Cette demande est deja traitee'
+
+    verrouiller_ecriture()
+    point = db.session.begin_nested()
+    try:
+        succes, message = _accepter(demande, bibliothecaire_id, commentaire_admin)
+    except Exception:
+        point.rollback()
+        raise
+    if succes:
+        point.commit()
+    else:
+        point.rollback()
+    return succes, message
+
+
+def _accepter(demande, bibliothecaire_id, commentaire_admin):
+    usager = demande.usager
+    ouvrage = demande.ouvrage
+
+    if demande.type_demande == 'emprunt':
+        peut, message = usager.peut_emprunter()
+        if not peut:
+            return False, f'Demande refusee automatiquement: {message}'
+
+        if allouer_exemplaire(usager.id, ouvrage.id) is None:
+            return False, 'Impossible d accepter: ouvrage non disponible'
+
+        if not _cloturer(demande, 'acceptee', bibliothecaire_id, commentaire_admin):
+            return False, 'Cette demande est deja traitee'
+
+    elif demande.type_demande == 'reservation':
+        reservation, _ = mettre_en_file(usager.id, ouvrage.id)
+        if reservation is None:
+            return False, 'Reservation deja active pour cet usager'
+
+        if not _cloturer(demande, 'acceptee', bibliothecaire_id, commentaire_admin):
+            return False, 'Cette demande est deja traitee'
+
+    else:
+        return False, 'Type de demande inconnu'
+
+    db.session.flush()
+    return True, 'Demande acceptee et traitee'
+
+
+def refuser_demande_en_attente(demande, bibliothecaire_id=None, commentaire_admin=None):
+    """Refuse une demande en attente ; retourne ``(succes, message)``."""
+    if not _cloturer(demande, 'refusee', bibliothecaire_id, commentaire_admin):
+        return False, 'Cette demande est deja traitee'
+    return True, 'Demande refusee'
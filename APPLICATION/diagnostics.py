@@ -0,0 +1,185 @@
+"""Comptage des requetes SQL de chaque requete HTTP et detection des N+1.
+
+Les evenements ``before_cursor_execute`` / ``after_cursor_execute`` du moteur
+relevent, pour la requete HTTP en cours, le nombre d'instructions, leur duree
+totale et le nombre d'executions de chaque forme d'instruction (le SQL
+parametre, listes ``IN (?, ?, ...)`` ramenees a un seul parametre). Une meme
+forme executee plus de ``SQL_REPETITIONS_MAX`` fois par une requete trahit un
+chargement paresseux dans une boucle (``emprunt.usager`` dans un gabarit...) :
+selon ``SQL_REPETITIONS_ACTION``, rien ('', defaut), un avertissement dans le
+journal ('avertir', profil Developpement) ou ``RequetesRepetees`` ('echouer',
+profil Test).
+
+Le releve est clos a la fin de la requete (``teardown_request``) : le corps
+d'une reponse en flux (``stream_template``, exports, SSE) est execute avant,
+ses requetes SQL sont donc comptees. La reponse porte un en-tete
+``Server-Timing`` (``SERVER_TIMING``, actif par defaut avec les profils
+Developpement et Test) lisible dans les outils de developpement du
+navigateur ; pour une reponse en flux, il ne couvre que ce qui precede le
+corps. Les totaux par endpoint du worker sont affiches sur ``/admin/diagnostics``.
+"""
+
+import re
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime
+
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+
+from database import db
+
+REPETITIONS_MAX_DEFAUT = 10
+ALERTES_MAX = 50
+FORMES_MAX = 20
+
+_PARAMETRE = r'(?:\?|%s|%\(\w+\)s|:\w+)'
+_LISTE_PARAMETRES = re.compile(rf'\(\s*{_PARAMETRE}(?:\s*,\s*{_PARAMETRE})+\s*\)')
+_ESPACES = re.compile(r'\s+')
+
+
+class RequetesRepetees(RuntimeError):
+    """Une requete HTTP a execute trop de fois la meme instruction SQL."""
+
+
+def forme_requete(instruction):
+    """Forme d'une instruction : espaces reduits, listes de parametres ramenees a ``(?)``"""
+    return _LISTE_PARAMETRES.sub('(?)', _ESPACES.sub(' ', instruction).strip())
+
+
+class Releve:
+    """Instructions SQL executees pendant une requete HTTP."""
+
+    __slots__ = ('debut', 'instructions', 'duree_sql', 'formes')
+
+    def __init__(self):
+        self.debut = time.perf_counter()
+        self.instructions = 0
+        self.duree_sql = 0.0
+        self.formes = Counter()
+
+    def repetitions(self, maximum):
+        """Formes executees plus de ``maximum`` fois, de la plus repetee a la moins repetee"""
+        return [(forme, nombre) for forme, nombre in self.formes.most_common() if nombre > maximum]
+
+
+class Statistiques:
+    """Totaux par endpoint depuis le demarrage du worker, et dernieres repetitions detectees."""
+
+    def __init__(self):
+        self.depuis = datetime.now()
+        self.endpoints = {}
+        self.alertes = deque(maxlen=ALERTES_MAX)
+        self._verrou = threading.Lock()
+
+    def ajouter(self, endpoint, chemin, releve, duree, repetitions):
+        with self._verrou:
+            total = self.endpoints.get(endpoint)
+            if total is None:
+                total = self.endpoints[endpoint] = {
+                    'appels': 0, 'instructions': 0, 'instructions_max': 0,
+                    'duree_sql': 0.0, 'duree': 0.0, 'repetitions': {},
+                }
+            total['appels'] += 1
+            total['instructions'] += releve.instructions
+            total['instructions_max'] = max(total['instructions_max'], releve.instructions)
+            total['duree_sql'] += releve.duree_sql
+            total['duree'] += duree
+            for forme, nombre in repetitions:
+                if forme in total['repetitions'] or len(total['repetitions']) < FORMES_MAX:
+                    total['repetitions'][forme] = max(total['repetitions'].get(forme, 0), nombre)
+                self.alertes.appendleft({
+                    'date': datetime.now(), 'endpoint': endpoint, 'chemin': chemin,
+                    'forme': forme, 'nombre': nombre,
+                })
+
+    def endpoints_tries(self):
+        """Endpoints, du plus grand nombre moyen d'instructions au plus petit"""
+        with self._verrou:
+            lignes = [
+                dict(total, endpoint=endpoint, repetitions=dict(total['repetitions']),
+                     instructions_moyenne=total['instructions'] / total['appels'])
+                for endpoint, total in self.endpoints.items()
+            ]
+        return sorted(lignes, key=lambda ligne: ligne['instructions_moyenne'], reverse=True)
+
+    def vider(self):
+        with self._verrou:
+            self.depuis = datetime.now()
+            self.endpoints.clear()
+            self.alertes.clear()
+
+
+def _releve():
+    return g.get('releve_sql') if has_request_context() else None
+
+
+def _avant_execution(connexion, curseur, instruction, parametres, contexte, executemany):
+    if contexte is not None and _releve() is not None:
+        contexte.debut_releve = time.perf_counter()
+
+
+def _apres_execution(connexion, curseur, instruction, parametres, contexte, executemany):
+    releve = _releve()
+    debut = getattr(contexte, 'debut_releve', None)
+    if releve is None or debut is None:
+        return
+    releve.instructions += 1
+    releve.duree_sql += time.perf_counter() - debut
+    releve.formes[forme_requete(instruction)] += 1
+
+
+def ouvrir_releve():
+    g.releve_sql = Releve()
+
+
+def annoter_reponse(reponse):
+    """Ajoute ``Server-Timing`` : requetes SQL et duree ecoulees avant l'envoi du corps"""
+    releve = g.get('releve_sql')
+    if releve is not None and current_app.config.get('SERVER_TIMING', False):
+        reponse.headers.add(
+            'Server-Timing',
+            f'sql;dur={releve.duree_sql * 1000:.1f};desc="{releve.instructions} requetes SQL", '
+            f'app;dur={(time.perf_counter() - releve.debut) * 1000:.1f}',
+        )
+    return reponse
+
+
+def fermer_releve(exception=None):
+    """Totalise le releve une fois la reponse envoyee (flux compris) et signale les repetitions"""
+    releve = g.pop('releve_sql', None)
+    if releve is None:
+        return
+    duree = time.perf_counter() - releve.debut
+    config = current_app.config
+    repetitions = releve.repetitions(config.get('SQL_REPETITIONS_MAX', REPETITIONS_MAX_DEFAUT))
+    current_app.extensions['diagnostics'].ajouter(
+        request.endpoint, request.full_path.rstrip('?'), releve, duree, repetitions
+    )
+
+    if repetitions:
+        action = config.get('SQL_REPETITIONS_ACTION', '')
+        forme, nombre = repetitions[0]
+        message = f'{request.endpoint} : {nombre} executions de la meme requete SQL ({forme[:200]})'
+        if action == 'echouer':
+            raise RequetesRepetees(message)
+        if action == 'avertir':
+            current_app.logger.warning(message)
+
+
+def statistiques():
+    return current_app.extensions['diagnostics']
+
+
+def init_diagnostics(app):
+    """Ecoute les instructions SQL des moteurs de l'application et releve chaque requete HTTP."""
+    with app.app_context():
+        for moteur in db.engines.values():
+            event.listen(moteur, 'before_cursor_execute', _avant_execution)
+            event.listen(moteur, 'after_cursor_execute', _apres_execution)
+    app.before_request(ouvrir_releve)
+    app.after_request(annoter_reponse)
+    app.teardown_request(fermer_releve)
+    app.extensions['diagnostics'] = Statistiques()
+    return app.extensions['diagnostics']
@@ -0,0 +1,149 @@
+"""Calcul de la disponibilite des ouvrages par lots.
+
+La disponibilite courante est portee par ``Ouvrage.copies_available`` et
+``Exemplaire.emprunt_courant_id``, maintenus par ``circulation.py``. Ce module
+lit ces compteurs pour une page entiere d'ouvrages, retombe sur une requete
+agregee sur les emprunts actifs quand un compteur est absent, et permet de
+reconstruire les compteurs a partir de la table ``emprunts``.
+"""
+
+from datetime import datetime
+
+from sqlalchemy import func, select, update
+
+from database import db
+from models import Emprunt, Exemplaire, Ouvrage, STATUTS_EMPRUNT_ACTIFS, incrementer_versions_ouvrages
+from signaux import publier
+
+# Nombre maximal d'identifiants par clause IN
+TAILLE_LOT = 500
+
+
+def compter_exemplaires_empruntes(ouvrage_ids):
+    """Retourne {ouvrage_id: nombre d'exemplaires actuellement empruntes}."""
+    ids = sorted({i for i in ouvrage_ids if i is not None})
+    resultat = {}
+
+    for debut in range(0, len(ids), TAILLE_LOT):
+        lot = ids[debut:debut + TAILLE_LOT]
+        requete = (
+            select(Exemplaire.ouvrage_id, func.count(func.distinct(Emprunt.exemplaire_id)))
+            .join(Emprunt, Emprunt.exemplaire_id == Exemplaire.id)
+            .where(
+                Exemplaire.ouvrage_id.in_(lot),
+                Emprunt.statut.in_(STATUTS_EMPRUNT_ACTIFS),
+            )
+            .group_by(Exemplaire.ouvrage_id)
+        )
+        resultat.update(db.session.execute(requete).all())
+
+    return resultat
+
+
+def disponibilites(ouvrages):
+    """Retourne {ouvrage_id: exemplaires disponibles} pour des ouvrages deja charges."""
+    resultat = {o.id: o.copies_available for o in ouvrages if o.copies_available is not None}
+
+    a_recompter = [o for o in ouvrages if o.copies_available is None]
+    if a_recompter:
+        empruntes = compter_exemplaires_empruntes(o.id for o in a_recompter)
+        for o in a_recompter:
+            resultat[o.id] = (o.nombre_exemplaires or 0) - empruntes.get(o.id, 0)
+
+    return resultat
+
+
+def disponibilites_par_ids(ouvrage_ids):
+    """Disponibilite d'ouvrages designes par leurs ids, sans charger d'objet ORM.
+
+    Retourne ``{ouvrage_id: {'disponible', 'exemplaires_disponibles',
+    'total_exemplaires'}}`` ; les ids inconnus sont absents du resultat.
+    Une requete par lot de ``TAILLE_LOT`` ids, plus le recomptage agrege des
+    ouvrages dont le compteur est absent.
+    """
+    ids = sorted({i for i in ouvrage_ids if i is not None})
+    lignes = []
+    for debut in range(0, len(ids), TAILLE_LOT):
+        lot = ids[debut:debut + TAILLE_LOT]
+        lignes.extend(db.session.execute(
+            select(Ouvrage.id, Ouvrage.copies_available, Ouvrage.nombre_exemplaires)
+            .where(Ouvrage.id.in_(lot))
+        ).all())
+
+    a_recompter = [id_ for id_, copies, _ in lignes if copies is None]
+    empruntes = compter_exemplaires_empruntes(a_recompter) if a_recompter else {}
+
+    resultat = {}
+    for id_, copies, total in lignes:
+        total = total or 0
+        if copies is None:
+            copies = total - empruntes.get(id_, 0)
+        resultat[id_] = {
+            'disponible': copies > 0,
+            'exemplaires_disponibles': copies,
+            'total_exemplaires': total,
+        }
+    return resultat
+
+
+def _emprunt_courant_attendu():
+    return (
+        select(func.max(Emprunt.id))
+        .where(
+            Emprunt.exemplaire_id == Exemplaire.id,
+            Emprunt.statut.in_(STATUTS_EMPRUNT_ACTIFS),
+        )
+        .scalar_subquery()
+    )
+
+
+def _copies_disponibles_attendues():
+    empruntes = (
+        select(func.count(func.distinct(Emprunt.exemplaire_id)))
+        .join(Exemplaire, Emprunt.exemplaire_id == Exemplaire.id)
+        .where(
+            Exemplaire.ouvrage_id == Ouvrage.id,
+            Emprunt.statut.in_(STATUTS_EMPRUNT_ACTIFS),
+        )
+        .scalar_subquery()
+    )
+    return func.coalesce(Ouvrage.nombre_exemplaires, 0) - empruntes
+
+
+def reconcilier_compteurs(appliquer=True):
+    """Reconstruit les compteurs de disponibilite depuis la table emprunts.
+
+    Retourne le nombre de lignes en ecart par table. Avec ``appliquer=False``
+    les ecarts sont seulement mesures.
+    """
+    pointeur = _emprunt_courant_attendu()
+    ecart_exemplaires = Exemplaire.emprunt_courant_id.is_distinct_from(pointeur)
+    ecarts = {
+        'exemplaires': db.session.scalar(select(func.count()).where(ecart_exemplaires)),
+    }
+    if appliquer:
+        incrementer_versions_ouvrages(
+            db.session.connection(), select(Exemplaire.ouvrage_id).where(ecart_exemplaires)
+        )
+        db.session.execute(
+            update(Exemplaire)
+            .where(ecart_exemplaires)
+            .values(emprunt_courant_id=pointeur)
+            .execution_options(synchronize_session=False)
+        )
+
+    attendu = _copies_disponibles_attendues()
+    ecart_ouvrages = Ouvrage.copies_available.is_distinct_from(attendu)
+    ecarts['ouvrages'] = db.session.scalar(select(func.count()).where(ecart_ouvrages))
+    if appliquer:
+        db.session.execute(
+            update(Ouvrage)
+            .where(ecart_ouvrages)
+            .values(copies_available=attendu, version=Ouvrage.version + 1, date_modification=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        db.session.expire_all()
+        publier({table: set() for table, nombre in ecarts.items() if nombre})
+
+    return ecarts
@@ -0,0 +1,306 @@
+"""Jeu de donnees synthetique, deterministe, de 1 000 a 1 000 000 d'ouvrages.
+
+``generer(echelle, graine)`` remplit une base migree et vide : usagers,
+ouvrages, exemplaires, emprunts (historiques et en cours), reservations et
+demandes, dans des proportions fixees par ``echelle`` (le nombre
+d'ouvrages). La meme graine et la meme date de reference donnent
+exactement les memes lignes (au sel du hash de mot de passe pres).
+
+La repartition est volontairement desequilibree, comme dans une vraie
+bibliotheque : quelques ouvrages concentrent les exemplaires, les prets et
+les files de reservation ; quelques usagers concentrent les emprunts et les
+demandes. Les lignes sont inserees par lots d'ouvrages, chaque table en un
+``executemany`` sans passer par l'ORM, avec des identifiants calcules : la
+memoire ne depend que de la taille d'un lot. Les compteurs
+(``copies_available``, ``emprunt_courant_id``) sont ecrits coherents avec
+les emprunts.
+"""
+
+import random
+from datetime import datetime, timedelta
+
+from sqlalchemy import bindparam, delete, func, insert, select, update
+
+from database import db
+from models import Bibliothecaire, DemandeUsager, Emprunt, Exemplaire, Ouvrage, Reservation, Usager
+from securite import hacher_mot_de_passe
+
+ECHELLE_MIN = 1000
+ECHELLE_MAX = 1_000_000
+TAILLE_LOT = 5000
+MOT_DE_PASSE = 'motdepasse'
+
+# Proportions par ouvrage
+USAGERS_PAR_OUVRAGE = 0.2
+DEMANDES_PAR_OUVRAGE = 0.3
+EXEMPLAIRES_MAX = 12
+EMPRUNTS_HISTORIQUES_MAX = 30
+FILE_MAX = 10
+
+PRENOMS = [
+    'Jean', 'Marie', 'Pierre', 'Sophie', 'Luc', 'Emma', 'Louis', 'Alice', 'Hugo', 'Chloe', 'Paul', 'Lea',
+    'Amadou', 'Fatoumata', 'Moussa', 'Aminata', 'Ibrahim', 'Mariam', 'Oumar', 'Awa', 'Jules', 'Camille',
+]
+NOMS = [
+    'Martin', 'Bernard', 'Dubois', 'Thomas', 'Robert', 'Richard', 'Petit', 'Durand', 'Leroy', 'Moreau',
+    'Haidara', 'Traore', 'Diallo', 'Keita', 'Coulibaly', 'Toure', 'Diarra', 'Sangare', 'Cisse', 'Kone',
+]
+MOTS_TITRE = [
+    'jardin', 'nuit', 'riviere', 'voyage', 'memoire', 'silence', 'ville', 'ombre', 'royaume', 'desert',
+    'lumiere', 'secret', 'mer', 'foret', 'saison', 'empire', 'chemin', 'etoile', 'maison', 'fleuve',
+]
+ADJECTIFS = [
+    'perdu', 'dernier', 'eternel', 'rouge', 'lointain', 'oublie', 'sauvage', 'premier', 'cache', 'noir',
+]
+EDITEURS = ['Gallimard', 'Hachette', 'Flammarion', 'Le Seuil', 'Albin Michel', 'Presence Africaine', 'Actes Sud']
+# Categories et poids relatifs : le roman domine
+CATEGORIES = [
+    ('Roman', 30), ('Jeunesse', 15), ('Policier', 12), ('Science-fiction', 8), ('Fantasy', 8),
+    ('Histoire', 7), ('Philosophie', 5), ('Sciences', 5), ('Poesie', 4), ('Theatre', 3), ('Droit', 3),
+]
+
+
+def _biaise(alea, n, exposant=3.0):
+    """Indice dans [0, n) tire avec un fort biais vers 0 (loi de puissance)."""
+    return int(n * alea.random() ** exposant)
+
+
+def _isbn(rang):
+    """ISBN-13 valide et unique pour le rang (prefixe 979-10 reserve a l'exemple)."""
+    corps = f'97910{rang:07d}'
+    somme = sum(int(c) * (3 if i % 2 else 1) for i, c in enumerate(corps))
+    return f'{corps}{(10 - somme % 10) % 10}'
+
+
+class Generateur:
+    """Etat d'une generation : tirages aleatoires, identifiants deja attribues, compteurs."""
+
+    def __init__(self, echelle, graine=1, reference=None):
+        if not ECHELLE_MIN <= echelle <= ECHELLE_MAX:
+            raise ValueError(f'echelle hors de [{ECHELLE_MIN}, {ECHELLE_MAX}] : {echelle}')
+        self.echelle = echelle
+        self.alea = random.Random(graine)
+        self.reference = reference or datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+        self.nb_usagers = max(100, int(echelle * USAGERS_PAR_OUVRAGE))
+        self.poids_categories = [poids for _, poids in CATEGORIES]
+        self.prochains = {'exemplaires': 1, 'emprunts': 1, 'reservations': 1, 'demandes_usager': 1}
+        self.compteurs = {table: 0 for table in (
+            'usagers', 'ouvrages', 'exemplaires', 'emprunts', 'reservations', 'demandes_usager'
+        )}
+        self.bibliothecaire_id = None
+
+    def _date(self, jours_min, jours_max):
+        """Date situee entre ``jours_max`` et ``jours_min`` jours avant la reference."""
+        return self.reference - timedelta(seconds=self.alea.randint(jours_min * 86400, jours_max * 86400))
+
+    def _usager(self):
+        return 1 + _biaise(self.alea, self.nb_usagers, 2.5)
+
+    def _ids(self, table, nombre):
+        premier = self.prochains[table]
+        self.prochains[table] += nombre
+        return range(premier, premier + nombre)
+
+    # ---------------------------------------------------------------- usagers
+
+    def usagers(self, taille_lot=TAILLE_LOT):
+        """Genere les usagers par lots ; tous partagent le mot de passe ``MOT_DE_PASSE``."""
+        alea = self.alea
+        hash_commun = hacher_mot_de_passe(MOT_DE_PASSE)
+        for debut in range(1, self.nb_usagers + 1, taille_lot):
+            lot = []
+            for usager_id in range(debut, min(debut + taille_lot, self.nb_usagers + 1)):
+                prenom, nom = alea.choice(PRENOMS), alea.choice(NOMS)
+                inscription = self._date(30, 5 * 365)
+                lot.append({
+                    'id': usager_id,
+                    'nom': nom,
+                    'prenom': prenom,
+                    'email': f'{prenom.lower()}.{nom.lower()}.{usager_id}@exemple.org',
+                    'telephone': f'07{alea.randint(0, 99999999):08d}',
+                    'adresse': f'{alea.randint(1, 200)} rue {alea.choice(NOMS)}, Bamako',
+                    'password_hash': hash_commun,
+                    'date_inscription': inscription,
+                    'statut': alea.choices(('actif', 'suspendu', 'inactif'), (92, 5, 3))[0],
+                    'version': 1,
+                    'date_modification': inscription,
+                })
+            yield lot
+
+    # --------------------------------------------------------------- ouvrages
+
+    def lot_ouvrages(self, premier, nombre):
+        """Lignes de toutes les tables pour les ouvrages ``premier`` .. ``premier + nombre - 1``."""
+        alea = self.alea
+        lignes = {'ouvrages': [], 'exemplaires': [], 'emprunts': [], 'pointeurs': [],
+                  'reservations': [], 'demandes_usager': []}
+        for ouvrage_id in range(premier, premier + nombre):
+            # 1 pour le plus emprunte, proche de 0 pour la longue traine
+            popularite = (1 - (ouvrage_id - 1) / self.echelle) ** 8
+            nb_exemplaires = 1 + int(alea.random() * popularite * (EXEMPLAIRES_MAX - 1))
+            ajout = self._date(60, 10 * 365)
+            isbn = _isbn(ouvrage_id)
+            en_pret = self._exemplaires(lignes, ouvrage_id, isbn, nb_exemplaires, ajout, popularite)
+            lignes['ouvrages'].append({
+                'id': ouvrage_id,
+                'titre': f'{alea.choice(("Le", "La", "Un", "Une"))} {alea.choice(MOTS_TITRE)} '
+                         f'{alea.choice(ADJECTIFS)} {alea.choice(MOTS_TITRE)}',
+                'auteur': f'{alea.choice(PRENOMS)} {NOMS[_biaise(alea, len(NOMS), 1.5)]}',
+                'isbn': isbn,
+                'annee_publication': 2025 - _biaise(alea, 175, 2),
+                'editeur': alea.choice(EDITEURS),
+                'categorie': alea.choices(CATEGORIES, self.poids_categories)[0][0],
+                'description': f'Un recit sur {alea.choice(MOTS_TITRE)} et {alea.choice(MOTS_TITRE)}.',
+                'nombre_exemplaires': nb_exemplaires,
+                'copies_available': nb_exemplaires - en_pret,
+                'date_ajout': ajout,
+                'version': 1,
+                'date_modification': ajout,
+            })
+            if en_pret == nb_exemplaires:
+                self._file(lignes, ouvrage_id, popularite)
+
+        for _ in range(int(nombre * DEMANDES_PAR_OUVRAGE)):
+            self._demande(lignes, premier + _biaise(alea, nombre, 2))
+        return lignes
+
+    def _exemplaires(self, lignes, ouvrage_id, isbn, nombre, ajout, popularite):
+        """Exemplaires de l'ouvrage et leurs emprunts ; retourne le nombre d'exemplaires en pret."""
+        alea = self.alea
+        en_pret = 0
+        for rang, exemplaire_id in enumerate(self._ids('exemplaires', nombre), start=1):
+            etat = alea.choices(('bon', 'abime', 'perdu'), (90, 8, 2))[0]
+            lignes['exemplaires'].append({
+                'id': exemplaire_id, 'ouvrage_id': ouvrage_id, 'numero': f'{isbn}-{rang:03d}',
+                'etat': etat, 'date_acquisition': ajout,
+            })
+            historiques = int(alea.random() * popularite * EMPRUNTS_HISTORIQUES_MAX) + (alea.random() < 0.3)
+            for _ in range(historiques):
+                debut = self._date(45, 3 * 365)
+                self._emprunt(lignes, exemplaire_id, debut, 'retourne',
+                              date_retour_reelle=debut + timedelta(days=alea.randint(3, 35)))
+            if etat != 'perdu' and alea.random() < 0.05 + 0.9 * popularite:
+                debut = self._date(0, 40)
+                statut = 'en_retard' if debut + timedelta(days=21) < self.reference else 'en_cours'
+                emprunt_id = self._emprunt(lignes, exemplaire_id, debut, statut)
+                lignes['pointeurs'].append({'b_id': exemplaire_id, 'b_emprunt': emprunt_id})
+                en_pret += 1
+        return en_pret
+
+    def _emprunt(self, lignes, exemplaire_id, debut, statut, date_retour_reelle=None):
+        emprunt_id = self._ids('emprunts', 1)[0]
+        lignes['emprunts'].append({
+            'id': emprunt_id, 'usager_id': self._usager(), 'exemplaire_id': exemplaire_id,
+            'date_emprunt': debut, 'date_retour_prevue': debut + timedelta(days=21),
+            'date_retour_reelle': date_retour_reelle, 'statut': statut,
+            'prolongations': self.alea.choices((0, 1, 2), (80, 15, 5))[0],
+        })
+        return emprunt_id
+
+    def _file(self, lignes, ouvrage_id, popularite):
+        """File de reservations actives (priorites denses 1..n) d'un ouvrage entierement prete."""
+        alea = self.alea
+        longueur = int(alea.random() * popularite * FILE_MAX)
+        usagers = []
+        for _ in range(longueur * 3):
+            if len(usagers) == longueur:
+                break
+            usager_id = self._usager()
+            if usager_id not in usagers:
+                usagers.append(usager_id)
+        dates = sorted(self._date(0, 6) for _ in usagers)
+        for priorite, (usager_id, date) in enumerate(zip(usagers, dates), start=1):
+            lignes['reservations'].append({
+                'id': self._ids('reservations', 1)[0], 'usager_id': usager_id, 'ouvrage_id': ouvrage_id,
+                'date_reservation': date, 'date_expiration': date + timedelta(days=7),
+                'statut': 'active', 'priorite': priorite,
+            })
+        # Reservations closes, hors file
+        for _ in range(int(alea.random() * popularite * FILE_MAX)):
+            date = self._date(10, 2 * 365)
+            lignes['reservations'].append({
+                'id': self._ids('reservations', 1)[0], 'usager_id': self._usager(), 'ouvrage_id': ouvrage_id,
+                'date_reservation': date, 'date_expiration': date + timedelta(days=7),
+                'statut': alea.choices(('honoree', 'annulee'), (70, 30))[0], 'priorite': None,
+            })
+
+    def _demande(self, lignes, ouvrage_id):
+        alea = self.alea
+        creation = self._date(0, 60)
+        statut = alea.choices(('en_attente', 'acceptee', 'refusee'), (15, 65, 20))[0]
+        traitee = statut != 'en_attente'
+        lignes['demandes_usager'].append({
+            'id': self._ids('demandes_usager', 1)[0], 'usager_id': self._usager(), 'ouvrage_id': ouvrage_id,
+            'type_demande': alea.choices(('emprunt', 'reservation'), (70, 30))[0], 'statut': statut,
+            'commentaire': None, 'commentaire_admin': 'Traitee' if traitee else None,
+            'date_creation': creation,
+            'date_traitement': creation + timedelta(hours=alea.randint(1, 72)) if traitee else None,
+            'bibliothecaire_id': self.bibliothecaire_id if traitee else None,
+        })
+
+
+_ORDRE = (
+    ('ouvrages', Ouvrage), ('exemplaires', Exemplaire), ('emprunts', Emprunt),
+    ('reservations', Reservation), ('demandes_usager', DemandeUsager),
+)
+
+
+def _inserer(connexion, generateur, lignes):
+    for table, modele in _ORDRE:
+        if lignes[table]:
+            connexion.execute(insert(modele.__table__), lignes[table])
+            generateur.compteurs[table] += len(lignes[table])
+    # Les exemplaires existent avant leurs emprunts : le pointeur est pose ensuite
+    if lignes['pointeurs']:
+        connexion.execute(
+            update(Exemplaire.__table__)
+            .where(Exemplaire.__table__.c.id == bindparam('b_id'))
+            .values(emprunt_courant_id=bindparam('b_emprunt')),
+            lignes['pointeurs'],
+        )
+
+
+def base_vide():
+    return not any(db.session.scalar(select(func.count()).select_from(modele)) for modele in (Usager, Ouvrage))
+
+
+def vider():
+    """Supprime les donnees de circulation, le catalogue et les usagers (pas les bibliothecaires)."""
+    db.session.execute(update(Exemplaire).values(emprunt_courant_id=None))
+    for modele in (DemandeUsager, Reservation, Emprunt, Exemplaire, Ouvrage, Usager):
+        db.session.execute(delete(modele))
+    db.session.commit()
+
+
+def generer(echelle, graine=1, reference=None, taille_lot=TAILLE_LOT, progression=None):
+    """Remplit une base vide ; retourne le nombre de lignes inserees par table.
+
+    ``progression(compteurs)`` est appelee apres chaque lot valide.
+    """
+    if not base_vide():
+        raise ValueError('La base contient deja des usagers ou des ouvrages (voir vider())')
+    generateur = Generateur(echelle, graine, reference)
+    generateur.bibliothecaire_id = db.session.scalar(select(func.min(Bibliothecaire.id)))
+    db.session.commit()
+
+    for lot in generateur.usagers(taille_lot):
+        with db.engine.begin() as connexion:
+            connexion.execute(insert(Usager.__table__), lot)
+        generateur.compteurs['usagers'] += len(lot)
+    for premier in range(1, echelle + 1, taille_lot):
+        lignes = generateur.lot_ouvrages(premier, min(taille_lot, echelle + 1 - premier))
+        with db.engine.begin() as connexion:
+            _inserer(connexion, generateur, lignes)
+        if progression:
+            progression(generateur.compteurs)
+
+    with db.engine.begin() as connexion:
+        if connexion.dialect.name == 'postgresql':
+            # Identifiants fournis explicitement : les sequences reprennent apres le dernier
+            for table in generateur.compteurs:
+                connexion.exec_driver_sql(
+                    f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), (SELECT max(id) FROM {table}))"
+                )
+        # Statistiques du planificateur a jour pour des tables passees de 0 a n lignes
+        connexion.exec_driver_sql('ANALYZE')
+    return generateur.compteurs
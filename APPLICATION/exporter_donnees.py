@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Script d'export en flux des emprunts, usagers, réservations ou demandes
+Exécutez: python exporter_donnees.py emprunts [--format jsonl] [--debut 2024-01-01] [--fin 2024-12-31]
+                                   [--statut retourne en_retard] [--sortie emprunts.csv]
+
+Sans --sortie, l'export est écrit sur la sortie standard.
+"""
+
+import argparse
+import sys
+import time
+
+from app import app
+from exports import EXPORTS, FORMATS, exporter, lire_date
+
+
+def exporter_donnees(nom, format='csv', debut=None, fin=None, statuts=None, sortie=None):
+    """Écrit l'export morceau par morceau et affiche le bilan sur la sortie d'erreur"""
+
+    with app.app_context():
+        debut_export = time.monotonic()
+        fichier = open(sortie, 'w', encoding='utf-8', newline='') if sortie else sys.stdout
+        octets = 0
+        try:
+            for morceau in exporter(nom, format, debut, fin, statuts):
+                fichier.write(morceau)
+                octets += len(morceau)
+        finally:
+            if sortie:
+                fichier.close()
+
+        print("=" * 60, file=sys.stderr)
+        print(f"📤 Export {nom} ({format}) : {octets / 1024:.0f} Kio en "
+              f"{time.monotonic() - debut_export:.1f} s" + (f" -> {sortie}" if sortie else ""), file=sys.stderr)
+        print("=" * 60, file=sys.stderr)
+        return octets
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('nom', choices=list(EXPORTS), help='données à exporter')
+    parser.add_argument('--format', choices=list(FORMATS), default='csv')
+    parser.add_argument('--debut', type=lire_date, help='date de début incluse (AAAA-MM-JJ)')
+    parser.add_argument('--fin', type=lire_date, help='date de fin incluse (AAAA-MM-JJ)')
+    parser.add_argument('--statut', nargs='+', help='statuts à garder (tous par défaut)')
+    parser.add_argument('--sortie', help='fichier de sortie (sortie standard par défaut)')
+    args = parser.parse_args()
+
+    exporter_donnees(args.nom, args.format, args.debut, args.fin, args.statut, args.sortie)
@@ -0,0 +1,171 @@
+"""Exports en flux (CSV ou JSONL) des emprunts, usagers, reservations et demandes.
+
+Les lignes sont lues par ``yield_per`` (curseur serveur sous PostgreSQL,
+curseur incremental sous SQLite) et serialisees au fil de l'eau en
+morceaux de quelques dizaines de Kio : un export de plusieurs millions de
+lignes ne tient jamais en memoire, ni dans un worker (reponse HTTP
+decoupee) ni dans le script ``exporter_donnees.py``.
+"""
+
+import csv
+import io
+import json
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import select
+
+from database import db
+from models import DemandeUsager, Emprunt, Exemplaire, Ouvrage, Reservation, Usager
+
+TAILLE_LOT = 1000
+TAILLE_MORCEAU = 64 * 1024
+
+FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+}
+
+# Premiers caracteres d'une formule de tableur (nom, commentaire ou adresse saisis par un usager)
+DEBUTS_FORMULE = ('=', '+', '-', '@', '\t', '\r')
+
+
+def _emprunts():
+    return (
+        select(
+            Emprunt.id, Emprunt.usager_id, Usager.nom.label('usager_nom'), Usager.prenom.label('usager_prenom'),
+            Usager.email.label('usager_email'), Emprunt.exemplaire_id, Exemplaire.numero.label('exemplaire_numero'),
+            Ouvrage.id.label('ouvrage_id'), Ouvrage.titre.label('ouvrage_titre'), Ouvrage.isbn.label('ouvrage_isbn'),
+            Emprunt.date_emprunt, Emprunt.date_retour_prevue, Emprunt.date_retour_reelle,
+            Emprunt.statut, Emprunt.prolongations,
+        )
+        .join(Usager, Emprunt.usager_id == Usager.id)
+        .join(Exemplaire, Emprunt.exemplaire_id == Exemplaire.id)
+        .join(Ouvrage, Exemplaire.ouvrage_id == Ouvrage.id)
+    )
+
+
+def _usagers():
+    # Jamais de password_hash dans un export
+    return select(
+        Usager.id, Usager.nom, Usager.prenom, Usager.email, Usager.telephone, Usager.adresse,
+        Usager.statut, Usager.date_inscription,
+    )
+
+
+def _reservations():
+    return (
+        select(
+            Reservation.id, Reservation.usager_id, Usager.nom.label('usager_nom'),
+            Usager.prenom.label('usager_prenom'), Reservation.ouvrage_id, Ouvrage.titre.label('ouvrage_titre'),
+            Reservation.date_reservation, Reservation.date_expiration, Reservation.statut, Reservation.priorite,
+        )
+        .join(Usager, Reservation.usager_id == Usager.id)
+        .join(Ouvrage, Reservation.ouvrage_id == Ouvrage.id)
+    )
+
+
+def _demandes():
+    return (
+        select(
+            DemandeUsager.id, DemandeUsager.usager_id, Usager.nom.label('usager_nom'),
+            Usager.prenom.label('usager_prenom'), DemandeUsager.ouvrage_id, Ouvrage.titre.label('ouvrage_titre'),
+            DemandeUsager.type_demande, DemandeUsager.statut, DemandeUsager.commentaire,
+            DemandeUsager.commentaire_admin, DemandeUsager.date_creation, DemandeUsager.date_traitement,
+            DemandeUsager.bibliothecaire_id,
+        )
+        .join(Usager, DemandeUsager.usager_id == Usager.id)
+        .join(Ouvrage, DemandeUsager.ouvrage_id == Ouvrage.id)
+    )
+
+
+# nom -> (requete de base, colonne de date filtree, colonne de statut, cle primaire)
+EXPORTS = {
+    'emprunts': (_emprunts, Emprunt.date_emprunt, Emprunt.statut, Emprunt.id),
+    'usagers': (_usagers, Usager.date_inscription, Usager.statut, Usager.id),
+    'reservations': (_reservations, Reservation.date_reservation, Reservation.statut, Reservation.id),
+    'demandes': (_demandes, DemandeUsager.date_creation, DemandeUsager.statut, DemandeUsager.id),
+}
+
+
+def lire_date(valeur):
+    """'AAAA-MM-JJ' -> date, None si vide ; leve ValueError si mal formee."""
+    if not valeur:
+        return None
+    return datetime.strptime(valeur, '%Y-%m-%d').date()
+
+
+def requete_export(nom, debut=None, fin=None, statuts=None):
+    """Requete de l'export ``nom`` ; ``debut`` et ``fin`` (dates) sont inclus.
+
+    Le tri suit la cle primaire : la base renvoie les premieres lignes tout
+    de suite, sans trier la table entiere avant d'envoyer quoi que ce soit.
+    """
+    base, colonne_date, colonne_statut, colonne_id = EXPORTS[nom]
+    requete = base()
+    if debut:
+        requete = requete.where(colonne_date >= datetime.combine(debut, datetime.min.time()))
+    if fin:
+        requete = requete.where(colonne_date < datetime.combine(fin + timedelta(days=1), datetime.min.time()))
+    if statuts:
+        requete = requete.where(colonne_statut.in_(statuts))
+    return requete.order_by(colonne_id)
+
+
+def lignes(requete, taille_lot=TAILLE_LOT):
+    """Genere les lignes (dict) de la requete sans les charger toutes."""
+    resultat = db.session.execute(requete.execution_options(yield_per=taille_lot))
+    try:
+        for ligne in resultat.mappings():
+            yield dict(ligne)
+    finally:
+        resultat.close()
+
+
+def _valeur(valeur):
+    if isinstance(valeur, (datetime, date)):
+        return valeur.isoformat()
+    return valeur
+
+
+def _cellule_csv(valeur):
+    """Valeur d'une cellule CSV : un texte qu'un tableur lirait comme une formule est prefixe d'une apostrophe"""
+    valeur = _valeur(valeur)
+    if isinstance(valeur, str) and valeur.startswith(DEBUTS_FORMULE):
+        return "'" + valeur
+    return valeur
+
+
+def en_csv(colonnes, flux):
+    """Serialise en CSV par morceaux d'environ ``TAILLE_MORCEAU`` caracteres."""
+    tampon = io.StringIO()
+    ecrivain = csv.writer(tampon)
+    ecrivain.writerow(colonnes)
+    for ligne in flux:
+        ecrivain.writerow([_cellule_csv(ligne[c]) for c in colonnes])
+        if tampon.tell() >= TAILLE_MORCEAU:
+            yield tampon.getvalue()
+            tampon.seek(0)
+            tampon.truncate()
+    yield tampon.getvalue()
+
+
+def en_jsonl(colonnes, flux):
+    """Serialise en JSON Lines par morceaux d'environ ``TAILLE_MORCEAU`` caracteres."""
+    morceau, taille = [], 0
+    for ligne in flux:
+        texte = json.dumps({c: _valeur(ligne[c]) for c in colonnes}, ensure_ascii=False) + '\n'
+        morceau.append(texte)
+        taille += len(texte)
+        if taille >= TAILLE_MORCEAU:
+            yield ''.join(morceau)
+            morceau, taille = [], 0
+    if morceau:
+        yield ''.join(morceau)
+
+
+def exporter(nom, format='csv', debut=None, fin=None, statuts=None, taille_lot=TAILLE_LOT):
+    """Genere le contenu de l'export par morceaux de texte."""
+    requete = requete_export(nom, debut, fin, statuts)
+    colonnes = [colonne.key for colonne in requete.selected_columns]
+    serialiser = en_jsonl if format == 'jsonl' else en_csv
+    return serialiser(colonnes, lignes(requete, taille_lot))
@@ -0,0 +1,123 @@
+"""File d'attente des reservations d'un ouvrage.
+
+Les reservations actives d'un ouvrage portent des priorites denses 1..n.
+Toute entree ou sortie de file passe par ce module :
+
+- la mise en file verrouille l'ouvrage (``FOR UPDATE`` sous PostgreSQL,
+  ``BEGIN IMMEDIATE`` sous SQLite) puis lit la derniere priorite par l'index
+  ``ix_reservations_file`` : deux requetes simultanees ne peuvent pas obtenir
+  le meme rang, et l'index unique ``ux_reservations_usager_actif`` refuse
+  une seconde reservation active du meme usager ;
+- la tete de file est lue par le meme index (``LIMIT 1``, sans tri) ;
+- une annulation, un retrait ou une expiration recompacte la file par un
+  ``UPDATE`` ensembliste, sans charger les reservations.
+
+L'appelant reste responsable du commit.
+"""
+
+from sqlalchemy import func, select, update
+from sqlalchemy.exc import IntegrityError
+
+from database import db, verrouiller_ecriture
+from models import Ouvrage, Reservation
+from signaux import noter
+
+ORDRE_FILE = (Reservation.priorite, Reservation.date_reservation, Reservation.id)
+
+
+def _actives(ouvrage_id):
+    return (Reservation.ouvrage_id == ouvrage_id, Reservation.statut == 'active')
+
+
+def mettre_en_file(usager_id, ouvrage_id):
+    """Ajoute l'usager en queue de file ; retourne ``(reservation, message)``.
+
+    ``reservation`` vaut None si l'usager a deja une reservation active pour
+    cet ouvrage.
+    """
+    verrouiller_ecriture()
+    db.session.execute(select(Ouvrage.id).where(Ouvrage.id == ouvrage_id).with_for_update())
+
+    existante = db.session.scalar(
+        select(Reservation.id).where(Reservation.usager_id == usager_id, *_actives(ouvrage_id)).limit(1)
+    )
+    if existante:
+        return None, 'Reservation active deja existante pour cet usager et cet ouvrage'
+
+    derniere = db.session.scalar(
+        select(Reservation.priorite)
+        .where(*_actives(ouvrage_id))
+        .order_by(Reservation.priorite.desc())
+        .limit(1)
+    )
+    reservation = Reservation(usager_id=usager_id, ouvrage_id=ouvrage_id, priorite=(derniere or 0) + 1)
+    try:
+        with db.session.begin_nested():
+            db.session.add(reservation)
+    except IntegrityError:
+        return None, 'Reservation active deja existante pour cet usager et cet ouvrage'
+    return reservation, 'Reservation creee avec succes'
+
+
+def tete_de_file(ouvrage_id):
+    """Premiere reservation active de l'ouvrage, ou None."""
+    return db.session.scalars(
+        select(Reservation).where(*_actives(ouvrage_id)).order_by(*ORDRE_FILE).limit(1)
+    ).first()
+
+
+def retirer_de_file(reservation, statut):
+    """Sort une reservation active de la file (annulee, honoree...) et decale les suivantes.
+
+    Retourne False si la reservation n'etait plus active.
+    """
+    if reservation.statut != 'active':
+        return False
+    reservation.statut = statut
+    db.session.flush()
+
+    if reservation.priorite is not None:
+        db.session.execute(
+            update(Reservation)
+            .where(*_actives(reservation.ouvrage_id), Reservation.priorite > reservation.priorite)
+            .values(priorite=Reservation.priorite - 1)
+            .execution_options(synchronize_session='evaluate')
+        )
+        noter(db.session, Reservation.__tablename__)
+    return True
+
+
+def promouvoir(ouvrage_id):
+    """Un exemplaire revient en rayon : la tete de file passe au statut 'honoree'.
+
+    Retourne la reservation promue (usager a prevenir), ou None si la file est vide.
+    """
+    reservation = tete_de_file(ouvrage_id)
+    if reservation is not None:
+        retirer_de_file(reservation, 'honoree')
+    return reservation
+
+
+def renumeroter_file(ouvrage_id):
+    """Redonne les priorites 1..n aux reservations actives d'un ouvrage, dans l'ordre actuel.
+
+    Un seul ``UPDATE ... FROM`` sur les lignes dont le rang change ; retourne
+    le nombre de lignes modifiees.
+    """
+    rangs = (
+        select(
+            Reservation.id,
+            func.row_number().over(order_by=ORDRE_FILE).label('rang'),
+        )
+        .where(*_actives(ouvrage_id))
+        .subquery()
+    )
+    resultat = db.session.execute(
+        update(Reservation)
+        .where(Reservation.id == rangs.c.id, Reservation.priorite.is_distinct_from(rangs.c.rang))
+        .values(priorite=rangs.c.rang)
+        .execution_options(synchronize_session=False)
+    )
+    if resultat.rowcount:
+        noter(db.session, Reservation.__tablename__)
+    return resultat.rowcount
@@ -0,0 +1,181 @@
+"""Cache des fragments HTML des ouvrages (cartes du catalogue, fiche detaillee).
+
+La partie bibliographique d'une carte ou d'une fiche (titre, auteur, ISBN,
+description...) est rendue une fois par ``(gabarit, ouvrage.id, notice)``
+puis reutilisee ; la disponibilite, qui change a chaque pret, est rendue a
+chaque requete et inseree a l'emplacement prevu. ``notice`` est une empreinte
+des seules colonnes affichees par les fragments (``COLONNES_NOTICE``) :
+``ouvrages.version``, incrementee a chaque pret et retour, viderait le cache
+des ouvrages les plus consultes. Un fragment perime n'est jamais relu, il
+sort du cache par eviction.
+
+Deux stockages bornes :
+
+- ``memoire`` : LRU propre au worker (defaut) ;
+- ``fichier`` : un fichier par fragment dans ``FRAGMENTS_DOSSIER``, partage
+  par les workers d'une meme machine et conserve entre deux redemarrages.
+"""
+
+import hashlib
+import os
+import threading
+
+from flask import current_app
+from markupsafe import Markup
+
+from cache import CacheTTL
+from cache_http import EMPREINTE_TEMPLATES
+
+TAILLE_FRAGMENTS = 4096
+DUREE_FRAGMENTS = 24 * 3600
+EMPLACEMENT = '<!--fragment:direct-->'
+# Colonnes lues par _carte_ouvrage.html et _detail_ouvrage.html
+COLONNES_NOTICE = (
+    'titre', 'auteur', 'isbn', 'annee_publication', 'editeur', 'categorie', 'description', 'nombre_exemplaires',
+)
+
+
+class FragmentsMemoire:
+    """Fragments dans un LRU du worker."""
+
+    nom = 'memoire'
+
+    def __init__(self, taille_max=TAILLE_FRAGMENTS):
+        self._cache = CacheTTL(duree=DUREE_FRAGMENTS, taille_max=taille_max)
+
+    def lire(self, cle):
+        trouve, html = self._cache.lire(cle)
+        return html if trouve else None
+
+    def ecrire(self, cle, html):
+        self._cache.ecrire(cle, html)
+
+    def vider(self):
+        self._cache.invalider()
+
+    def statistiques(self):
+        return self._cache.statistiques()
+
+
+class FragmentsFichier:
+    """Fragments dans des fichiers ; au-dela de ``taille_max``, les moins recemment lus sont supprimes."""
+
+    nom = 'fichier'
+
+    def __init__(self, dossier, taille_max=TAILLE_FRAGMENTS):
+        self.dossier = dossier
+        self.taille_max = taille_max
+        self.succes = 0
+        self.echecs = 0
+        self._verrou = threading.Lock()
+        os.makedirs(dossier, exist_ok=True)
+        self._nombre = sum(1 for nom in os.listdir(dossier) if nom.endswith('.html'))
+
+    def _chemin(self, cle):
+        nom = hashlib.sha1(repr(cle).encode()).hexdigest()
+        return os.path.join(self.dossier, f'{nom}.html')
+
+    def lire(self, cle):
+        chemin = self._chemin(cle)
+        try:
+            with open(chemin, encoding='utf-8') as fichier:
+                html = fichier.read()
+            os.utime(chemin)
+        except FileNotFoundError:
+            self.echecs += 1
+            return None
+        self.succes += 1
+        return html
+
+    def ecrire(self, cle, html):
+        chemin = self._chemin(cle)
+        temporaire = f'{chemin}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(temporaire, 'w', encoding='utf-8') as fichier:
+            fichier.write(html)
+        os.replace(temporaire, chemin)
+        with self._verrou:
+            self._nombre += 1
+            if self._nombre > self.taille_max:
+                self._evincer()
+
+    def _evincer(self):
+        """Garde les 90 % les plus recemment utilises"""
+        fichiers = []
+        for entree in os.scandir(self.dossier):
+            if entree.name.endswith('.html'):
+                try:
+                    fichiers.append((entree.stat().st_mtime, entree.path))
+                except FileNotFoundError:
+                    continue
+        fichiers.sort()
+        a_garder = self.taille_max * 9 // 10
+        for _, chemin in fichiers[:max(len(fichiers) - a_garder, 0)]:
+            try:
+                os.remove(chemin)
+            except FileNotFoundError:
+                pass
+        self._nombre = min(len(fichiers), a_garder)
+
+    def vider(self):
+        for entree in os.scandir(self.dossier):
+            if entree.name.endswith('.html'):
+                os.remove(entree.path)
+        self._nombre = 0
+
+    def statistiques(self):
+        return {'succes': self.succes, 'echecs': self.echecs, 'entrees': self._nombre}
+
+
+def creer_stockage(config):
+    """Stockage decrit par ``FRAGMENTS_STOCKAGE`` ('memoire', 'fichier' ; vide = pas de cache)."""
+    type_stockage = config.get('FRAGMENTS_STOCKAGE', 'memoire')
+    taille = config.get('FRAGMENTS_TAILLE', TAILLE_FRAGMENTS)
+    if type_stockage == 'memoire':
+        return FragmentsMemoire(taille)
+    if type_stockage == 'fichier':
+        return FragmentsFichier(config['FRAGMENTS_DOSSIER'], taille)
+    if not type_stockage:
+        return None
+    raise ValueError(f'FRAGMENTS_STOCKAGE inconnu : {type_stockage}')
+
+
+def _stockage():
+    return current_app.extensions.get('fragments')
+
+
+def empreinte_notice(ouvrage):
+    """Empreinte de la notice bibliographique : change avec une colonne de ``COLONNES_NOTICE``, pas avec un pret"""
+    notice = repr(tuple(getattr(ouvrage, colonne) for colonne in COLONNES_NOTICE))
+    return hashlib.sha1(notice.encode()).hexdigest()[:16]
+
+
+def fragment_ouvrage(gabarit, ouvrage, direct=''):
+    """Fragment ``gabarit`` rendu pour ``ouvrage`` ; ``direct`` (rendu a chaque
+    requete) remplace l'emplacement ``EMPLACEMENT`` du fragment."""
+    stockage = _stockage()
+    cle = (gabarit, ouvrage.id, empreinte_notice(ouvrage), EMPREINTE_TEMPLATES)
+    html = stockage.lire(cle) if stockage is not None else None
+    if html is None:
+        html = current_app.jinja_env.get_template(gabarit).render(ouvrage=ouvrage, emplacement=Markup(EMPLACEMENT))
+        if stockage is not None:
+            stockage.ecrire(cle, html)
+    return Markup(html.replace(EMPLACEMENT, str(direct)))
+
+
+def statistiques():
+    stockage = _stockage()
+    if stockage is None:
+        return {'stockage': None}
+    stats = stockage.statistiques()
+    lectures = stats['succes'] + stats['echecs']
+    stats.update(stockage=stockage.nom, taux_succes=round(stats['succes'] / lectures, 3) if lectures else None)
+    return stats
+
+
+def init_fragments(app):
+    """Cree le stockage des fragments et expose ``fragment_ouvrage`` aux gabarits."""
+    if not app.config.get('FRAGMENTS_DOSSIER'):
+        app.config['FRAGMENTS_DOSSIER'] = os.path.join(app.instance_path, 'fragments')
+    app.extensions['fragments'] = creer_stockage(app.config)
+    app.add_template_global(fragment_ouvrage)
+    return app.extensions['fragments']
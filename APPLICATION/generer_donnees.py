@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Script de génération d'un jeu de données synthétique à l'échelle
+Exécutez: python generer_donnees.py 100000 [--graine 1] [--reference 2026-01-01] [--vider]
+
+L'échelle est le nombre d'ouvrages (1 000 à 1 000 000) ; usagers,
+exemplaires, emprunts, réservations et demandes suivent, avec une
+répartition déséquilibrée (quelques ouvrages et usagers très actifs). Même
+graine et même date de référence : mêmes données. Tous les usagers ont le
+mot de passe « motdepasse ». La base doit être migrée (migrer_base.py) ;
+--vider supprime d'abord catalogue, usagers et circulation.
+"""
+
+import argparse
+import time
+from datetime import datetime
+
+from app import app
+from donnees_synthetiques import MOT_DE_PASSE, TAILLE_LOT, base_vide, generer, vider
+
+
+def generer_donnees(echelle, graine=1, reference=None, taille_lot=TAILLE_LOT, remplacer=False):
+    """Génère le jeu de données et affiche la progression puis le bilan"""
+
+    with app.app_context():
+        print("=" * 60)
+        print(f"🏭 JEU DE DONNÉES SYNTHÉTIQUE : {echelle} ouvrages (graine {graine})")
+        print("=" * 60)
+
+        if not base_vide():
+            if not remplacer:
+                print("❌ La base contient déjà des usagers ou des ouvrages (relancer avec --vider)")
+                return None
+            print("🗑️  Suppression des données existantes...")
+            vider()
+
+        debut = time.monotonic()
+
+        def progression(compteurs):
+            ecoule = time.monotonic() - debut
+            print(f"  ⏳ {compteurs['ouvrages']:>9} / {echelle} ouvrages, "
+                  f"{compteurs['emprunts']:>10} emprunts ({ecoule:.0f} s)", flush=True)
+
+        compteurs = generer(echelle, graine, reference, taille_lot, progression)
+
+        print("=" * 60)
+        for table, nombre in compteurs.items():
+            print(f"  📊 {table:<16} {nombre:>10}")
+        print(f"  🔑 Mot de passe des usagers : {MOT_DE_PASSE}")
+        print(f"\n✨ Généré en {time.monotonic() - debut:.1f} s")
+        print("=" * 60)
+        return compteurs
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('echelle', type=int, help="nombre d'ouvrages (1000 à 1000000)")
+    parser.add_argument('--graine', type=int, default=1, help='graine du générateur aléatoire')
+    parser.add_argument('--reference', type=datetime.fromisoformat,
+                        help="date de référence des emprunts et retards (AAAA-MM-JJ, aujourd'hui par défaut)")
+    parser.add_argument('--lot', type=int, default=TAILLE_LOT, help='ouvrages par transaction')
+    parser.add_argument('--vider', action='store_true', help='supprimer les données existantes')
+    args = parser.parse_args()
+
+    raise SystemExit(0 if generer_donnees(args.echelle, args.graine, args.reference, args.lot, args.vider) else 1)
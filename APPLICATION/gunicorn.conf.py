@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+
+"""
+Configuration gunicorn de production
+Exécutez: gunicorn -c gunicorn.conf.py app:app
+
+L'application est chargée une seule fois dans le processus maître
+(``preload_app``) : ``create_app`` n'ouvre aucune connexion, les workers
+partagent ses pages mémoire en copie sur écriture et démarrent sans
+réimporter le code. Chaque worker ouvre ensuite ses propres ressources
+(``init_processus``) : connexions, pool de hachage, planificateur,
+publication des métriques. Les métriques d'un worker remplacé sont
+reportées par le maître (``child_exit``), le dossier des métriques est vidé
+au démarrage.
+"""
+
+import gc
+import os
+
+preload_app = True
+workers = int(os.environ.get('WEB_CONCURRENCY', os.cpu_count() or 2))
+# Threads : un flux SSE occupe un thread pendant toute sa durée
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 32))
+
+
+def when_ready(server):
+    from metriques import vider_dossier
+    vider_dossier(server.app.wsgi())
+    # Objets du maître exclus du ramasse-miettes : ses passages dans les
+    # workers ne réécrivent plus les pages partagées
+    gc.freeze()
+
+
+def post_worker_init(worker):
+    from app import init_processus
+    init_processus(worker.wsgi)
+
+
+def worker_exit(server, worker):
+    # Dernier instantané, avec les requêtes servies depuis la dernière publication
+    if worker.wsgi is not None:
+        worker.wsgi.extensions['metriques'].publier()
+
+
+def child_exit(server, worker):
+    from metriques import reporter_termine
+    reporter_termine(server.app.wsgi(), worker.pid)
@@ -0,0 +1,151 @@
+"""Identite de la personne connectee (usager ou bibliothecaire).
+
+L'identite est lue une seule fois par requete (memorisee dans ``g``) et,
+d'une requete a l'autre, un instantane de quelques colonnes est garde dans
+un cache LRU borne a duree de vie limitee : une page authentifiee ne relit
+plus l'usager ni le bibliothecaire par cle primaire.
+
+Toute ecriture validee sur ``usagers`` ou ``bibliothecaires`` (changement
+de statut, suppression, nouveau mot de passe...) retire les instantanes
+concernes dans ce worker et touche le fichier ``IDENTITE_MARQUEUR`` (par
+defaut ``instance/identites.marqueur``) : chaque worker de la machine compare
+sa date de modification a chaque lecture d'identite et vide son cache quand
+elle change. Un usager suspendu ou supprime perd donc l'acces des la requete
+suivante, quel que soit le worker ; entre plusieurs machines, seule
+l'expiration (``IDENTITE_TTL`` secondes) s'applique.
+"""
+
+import os
+import threading
+import time
+
+from flask import current_app, g, has_app_context, session
+from flask_login import UserMixin
+from sqlalchemy import select
+
+from cache import CacheTTL
+from database import db
+from models import Bibliothecaire, Usager
+from signaux import abonner
+
+DUREE_IDENTITE = 60
+TAILLE_IDENTITES = 1024
+
+_identites = CacheTTL(duree=DUREE_IDENTITE, taille_max=TAILLE_IDENTITES)
+# Date de modification du marqueur lors de la derniere verification de ce worker
+_marqueur_vu = {'date': None}
+_verrou_marqueur = threading.Lock()
+
+
+class UsagerConnecte:
+    """Instantane en lecture seule de l'usager connecte."""
+
+    __slots__ = ('id', 'nom', 'prenom', 'email', 'statut')
+
+    def __init__(self, id, nom, prenom, email, statut):
+        self.id, self.nom, self.prenom, self.email, self.statut = id, nom, prenom, email, statut
+
+    def __repr__(self):
+        return f'<UsagerConnecte {self.id}>'
+
+
+class BibliothecaireConnecte(UserMixin):
+    """Instantane du bibliothecaire connecte, utilise comme ``current_user``."""
+
+    __slots__ = ('id', 'nom', 'prenom', 'login')
+
+    def __init__(self, id, nom, prenom, login):
+        self.id, self.nom, self.prenom, self.login = id, nom, prenom, login
+
+    def __repr__(self):
+        return f'<BibliothecaireConnecte {self.login}>'
+
+
+def _lire(modele, classe, identifiant):
+    colonnes = [getattr(modele, nom) for nom in classe.__slots__]
+    ligne = db.session.execute(select(*colonnes).where(modele.id == identifiant)).first()
+    return classe(*ligne) if ligne is not None else None
+
+
+def _chemin_marqueur():
+    return current_app.config.get('IDENTITE_MARQUEUR') or os.path.join(current_app.instance_path, 'identites.marqueur')
+
+
+def _date_marqueur():
+    try:
+        return os.stat(_chemin_marqueur()).st_mtime_ns
+    except FileNotFoundError:
+        return 0
+
+
+def _suivre_marqueur():
+    """Vide le cache si un autre worker a modifie une identite depuis la derniere verification"""
+    date = _date_marqueur()
+    with _verrou_marqueur:
+        if date != _marqueur_vu['date']:
+            if _marqueur_vu['date'] is not None:
+                _identites.invalider()
+            _marqueur_vu['date'] = date
+
+
+def _toucher_marqueur():
+    chemin = _chemin_marqueur()
+    try:
+        os.makedirs(os.path.dirname(chemin), exist_ok=True)
+        with open(chemin, 'a'):
+            pass
+        maintenant = time.time_ns()
+        os.utime(chemin, ns=(maintenant, maintenant))
+    except OSError:
+        current_app.logger.exception('Marqueur des identites inaccessible : %s', chemin)
+        return
+    with _verrou_marqueur:
+        _marqueur_vu['date'] = maintenant
+
+
+def _instantane(modele, classe, identifiant):
+    _suivre_marqueur()
+    duree = current_app.config.get('IDENTITE_TTL', DUREE_IDENTITE)
+    return _identites.obtenir(
+        (modele.__tablename__, identifiant), lambda: _lire(modele, classe, identifiant), duree
+    )
+
+
+def usager_connecte():
+    """Usager de la session courante, ou None ; une seule recherche par requete."""
+    if '_usager_connecte' not in g:
+        usager_id = session.get('usager_id')
+        g._usager_connecte = _instantane(Usager, UsagerConnecte, usager_id) if usager_id else None
+    return g._usager_connecte
+
+
+def bibliothecaire_connecte(bibliothecaire_id):
+    """Chargeur de Flask-Login (qui memorise deja ``current_user`` pour la requete)."""
+    return _instantane(Bibliothecaire, BibliothecaireConnecte, int(bibliothecaire_id))
+
+
+def oublier(table=None, identifiant=None):
+    """Retire l'instantane d'une identite, ou tous (ecriture sur des lignes inconnues)."""
+    _identites.invalider(None if identifiant is None else (table, identifiant))
+
+
+@abonner
+def _invalider_identites(changements):
+    modifiees = False
+    for modele in (Usager, Bibliothecaire):
+        table = modele.__tablename__
+        if table not in changements:
+            continue
+        modifiees = True
+        ids = changements[table]
+        if not ids:
+            oublier(table)
+        for identifiant in ids:
+            oublier(table, identifiant)
+    # Previent les autres workers de la machine
+    if modifiees and has_app_context():
+        _toucher_marqueur()
+
+
+def statistiques():
+    return _identites.statistiques()
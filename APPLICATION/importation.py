@@ -0,0 +1,304 @@
+"""Import en masse du catalogue (CSV ou JSONL).
+
+Le fichier est lu en flux par une chaine de generateurs (lecture,
+normalisation, dedoublonnage, decoupage en lots) : la memoire ne depend que
+de la taille d'un lot et de l'index des ISBN deja connus. Chaque lot est
+insere en une transaction par deux ``executemany`` (ouvrages puis
+exemplaires) sans passer par l'ORM ; un fichier de reprise, reecrit apres
+chaque lot valide, permet de relancer un import interrompu la ou il s'etait
+arrete.
+"""
+
+import csv
+import gzip
+import json
+import os
+from itertools import islice
+
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError
+
+from database import db, verrouiller_ecriture
+from models import Exemplaire, Ouvrage
+from signaux import publier
+
+TAILLE_LOT = 1000
+EXEMPLAIRES_MAX = 500
+
+# Noms de colonnes acceptes dans le fichier -> colonne de la table ouvrages
+ALIAS = {
+    'titre': 'titre', 'title': 'titre',
+    'auteur': 'auteur', 'author': 'auteur',
+    'isbn': 'isbn',
+    'annee_publication': 'annee_publication', 'annee': 'annee_publication', 'year': 'annee_publication',
+    'editeur': 'editeur', 'publisher': 'editeur',
+    'categorie': 'categorie', 'category': 'categorie',
+    'description': 'description',
+    'exemplaires': 'nombre_exemplaires', 'nombre_exemplaires': 'nombre_exemplaires',
+}
+
+_colonnes = Ouvrage.__table__.c
+
+
+class Rejet(ValueError):
+    """Enregistrement invalide, ecarte de l'import avec son motif."""
+
+
+def _ouvrir(chemin):
+    if chemin.endswith('.gz'):
+        return gzip.open(chemin, 'rt', encoding='utf-8-sig', newline='')
+    return open(chemin, encoding='utf-8-sig', newline='')
+
+
+def format_fichier(chemin):
+    """'csv' ou 'jsonl' d'apres l'extension (``.gz`` ignore)."""
+    nom = chemin[:-3] if chemin.endswith('.gz') else chemin
+    return 'jsonl' if nom.endswith(('.jsonl', '.ndjson', '.json')) else 'csv'
+
+
+def lire_enregistrements(chemin, format=None, separateur=','):
+    """Genere ``(rang, enregistrement)`` ; le rang (1, 2, ...) sert de point de reprise."""
+    format = format or format_fichier(chemin)
+    with _ouvrir(chemin) as fichier:
+        if format == 'csv':
+            lignes = csv.DictReader(fichier, delimiter=separateur)
+            for rang, enregistrement in enumerate(lignes, start=1):
+                yield rang, enregistrement
+            return
+
+        for rang, ligne in enumerate(fichier, start=1):
+            if not ligne.strip():
+                continue
+            try:
+                yield rang, json.loads(ligne)
+            except ValueError:
+                # La ligne brute est conservee pour le journal des rejets
+                yield rang, ligne.rstrip('\r\n')
+
+
+def normaliser_isbn(valeur):
+    isbn = ''.join(c for c in str(valeur or '') if c.isalnum()).upper()
+    return isbn or None
+
+
+def _entier(valeur, nom):
+    if valeur in (None, ''):
+        return None
+    try:
+        return int(str(valeur).strip())
+    except ValueError:
+        raise Rejet(f'{nom} non numerique : {valeur!r}')
+
+
+def normaliser(enregistrement):
+    """Transforme un enregistrement brut en ligne de la table ouvrages (leve ``Rejet``)."""
+    if isinstance(enregistrement, str):
+        raise Rejet('JSON invalide')
+    if not isinstance(enregistrement, dict):
+        raise Rejet('enregistrement mal forme')
+
+    ligne = {}
+    for cle, valeur in enregistrement.items():
+        colonne = ALIAS.get((cle or '').strip().lower())
+        if colonne and valeur not in (None, ''):
+            ligne[colonne] = valeur.strip() if isinstance(valeur, str) else valeur
+
+    for obligatoire in ('titre', 'auteur'):
+        if not ligne.get(obligatoire):
+            raise Rejet(f'{obligatoire} manquant')
+
+    ligne['isbn'] = normaliser_isbn(ligne.get('isbn'))
+    ligne['annee_publication'] = _entier(ligne.get('annee_publication'), 'annee')
+    exemplaires = _entier(ligne.get('nombre_exemplaires'), 'exemplaires')
+    exemplaires = 1 if exemplaires is None else exemplaires
+    if not 0 <= exemplaires <= EXEMPLAIRES_MAX:
+        raise Rejet(f'nombre d exemplaires hors limites : {exemplaires}')
+    ligne['nombre_exemplaires'] = exemplaires
+    ligne['copies_available'] = exemplaires
+
+    for nom, valeur in ligne.items():
+        longueur = getattr(_colonnes[nom].type, 'length', None)
+        if longueur and isinstance(valeur, str) and len(valeur) > longueur:
+            raise Rejet(f'{nom} trop long ({len(valeur)} > {longueur})')
+    return ligne
+
+
+def index_isbn():
+    """ISBN deja presents en base (normalises), lus en flux."""
+    connus = set()
+    requete = select(Ouvrage.isbn).where(Ouvrage.isbn.is_not(None)).execution_options(yield_per=10000)
+    for isbn in db.session.scalars(requete):
+        connus.add(normaliser_isbn(isbn))
+    return connus
+
+
+def preparer(enregistrements, connus):
+    """Normalise et dedoublonne sur l'ISBN.
+
+    Genere ``(rang, brut, resultat)`` ou ``resultat`` est la ligne a inserer,
+    un ``Rejet``, ou None pour un doublon (deja en base ou plus haut dans le
+    fichier). ``connus`` est complete au fil de l'eau.
+    """
+    for rang, brut in enregistrements:
+        try:
+            ligne = normaliser(brut)
+        except Rejet as e:
+            yield rang, brut, e
+            continue
+        if ligne['isbn']:
+            if ligne['isbn'] in connus:
+                yield rang, brut, None
+                continue
+            connus.add(ligne['isbn'])
+        yield rang, brut, ligne
+
+
+def par_lots(elements, taille):
+    iterateur = iter(elements)
+    while lot := list(islice(iterateur, taille)):
+        yield lot
+
+
+def _exemplaires(ouvrages_ids, lignes):
+    for ouvrage_id, ligne in zip(ouvrages_ids, lignes):
+        prefixe = ligne['isbn'] or ouvrage_id
+        for i in range(ligne['nombre_exemplaires']):
+            yield {'ouvrage_id': ouvrage_id, 'numero': f'{prefixe}-{i + 1:03d}', 'etat': 'bon'}
+
+
+def _inserer(connexion, lignes):
+    """Deux executemany ; retourne le nombre d'exemplaires crees."""
+    ids = connexion.execute(
+        insert(Ouvrage.__table__).returning(_colonnes.id, sort_by_parameter_order=True), lignes
+    ).scalars().all()
+    exemplaires = list(_exemplaires(ids, lignes))
+    if exemplaires:
+        connexion.execute(insert(Exemplaire.__table__), exemplaires)
+    return len(exemplaires)
+
+
+def inserer_lot(lignes):
+    """Insere un lot en une transaction ; retourne ``(exemplaires, rejets)``.
+
+    Si un ISBN a ete ajoute entre-temps par l'application, le lot est rejoue
+    ligne par ligne et seules les lignes en conflit sont rejetees.
+    """
+    try:
+        with db.engine.begin() as connexion:
+            return _inserer(connexion, [ligne for _, _, ligne in lignes]), []
+    except IntegrityError:
+        pass
+
+    exemplaires, rejets = 0, []
+    with db.engine.begin() as connexion:
+        verrouiller_ecriture(connexion)
+        for rang, brut, ligne in lignes:
+            try:
+                with connexion.begin_nested():
+                    exemplaires += _inserer(connexion, [ligne])
+            except IntegrityError:
+                rejets.append((rang, brut, Rejet('ISBN deja present en base')))
+    return exemplaires, rejets
+
+
+class Reprise:
+    """Point de reprise d'un import, stocke en JSON a cote du fichier source."""
+
+    def __init__(self, chemin, source):
+        self.chemin = chemin
+        self.signature = {'source': os.path.abspath(source), 'taille': os.path.getsize(source)}
+        self.etat = dict(_compteurs(), rang=0)
+
+    def charger(self):
+        if not os.path.exists(self.chemin):
+            return False
+        with open(self.chemin, encoding='utf-8') as fichier:
+            donnees = json.load(fichier)
+        if donnees.get('signature') != self.signature:
+            raise ValueError(f'{self.chemin} correspond a un autre fichier source')
+        self.etat.update(donnees['etat'])
+        return True
+
+    def enregistrer(self):
+        temporaire = f'{self.chemin}.tmp'
+        with open(temporaire, 'w', encoding='utf-8') as fichier:
+            json.dump({'signature': self.signature, 'etat': self.etat}, fichier)
+        os.replace(temporaire, self.chemin)
+
+    def supprimer(self):
+        if os.path.exists(self.chemin):
+            os.remove(self.chemin)
+
+
+class JournalRejets:
+    """Fichier CSV des enregistrements rejetes (rang, motif, donnees brutes)."""
+
+    def __init__(self, chemin, ajout=False):
+        self.chemin = chemin
+        self._fichier = None
+        self._ajout = ajout
+        self.nombre = 0
+
+    def ecrire(self, rang, brut, motif):
+        if self._fichier is None:
+            self._fichier = open(self.chemin, 'a' if self._ajout else 'w', encoding='utf-8', newline='')
+            self._csv = csv.writer(self._fichier)
+            if not self._ajout or self._fichier.tell() == 0:
+                self._csv.writerow(['rang', 'motif', 'donnees'])
+        donnees = json.dumps(brut, ensure_ascii=False) if isinstance(brut, dict) else str(brut)
+        self._csv.writerow([rang, str(motif), donnees])
+        self.nombre += 1
+
+    def vider(self):
+        if self._fichier is not None:
+            self._fichier.flush()
+
+    def fermer(self):
+        if self._fichier is not None:
+            self._fichier.close()
+
+
+def _compteurs():
+    return {'lus': 0, 'importes': 0, 'exemplaires': 0, 'rejets': 0, 'doublons': 0}
+
+
+def importer(enregistrements, taille_lot=TAILLE_LOT, reprise=None, rejets=None, progression=None):
+    """Importe des enregistrements ``(rang, dict)`` lot par lot et retourne le bilan de la passe.
+
+    ``reprise`` (``Reprise``) saute les rangs deja importes et est mis a jour
+    apres chaque lot ; ``rejets`` (``JournalRejets``) recoit les
+    enregistrements ecartes ; ``progression(bilan)`` est appelee apres
+    chaque lot.
+    """
+    deja_fait = reprise.etat['rang'] if reprise else 0
+    a_traiter = ((rang, brut) for rang, brut in enregistrements if rang > deja_fait)
+    flux = preparer(a_traiter, index_isbn())
+    db.session.remove()
+
+    bilan = _compteurs()
+    for lot in par_lots(flux, taille_lot):
+        valides = [element for element in lot if isinstance(element[2], dict)]
+        ecartes = [element for element in lot if isinstance(element[2], Rejet)]
+        lot_bilan = {'lus': len(lot), 'doublons': sum(1 for element in lot if element[2] is None)}
+
+        exemplaires, conflits = inserer_lot(valides) if valides else (0, [])
+        ecartes += conflits
+        lot_bilan.update(importes=len(valides) - len(conflits), exemplaires=exemplaires, rejets=len(ecartes))
+        if rejets is not None:
+            for rang, brut, motif in sorted(ecartes, key=lambda element: element[0]):
+                rejets.ecrire(rang, brut, motif)
+            rejets.vider()
+
+        for cle, nombre in lot_bilan.items():
+            bilan[cle] += nombre
+        if reprise is not None:
+            for cle, nombre in lot_bilan.items():
+                reprise.etat[cle] += nombre
+            reprise.etat['rang'] = lot[-1][0]
+            reprise.enregistrer()
+
+        publier({Ouvrage.__tablename__: set(), Exemplaire.__tablename__: set()})
+        if progression:
+            progression(bilan)
+
+    return bilan
@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Script d'import en masse du catalogue depuis un fichier CSV ou JSONL (éventuellement .gz)
+Exécutez: python importer_catalogue.py catalogue.csv [--lot 1000] [--separateur ';'] [--recommencer]
+
+Colonnes reconnues : titre, auteur, isbn, annee_publication, editeur,
+categorie, description, exemplaires. Les ISBN déjà présents (en base ou plus
+haut dans le fichier) sont ignorés ; les lignes invalides sont écrites dans
+<fichier>.rejets.csv. Un import interrompu reprend au dernier lot validé
+grâce à <fichier>.reprise.json.
+"""
+
+import argparse
+import time
+
+from app import app
+from importation import TAILLE_LOT, JournalRejets, Reprise, importer, lire_enregistrements
+
+
+def importer_catalogue(chemin, taille_lot=TAILLE_LOT, format=None, separateur=',', recommencer=False):
+    """Importe le fichier et affiche la progression puis le bilan"""
+
+    with app.app_context():
+        print("=" * 60)
+        print(f"📥 IMPORT DU CATALOGUE : {chemin}")
+        print("=" * 60)
+
+        reprise = Reprise(f'{chemin}.reprise.json', chemin)
+        if recommencer:
+            reprise.supprimer()
+        elif reprise.charger():
+            print(f"  ↪️  Reprise après l'enregistrement {reprise.etat['rang']} "
+                  f"({reprise.etat['importes']} ouvrage(s) déjà importé(s))")
+
+        rejets = JournalRejets(f'{chemin}.rejets.csv', ajout=reprise.etat['rang'] > 0)
+        debut = time.monotonic()
+
+        def progression(bilan):
+            duree = max(time.monotonic() - debut, 1e-6)
+            print(f"  ⏳ {bilan['lus']:>9} lus | {bilan['importes']:>9} importés | "
+                  f"{bilan['doublons']:>7} doublons | {bilan['rejets']:>6} rejets | "
+                  f"{bilan['lus'] / duree:8.0f} enr./s")
+
+        try:
+            importer(
+                lire_enregistrements(chemin, format, separateur),
+                taille_lot=taille_lot, reprise=reprise, rejets=rejets, progression=progression,
+            )
+        finally:
+            rejets.fermer()
+
+        # Totaux cumulés depuis le début de l'import, reprises comprises
+        bilan = dict(reprise.etat)
+        print("\n" + "=" * 60)
+        print("📊 RÉSUMÉ")
+        print("=" * 60)
+        print(f"  📚 Ouvrages importés   : {bilan['importes']}")
+        print(f"  📋 Exemplaires créés   : {bilan['exemplaires']}")
+        print(f"  ⏭️  Doublons ignorés    : {bilan['doublons']}")
+        print(f"  ❌ Rejets             : {bilan['rejets']}" + (f" (voir {rejets.chemin})" if rejets.nombre else ""))
+        print(f"  ⏱️  Durée              : {time.monotonic() - debut:.1f} s")
+        print("=" * 60)
+
+        # Import complet : le point de reprise n'a plus d'utilité
+        reprise.supprimer()
+        return bilan
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('fichier', help='fichier CSV ou JSONL (.gz accepté)')
+    parser.add_argument('--lot', type=int, default=TAILLE_LOT, help='enregistrements par transaction')
+    parser.add_argument('--format', choices=['csv', 'jsonl'], help="format du fichier (déduit de l'extension)")
+    parser.add_argument('--separateur', default=',', help='séparateur CSV')
+    parser.add_argument('--recommencer', action='store_true',
+                        help='ignore le point de reprise et relit le fichier depuis le début')
+    args = parser.parse_args()
+
+    bilan = importer_catalogue(args.fichier, args.lot, args.format, args.separateur, args.recommencer)
+    raise SystemExit(1 if bilan['rejets'] else 0)
@@ -0,0 +1,226 @@
+"""Taches de maintenance periodiques.
+
+Chaque tache est ensembliste (``UPDATE ... WHERE id IN (lot)``) et avance
+par lots de ``TAILLE_LOT`` lignes, avec un commit par lot : une passe ne
+garde jamais le verrou d'ecriture SQLite longtemps, meme sur une grosse base.
+Les changements d'un lot sont notes (``signaux.noter``) et publies aux caches
+apres son commit, jamais avant que l'``UPDATE`` soit visible.
+Les taches sont idempotentes et peuvent tourner en parallele de
+l'application, depuis ``maintenance_bibliotheque.py`` (cron) ou dans un
+thread du serveur (``MAINTENANCE_INTERVALLE``). Dans le serveur, un seul
+processus les execute : celui qui tient le verrou ``MAINTENANCE_VERROU``
+(``flock``) ; a sa mort, un autre worker le reprend au passage suivant.
+"""
+
+import os
+import threading
+from datetime import datetime, timedelta
+
+try:
+    import fcntl
+except ImportError:                     # Windows : pas de verrou, chaque processus execute les taches
+    fcntl = None
+
+from flask import current_app
+from sqlalchemy import select, update
+
+from database import db
+from file_reservations import renumeroter_file
+from models import DemandeUsager, Emprunt, Reservation, incrementer_versions_usagers
+from signaux import noter
+
+TAILLE_LOT = 500
+DELAI_DEMANDES_JOURS = 30
+COMMENTAIRE_DEMANDE_EXPIREE = 'Demande expiree sans traitement'
+
+
+def _par_lots(selection, modifier, taille_lot=TAILLE_LOT):
+    """Applique ``modifier(ids)`` aux lignes choisies par ``selection`` lot par lot.
+
+    ``selection`` doit ne plus retourner une ligne une fois modifiee, sans quoi
+    la boucle ne se terminerait pas. Retourne le nombre de lignes traitees.
+    """
+    total = 0
+    while True:
+        ids = db.session.scalars(selection.limit(taille_lot)).all()
+        if not ids:
+            return total
+        modifier(ids)
+        db.session.commit()
+        total += len(ids)
+        if len(ids) < taille_lot:
+            return total
+
+
+def marquer_retards(taille_lot=TAILLE_LOT):
+    """Passe au statut 'en_retard' les emprunts en cours dont l'echeance est depassee."""
+    maintenant = datetime.utcnow()
+    selection = select(Emprunt.id).where(
+        Emprunt.statut == 'en_cours', Emprunt.date_retour_prevue < maintenant
+    )
+
+    def modifier(ids):
+        db.session.execute(
+            update(Emprunt)
+            .where(Emprunt.id.in_(ids))
+            .values(statut='en_retard')
+            .execution_options(synchronize_session=False)
+        )
+        incrementer_versions_usagers(
+            db.session.connection(), select(Emprunt.usager_id).where(Emprunt.id.in_(ids))
+        )
+        noter(db.session, Emprunt.__tablename__, ids)
+
+    return _par_lots(selection, modifier, taille_lot)
+
+
+def expirer_reservations(taille_lot=TAILLE_LOT):
+    """Passe au statut 'expiree' les reservations actives echues et recompacte leurs files."""
+    selection = select(Reservation.id).where(Reservation.expiree)
+    ouvrages = set()
+
+    def modifier(ids):
+        ouvrages.update(db.session.scalars(
+            select(Reservation.ouvrage_id).where(Reservation.id.in_(ids)).distinct()
+        ))
+        db.session.execute(
+            update(Reservation)
+            .where(Reservation.id.in_(ids))
+            .values(statut='expiree')
+            .execution_options(synchronize_session=False)
+        )
+        incrementer_versions_usagers(
+            db.session.connection(), select(Reservation.usager_id).where(Reservation.id.in_(ids))
+        )
+        noter(db.session, Reservation.__tablename__, ids)
+
+    total = _par_lots(selection, modifier, taille_lot)
+
+    for i, ouvrage_id in enumerate(sorted(ouvrages), start=1):
+        renumeroter_file(ouvrage_id)
+        if i % taille_lot == 0:
+            db.session.commit()
+    db.session.commit()
+    db.session.expire_all()
+    return total
+
+
+def purger_demandes(delai_jours=None, taille_lot=TAILLE_LOT):
+    """Refuse les demandes restees en attente plus de ``delai_jours`` jours."""
+    if delai_jours is None:
+        delai_jours = current_app.config.get('DEMANDES_DELAI_JOURS', DELAI_DEMANDES_JOURS)
+    limite = datetime.utcnow() - timedelta(days=delai_jours)
+    selection = select(DemandeUsager.id).where(
+        DemandeUsager.statut == 'en_attente', DemandeUsager.date_creation < limite
+    )
+
+    def modifier(ids):
+        db.session.execute(
+            update(DemandeUsager)
+            .where(DemandeUsager.id.in_(ids))
+            .values(
+                statut='refusee',
+                commentaire_admin=COMMENTAIRE_DEMANDE_EXPIREE,
+                date_traitement=datetime.utcnow(),
+            )
+            .execution_options(synchronize_session=False)
+        )
+        incrementer_versions_usagers(
+            db.session.connection(), select(DemandeUsager.usager_id).where(DemandeUsager.id.in_(ids))
+        )
+        noter(db.session, DemandeUsager.__tablename__, ids)
+
+    return _par_lots(selection, modifier, taille_lot)
+
+
+TACHES = {
+    'retards': marquer_retards,
+    'reservations': expirer_reservations,
+    'demandes': purger_demandes,
+}
+
+
+def executer_taches(noms=None):
+    """Execute les taches demandees (toutes par defaut) et retourne le nombre de lignes traitees."""
+    resultats = {}
+    for nom in noms or TACHES:
+        try:
+            resultats[nom] = TACHES[nom]()
+        except Exception:
+            db.session.rollback()
+            current_app.logger.exception('Echec de la tache de maintenance %s', nom)
+            resultats[nom] = None
+    return resultats
+
+
+class Planificateur:
+    """Execute les taches de maintenance toutes les ``intervalle`` secondes dans un thread.
+
+    Chaque worker demarre le sien, mais seul le processus qui obtient le
+    verrou exclusif sur ``chemin_verrou`` execute les taches ; les autres
+    retentent a chaque passage et prennent le relais si le meneur disparait.
+    """
+
+    def __init__(self, app, intervalle, chemin_verrou=None):
+        self.app = app
+        self.intervalle = intervalle
+        self.chemin_verrou = chemin_verrou
+        self._verrou = None
+        self._arret = threading.Event()
+        self._thread = None
+
+    def demarrer(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._boucle, name='maintenance', daemon=True)
+            self._thread.start()
+        return self
+
+    def arreter(self):
+        self._arret.set()
+
+    def meneur(self):
+        """Vrai si ce processus tient (ou vient d'obtenir) le verrou de maintenance"""
+        if self._verrou is not None or fcntl is None or not self.chemin_verrou:
+            return True
+        os.makedirs(os.path.dirname(self.chemin_verrou) or '.', exist_ok=True)
+        fichier = open(self.chemin_verrou, 'a')
+        try:
+            fcntl.flock(fichier, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            fichier.close()
+            return False
+        # Garde le descripteur ouvert : le verrou est libere a la fin du processus
+        self._verrou = fichier
+        return True
+
+    def _boucle(self):
+        while not self._arret.wait(self.intervalle):
+            # Une erreur hors des taches (base indisponible...) ne doit pas arreter le thread
+            try:
+                if not self.meneur():
+                    continue
+                with self.app.app_context():
+                    try:
+                        executer_taches()
+                    finally:
+                        db.session.remove()
+            except Exception:
+                self.app.logger.exception('Echec du passage de maintenance')
+
+
+def init_maintenance(app):
+    """Prepare le planificateur si ``MAINTENANCE_INTERVALLE`` (secondes) est configure.
+
+    Son thread n'est lance que par ``demarrer()``, dans le worker
+    (``init_processus``) : un thread demarre avant le fork n'existe pas dans
+    les processus fils. Le verrou ``MAINTENANCE_VERROU`` (par defaut
+    ``instance/maintenance.verrou``) designe le seul worker qui execute les taches.
+    """
+    intervalle = app.config.get('MAINTENANCE_INTERVALLE')
+    if not intervalle:
+        return None
+    if not app.config.get('MAINTENANCE_VERROU'):
+        app.config['MAINTENANCE_VERROU'] = os.path.join(app.instance_path, 'maintenance.verrou')
+    planificateur = Planificateur(app, float(intervalle), app.config['MAINTENANCE_VERROU'])
+    app.extensions['maintenance'] = planificateur
+    return planificateur
@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Script des tâches de maintenance (retards, réservations expirées, demandes en souffrance)
+Exécutez: python maintenance_bibliotheque.py [--taches retards reservations demandes] [--boucle SECONDES]
+"""
+
+import argparse
+import time
+
+from app import app
+from maintenance import TACHES, executer_taches
+
+LIBELLES = {
+    'retards': "⏰ Emprunts passés en retard",
+    'reservations': "📅 Réservations expirées",
+    'demandes': "📨 Demandes refusées (sans réponse)",
+}
+
+
+def maintenance(taches=None):
+    """Exécute une passe de maintenance et affiche le bilan"""
+
+    with app.app_context():
+        print("=" * 60)
+        print(f"🧹 MAINTENANCE ({time.strftime('%d/%m/%Y %H:%M:%S')})")
+        print("=" * 60)
+
+        resultats = executer_taches(taches)
+
+        for nom, nombre in resultats.items():
+            if nombre is None:
+                print(f"  ❌ {LIBELLES[nom]} : échec (voir les logs)")
+            else:
+                print(f"  ✅ {LIBELLES[nom]} : {nombre}")
+        print("=" * 60)
+
+        return resultats
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--taches', nargs='+', choices=list(TACHES),
+                        help='tâches à exécuter (toutes par défaut)')
+    parser.add_argument('--boucle', type=float, metavar='SECONDES',
+                        help='relance la maintenance à cet intervalle au lieu de sortir')
+    args = parser.parse_args()
+
+    resultats = maintenance(args.taches)
+    while args.boucle:
+        time.sleep(args.boucle)
+        resultats = maintenance(args.taches)
+
+    raise SystemExit(1 if None in resultats.values() else 0)
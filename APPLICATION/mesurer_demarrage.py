@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Script de mesure du démarrage de l'application, comparé à un budget
+Exécutez: python mesurer_demarrage.py [--budget 1.0] [--repetitions 5] [--workers 4]
+
+1. Dans des interpréteurs neufs : import du code et create_app, ressources
+   du worker (init_processus : première connexion, révision du schéma) et
+   première requête. Code retour 1 si le total médian dépasse le budget.
+2. Avec --workers N : gunicorn préchargé (gunicorn.conf.py) sur un port
+   libre ; délai avant la première réponse et mémoire des workers (Rss
+   contre Pss, la part réellement propre à chacun).
+"""
+
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+
+DOSSIER = os.path.dirname(os.path.abspath(__file__))
+
+MESURE = '''
+import json, time
+debut = time.perf_counter()
+from app import app, init_processus
+import_fin = time.perf_counter()
+init_processus(app)
+processus_fin = time.perf_counter()
+reponse = app.test_client().get('/')
+requete_fin = time.perf_counter()
+print(json.dumps({
+    'import': import_fin - debut,
+    'processus': processus_fin - import_fin,
+    'requete': requete_fin - processus_fin,
+    'statut': reponse.status_code,
+}))
+'''
+
+PHASES = (
+    ('import', 'import du code + create_app'),
+    ('processus', 'init_processus'),
+    ('requete', 'première requête'),
+)
+
+
+def mesurer_interpreteur():
+    """Durées (secondes) des phases du démarrage dans un interpréteur neuf"""
+    debut = time.perf_counter()
+    sortie = subprocess.run(
+        [sys.executable, '-c', MESURE], cwd=DOSSIER, capture_output=True, text=True, check=True
+    ).stdout
+    mesure = json.loads(sortie.strip().splitlines()[-1])
+    mesure['interpreteur'] = time.perf_counter() - debut
+    return mesure
+
+
+def _port_libre():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _memoire(pid):
+    """Rss et Pss (Kio) d'un processus, lus dans /proc (Linux)"""
+    valeurs = {}
+    try:
+        with open(f'/proc/{pid}/smaps_rollup') as fichier:
+            for ligne in fichier:
+                cle, _, reste = ligne.partition(':')
+                if cle in ('Rss', 'Pss'):
+                    valeurs[cle] = int(reste.split()[0])
+    except OSError:
+        pass
+    return valeurs
+
+
+def _enfants(pid):
+    try:
+        with open(f'/proc/{pid}/task/{pid}/children') as fichier:
+            return [int(p) for p in fichier.read().split()]
+    except OSError:
+        return []
+
+
+def mesurer_gunicorn(workers, delai=30):
+    """Démarre gunicorn préchargé, attend la première réponse et relève la mémoire des workers"""
+    port = _port_libre()
+    debut = time.perf_counter()
+    serveur = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '--workers', str(workers),
+         '--bind', f'127.0.0.1:{port}', 'app:app'],
+        cwd=DOSSIER, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        while True:
+            try:
+                urllib.request.urlopen(f'http://127.0.0.1:{port}/', timeout=1).read()
+                break
+            except OSError:
+                if serveur.poll() is not None or time.perf_counter() - debut > delai:
+                    return None
+                time.sleep(0.02)
+        premiere_reponse = time.perf_counter() - debut
+        while len(_enfants(serveur.pid)) < workers and time.perf_counter() - debut < delai:
+            time.sleep(0.05)
+        return {
+            'premiere_reponse': premiere_reponse,
+            'maitre': _memoire(serveur.pid),
+            'workers': [_memoire(pid) for pid in _enfants(serveur.pid)],
+        }
+    finally:
+        serveur.terminate()
+        serveur.wait()
+
+
+def mesurer(budget=1.0, repetitions=5, workers=0):
+    """Mesure le démarrage ; retourne True si le total médian tient dans le budget"""
+
+    print("=" * 60)
+    print(f"🚀 DÉMARRAGE D'UN PROCESSUS ({repetitions} mesures, médianes)")
+    print("=" * 60)
+
+    mesures = [mesurer_interpreteur() for _ in range(repetitions)]
+    medianes = {cle: statistics.median(m[cle] for m in mesures) for cle, _ in PHASES + (('interpreteur', ''),)}
+    for cle, libelle in PHASES:
+        print(f"  ⏱️  {libelle:<30} {medianes[cle] * 1000:8.1f} ms")
+    total = sum(medianes[cle] for cle, _ in PHASES)
+    print(f"  📊 {'total':<30} {total * 1000:8.1f} ms (interpréteur compris : {medianes['interpreteur'] * 1000:.0f} ms)")
+    statuts = {m['statut'] for m in mesures}
+    if statuts != {200}:
+        print(f"  ⚠️  Statut de la première requête : {sorted(statuts)} (base migrée ?)")
+
+    if workers:
+        print("=" * 60)
+        print(f"🦄 GUNICORN PRÉCHARGÉ ({workers} workers)")
+        print("=" * 60)
+        r = mesurer_gunicorn(workers)
+        if r is None:
+            print("  ❌ Le serveur n'a pas répondu")
+        else:
+            print(f"  ⏱️  Première réponse après {r['premiere_reponse'] * 1000:.0f} ms")
+            print(f"  🧠 Maître   : Rss {r['maitre'].get('Rss', 0) / 1024:6.1f} Mio")
+            for i, memoire in enumerate(r['workers'], 1):
+                print(f"  🧠 Worker {i} : Rss {memoire.get('Rss', 0) / 1024:6.1f} Mio, "
+                      f"Pss {memoire.get('Pss', 0) / 1024:6.1f} Mio")
+
+    respecte = total <= budget
+    print("=" * 60)
+    print(f"{'✨' if respecte else '❌'} Budget de {budget * 1000:.0f} ms {'respecté' if respecte else 'dépassé'}")
+    print("=" * 60)
+    return respecte
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--budget', type=float, default=1.0, help='durée maximale du démarrage (secondes)')
+    parser.add_argument('--repetitions', type=int, default=5, help='interpréteurs mesurés')
+    parser.add_argument('--workers', type=int, default=0, help='workers gunicorn à démarrer (0 = pas de mesure)')
+    args = parser.parse_args()
+
+    raise SystemExit(0 if mesurer(args.budget, args.repetitions, args.workers) else 1)
@@ -0,0 +1,434 @@
+"""Metriques au format texte de Prometheus, agregees entre les workers.
+
+Chaque worker tient ses propres mesures : histogramme de la duree des
+requetes par endpoint Flask, requetes en cours, attente du verrou d'ecriture
+SQLite (``BEGIN IMMEDIATE``) et delais depasses (``database is locked``). A
+la publication s'y ajoutent les compteurs lus ailleurs : pool de connexions
+(``database.PoolMesure``), caches (identite, statistiques, fragments), pool
+de hachage, reessais d'allocation.
+
+Toutes les ``METRIQUES_INTERVALLE`` secondes, et a chaque lecture de
+``/metrics``, le worker ecrit son instantane dans ``METRIQUES_DOSSIER/<pid>.json``
+(remplacement atomique). ``/metrics``, servi par n'importe quel worker,
+additionne les fichiers : compteurs et histogrammes de tous, jauges des
+seuls processus vivants. Quand gunicorn remplace un worker, ses compteurs
+sont reportes dans ``termines.json`` (crochet ``child_exit``) ; le dossier
+est vide au demarrage du serveur. Aucun service externe n'est necessaire.
+"""
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import current_app, g, request
+from sqlalchemy import event
+
+try:
+    import fcntl
+except ImportError:                     # Windows : pas de verrou, lecture sans garantie pendant un report
+    fcntl = None
+
+import circulation
+import controllers
+import identite
+from database import db
+
+INTERVALLE_DEFAUT = 5
+SEAUX_REQUETES = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SEAUX_VERROU = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5)
+TERMINES = 'termines.json'
+VERROU = '.verrou'
+
+# Nom : (type, aide)
+DEFINITIONS = {
+    'bibliotheque_requete_duree_secondes': ('histogram', "Duree des requetes HTTP par endpoint, flux compris"),
+    'bibliotheque_requetes_total': ('counter', "Requetes HTTP par endpoint et statut"),
+    'bibliotheque_requetes_en_cours': ('gauge', "Requetes HTTP en cours de traitement"),
+    'bibliotheque_pool_connexions': ('gauge', "Connexions du pool par etat"),
+    'bibliotheque_pool_taille': ('gauge', "Taille configuree du pool de connexions"),
+    'bibliotheque_pool_emprunts_total': ('counter', "Connexions empruntees au pool"),
+    'bibliotheque_pool_emprunt_secondes_total': ('counter', "Duree cumulee des emprunts au pool (attente comprise)"),
+    'bibliotheque_pool_delais_depasses_total': ('counter', "Emprunts abandonnes apres POOL_DELAI secondes"),
+    'bibliotheque_sqlite_verrou_attente_secondes': ('histogram', "Attente du verrou d'ecriture SQLite"),
+    'bibliotheque_sqlite_verrou_echecs_total': ('counter', "Instructions abandonnees sur 'database is locked'"),
+    'bibliotheque_allocation_reessais_total': ('counter', "Exemplaires retentes lors d'un emprunt concurrent"),
+    'bibliotheque_cache_succes_total': ('counter', "Lectures trouvees dans le cache"),
+    'bibliotheque_cache_echecs_total': ('counter', "Lectures absentes du cache"),
+    'bibliotheque_cache_taux_succes': ('gauge', "Part des lectures trouvees dans le cache, tous workers"),
+    'bibliotheque_hachage_total': ('counter', "Hachages de mots de passe par issue"),
+    'bibliotheque_workers': ('gauge', "Processus dont les mesures sont publiees"),
+}
+
+
+def _cle(nom, etiquettes):
+    return nom, tuple(sorted(etiquettes.items()))
+
+
+class Mesures:
+    """Compteurs, jauges et histogrammes du worker courant."""
+
+    def __init__(self):
+        self.compteurs = {}
+        self.jauges = {}
+        self.histogrammes = {}
+        self._verrou = threading.Lock()
+
+    def incrementer(self, nom, valeur=1, **etiquettes):
+        cle = _cle(nom, etiquettes)
+        with self._verrou:
+            self.compteurs[cle] = self.compteurs.get(cle, 0) + valeur
+
+    def ajuster(self, nom, delta, **etiquettes):
+        cle = _cle(nom, etiquettes)
+        with self._verrou:
+            self.jauges[cle] = self.jauges.get(cle, 0) + delta
+
+    def observer(self, nom, valeur, seaux, **etiquettes):
+        cle = _cle(nom, etiquettes)
+        with self._verrou:
+            histogramme = self.histogrammes.get(cle)
+            if histogramme is None:
+                histogramme = self.histogrammes[cle] = {'seaux': list(seaux), 'nombres': [0] * (len(seaux) + 1),
+                                                        'somme': 0.0}
+            rang = next((i for i, borne in enumerate(seaux) if valeur <= borne), len(seaux))
+            histogramme['nombres'][rang] += 1
+            histogramme['somme'] += valeur
+
+    def instantane(self):
+        with self._verrou:
+            return {
+                'compteurs': [[nom, dict(etiquettes), valeur] for (nom, etiquettes), valeur in self.compteurs.items()],
+                'jauges': [[nom, dict(etiquettes), valeur] for (nom, etiquettes), valeur in self.jauges.items()],
+                'histogrammes': [
+                    [nom, dict(etiquettes), {**h, 'nombres': list(h['nombres'])}]
+                    for (nom, etiquettes), h in self.histogrammes.items()
+                ],
+            }
+
+
+def _collecter(app):
+    """Compteurs et jauges tenus par les autres modules, lus au moment de la publication"""
+    compteurs, jauges = [], []
+
+    with app.app_context():
+        for nom_moteur, moteur in db.engines.items():
+            pool = moteur.pool
+            if not hasattr(pool, 'emprunts'):
+                continue
+            base = {'base': nom_moteur or 'defaut'}
+            jauges.append(['bibliotheque_pool_taille', base, pool.size()])
+            jauges.append(['bibliotheque_pool_connexions', dict(base, etat='utilisees'), pool.checkedout()])
+            jauges.append(['bibliotheque_pool_connexions', dict(base, etat='libres'), pool.checkedin()])
+            jauges.append(['bibliotheque_pool_connexions', dict(base, etat='debordement'), max(pool.overflow(), 0)])
+            compteurs.append(['bibliotheque_pool_emprunts_total', base, pool.emprunts])
+            compteurs.append(['bibliotheque_pool_emprunt_secondes_total', base, pool.duree_emprunts])
+            compteurs.append(['bibliotheque_pool_delais_depasses_total', base, pool.delais_depasses])
+
+    caches = {'identite': identite.statistiques(), 'statistiques': controllers.statistiques_cache()}
+    if app.extensions.get('fragments') is not None:
+        caches['fragments'] = app.extensions['fragments'].statistiques()
+    for cache, stats in caches.items():
+        compteurs.append(['bibliotheque_cache_succes_total', {'cache': cache}, stats['succes']])
+        compteurs.append(['bibliotheque_cache_echecs_total', {'cache': cache}, stats['echecs']])
+
+    hachage = app.extensions.get('hachage')
+    if hachage is not None:
+        compteurs.append(['bibliotheque_hachage_total', {'issue': 'execute'}, hachage.executes])
+        compteurs.append(['bibliotheque_hachage_total', {'issue': 'refuse'}, hachage.refus])
+
+    compteurs.append(['bibliotheque_allocation_reessais_total', {}, circulation.statistiques()['allocation']])
+    return compteurs, jauges
+
+
+class Publieur:
+    """Ecrit l'instantane du worker dans ``dossier`` toutes les ``intervalle`` secondes (thread)."""
+
+    def __init__(self, app, dossier, intervalle=INTERVALLE_DEFAUT):
+        self.app = app
+        self.dossier = dossier
+        self.intervalle = intervalle
+        self.mesures = Mesures()
+        self._arret = threading.Event()
+        self._thread = None
+
+    def demarrer(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._boucle, name='metriques', daemon=True)
+            self._thread.start()
+        return self
+
+    def arreter(self):
+        self._arret.set()
+
+    def _boucle(self):
+        while not self._arret.wait(self.intervalle):
+            try:
+                self.publier()
+            except Exception:
+                self.app.logger.exception('Echec de la publication des metriques')
+
+    def publier(self):
+        """Ecrit l'instantane du worker (remplacement atomique du fichier)"""
+        instantane = self.mesures.instantane()
+        compteurs, jauges = _collecter(self.app)
+        instantane['compteurs'] += compteurs
+        instantane['jauges'] += jauges
+        instantane['pid'] = os.getpid()
+        _ecrire(os.path.join(self.dossier, f'{os.getpid()}.json'), instantane)
+
+
+def _ecrire(chemin, contenu):
+    os.makedirs(os.path.dirname(chemin), exist_ok=True)
+    temporaire = f'{chemin}.{threading.get_ident()}.tmp'
+    with open(temporaire, 'w', encoding='utf-8') as fichier:
+        json.dump(contenu, fichier)
+    os.replace(temporaire, chemin)
+
+
+def _lire(chemin):
+    try:
+        with open(chemin, encoding='utf-8') as fichier:
+            return json.load(fichier)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+@contextmanager
+def _verrou_dossier(dossier, exclusif):
+    """Verrou entre les lectures de /metrics (partage) et le report d'un worker termine (exclusif)"""
+    if fcntl is None:
+        yield
+        return
+    os.makedirs(dossier, exist_ok=True)
+    with open(os.path.join(dossier, VERROU), 'a') as fichier:
+        fcntl.flock(fichier, fcntl.LOCK_EX if exclusif else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(fichier, fcntl.LOCK_UN)
+
+
+def _vivant(pid):
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class Agregat:
+    """Somme des instantanes de plusieurs processus."""
+
+    def __init__(self):
+        self.compteurs = {}
+        self.jauges = {}
+        self.histogrammes = {}
+        self.processus = 0
+
+    def ajouter(self, instantane, jauges=True):
+        for nom, etiquettes, valeur in instantane.get('compteurs', ()):
+            cle = _cle(nom, etiquettes)
+            self.compteurs[cle] = self.compteurs.get(cle, 0) + valeur
+        if jauges:
+            for nom, etiquettes, valeur in instantane.get('jauges', ()):
+                cle = _cle(nom, etiquettes)
+                self.jauges[cle] = self.jauges.get(cle, 0) + valeur
+        for nom, etiquettes, h in instantane.get('histogrammes', ()):
+            cle = _cle(nom, etiquettes)
+            total = self.histogrammes.get(cle)
+            if total is None or total['seaux'] != h['seaux']:
+                self.histogrammes[cle] = {'seaux': h['seaux'], 'nombres': list(h['nombres']), 'somme': h['somme']}
+            else:
+                total['nombres'] = [a + b for a, b in zip(total['nombres'], h['nombres'])]
+                total['somme'] += h['somme']
+
+    def instantane(self):
+        return {
+            'compteurs': [[nom, dict(etiquettes), valeur] for (nom, etiquettes), valeur in self.compteurs.items()],
+            'histogrammes': [[nom, dict(etiquettes), h] for (nom, etiquettes), h in self.histogrammes.items()],
+        }
+
+
+def agreger(dossier):
+    """Additionne les instantanes du dossier ; jauges des seuls processus vivants"""
+    agregat = Agregat()
+    with _verrou_dossier(dossier, exclusif=False):
+        termines = _lire(os.path.join(dossier, TERMINES))
+        if termines:
+            agregat.ajouter(termines, jauges=False)
+        for nom in sorted(os.listdir(dossier)):
+            if not nom.endswith('.json') or nom == TERMINES:
+                continue
+            instantane = _lire(os.path.join(dossier, nom))
+            if instantane is None:
+                continue
+            vivant = _vivant(instantane.get('pid', 0))
+            agregat.ajouter(instantane, jauges=vivant)
+            agregat.processus += vivant
+    return agregat
+
+
+def _valeur(valeur):
+    if valeur == float('inf'):
+        return '+Inf'
+    return repr(float(valeur)) if isinstance(valeur, float) else str(valeur)
+
+
+def _echapper(valeur):
+    return str(valeur).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _etiquettes(etiquettes, **supplement):
+    paires = list(etiquettes) + list(supplement.items())
+    if not paires:
+        return ''
+    return '{' + ','.join(f'{cle}="{_echapper(valeur)}"' for cle, valeur in paires) + '}'
+
+
+def exposition(agregat):
+    """Texte au format d'exposition Prometheus (version 0.0.4)"""
+    # Nom de famille -> [(etiquettes, lignes de la serie)] ; seaux d'un histogramme dans l'ordre croissant
+    familles = {}
+    for (nom, etiquettes), valeur in list(agregat.compteurs.items()) + list(agregat.jauges.items()):
+        familles.setdefault(nom, []).append((etiquettes, [f'{nom}{_etiquettes(etiquettes)} {_valeur(valeur)}']))
+    for (nom, etiquettes), h in agregat.histogrammes.items():
+        lignes = []
+        cumul = 0
+        for borne, nombre in zip(list(h['seaux']) + [float('inf')], h['nombres']):
+            cumul += nombre
+            lignes.append(f'{nom}_bucket{_etiquettes(etiquettes, le=_valeur(float(borne)))} {cumul}')
+        lignes.append(f'{nom}_sum{_etiquettes(etiquettes)} {_valeur(h["somme"])}')
+        lignes.append(f'{nom}_count{_etiquettes(etiquettes)} {cumul}')
+        familles.setdefault(nom, []).append((etiquettes, lignes))
+
+    # Taux de succes calcules sur les compteurs additionnes, pas moyennes des taux des workers
+    for (nom, etiquettes), succes in agregat.compteurs.items():
+        echecs = agregat.compteurs.get(('bibliotheque_cache_echecs_total', etiquettes), 0)
+        if nom == 'bibliotheque_cache_succes_total' and succes + echecs:
+            taux = round(succes / (succes + echecs), 4)
+            familles.setdefault('bibliotheque_cache_taux_succes', []).append(
+                (etiquettes, [f'bibliotheque_cache_taux_succes{_etiquettes(etiquettes)} {taux}'])
+            )
+    familles['bibliotheque_workers'] = [((), [f'bibliotheque_workers {agregat.processus}'])]
+
+    texte = []
+    for nom in sorted(familles):
+        type_metrique, aide = DEFINITIONS.get(nom, ('untyped', nom))
+        texte.append(f'# HELP {nom} {aide}')
+        texte.append(f'# TYPE {nom} {type_metrique}')
+        for _, lignes in sorted(familles[nom], key=lambda serie: serie[0]):
+            texte.extend(lignes)
+    return '\n'.join(texte) + '\n'
+
+
+def exposer():
+    """Publie l'instantane du worker courant puis rend l'agregat de tous les workers"""
+    publieur = current_app.extensions['metriques']
+    publieur.publier()
+    return exposition(agreger(publieur.dossier))
+
+
+def reporter_termine(app, pid):
+    """Reporte les compteurs et histogrammes d'un worker termine dans ``termines.json``.
+
+    Appele par le processus maitre de gunicorn (``child_exit``) : les compteurs
+    restent croissants quand un worker est remplace, ses jauges disparaissent.
+    """
+    dossier = app.extensions['metriques'].dossier
+    chemin = os.path.join(dossier, f'{pid}.json')
+    with _verrou_dossier(dossier, exclusif=True):
+        instantane = _lire(chemin)
+        if instantane is None:
+            return
+        agregat = Agregat()
+        agregat.ajouter(_lire(os.path.join(dossier, TERMINES)) or {}, jauges=False)
+        agregat.ajouter(instantane, jauges=False)
+        _ecrire(os.path.join(dossier, TERMINES), agregat.instantane())
+        os.remove(chemin)
+
+
+def vider_dossier(app):
+    """Supprime les instantanes d'une execution precedente (demarrage du serveur)"""
+    dossier = app.extensions['metriques'].dossier
+    if not os.path.isdir(dossier):
+        return
+    with _verrou_dossier(dossier, exclusif=True):
+        for entree in os.scandir(dossier):
+            if entree.name.endswith(('.json', '.tmp')):
+                os.remove(entree.path)
+
+
+# ---- Mesures des requetes et du verrou SQLite -------------------------------------------------------
+
+def _mesures():
+    return current_app.extensions['metriques'].mesures
+
+
+def ouvrir_mesure():
+    g.metrique_debut = time.perf_counter()
+    g.metrique_endpoint = request.endpoint or 'aucun'
+    _mesures().ajuster('bibliotheque_requetes_en_cours', 1, endpoint=g.metrique_endpoint)
+
+
+def noter_statut(reponse):
+    g.metrique_statut = reponse.status_code
+    return reponse
+
+
+def fermer_mesure(erreur=None):
+    """Fin de la requete, flux compris (teardown) : duree, statut et requetes en cours"""
+    debut = g.pop('metrique_debut', None)
+    if debut is None:
+        return
+    endpoint = g.pop('metrique_endpoint')
+    statut = g.pop('metrique_statut', 500)
+    mesures = _mesures()
+    mesures.ajuster('bibliotheque_requetes_en_cours', -1, endpoint=endpoint)
+    mesures.observer('bibliotheque_requete_duree_secondes', time.perf_counter() - debut, SEAUX_REQUETES,
+                     endpoint=endpoint)
+    mesures.incrementer('bibliotheque_requetes_total', endpoint=endpoint, statut=str(statut))
+
+
+def _instrumenter_moteur(moteur, mesures):
+    if moteur.dialect.name != 'sqlite':
+        return
+
+    @event.listens_for(moteur, 'before_cursor_execute')
+    def _avant(connexion, curseur, instruction, parametres, contexte, executemany):
+        if instruction == 'BEGIN IMMEDIATE' and contexte is not None:
+            contexte.debut_verrou = time.perf_counter()
+
+    @event.listens_for(moteur, 'after_cursor_execute')
+    def _apres(connexion, curseur, instruction, parametres, contexte, executemany):
+        debut = getattr(contexte, 'debut_verrou', None)
+        if debut is not None:
+            mesures.observer('bibliotheque_sqlite_verrou_attente_secondes', time.perf_counter() - debut,
+                             SEAUX_VERROU)
+
+    @event.listens_for(moteur, 'handle_error')
+    def _erreur(contexte):
+        if 'database is locked' in str(contexte.original_exception):
+            mesures.incrementer('bibliotheque_sqlite_verrou_echecs_total')
+
+
+def init_metriques(app):
+    """Prepare les mesures du processus ; la publication periodique demarre dans le worker (``init_processus``)."""
+    if not app.config.get('METRIQUES_DOSSIER'):
+        app.config['METRIQUES_DOSSIER'] = os.path.join(app.instance_path, 'metriques')
+    publieur = Publieur(
+        app, app.config['METRIQUES_DOSSIER'], float(app.config.get('METRIQUES_INTERVALLE') or INTERVALLE_DEFAUT)
+    )
+    with app.app_context():
+        for moteur in db.engines.values():
+            _instrumenter_moteur(moteur, publieur.mesures)
+    app.before_request(ouvrir_mesure)
+    app.after_request(noter_statut)
+    app.teardown_request(fermer_mesure)
+    app.extensions['metriques'] = publieur
+    return publieur
@@ -0,0 +1,308 @@
+"""Schema initial, applicable aussi a une base creee avant les migrations
+
+Les versions precedentes creaient le schema au demarrage (``db.create_all()``
+et ajout des colonnes manquantes) : une base existante en a deja tout ou
+partie. Chaque table, colonne, index ou trigger n'est donc cree que s'il
+manque, et ``upgrade`` s'applique aussi bien a une base vide qu'a une base
+de production anterieure.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+EMPRUNT_ACTIF = "statut IN ('en_cours', 'en_retard')"
+RESERVATION_ACTIVE = "statut = 'active'"
+
+# Index plein texte du catalogue (SQLite uniquement) : seule definition, recherche.py ne fait que l'interroger
+COLONNES_FTS = 'titre, auteur, isbn, editeur, categorie, description'
+INSTRUCTIONS_FTS = [
+    f"""CREATE VIRTUAL TABLE ouvrages_fts USING fts5(
+        {COLONNES_FTS},
+        content='ouvrages', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )""",
+    "INSERT INTO ouvrages_fts(ouvrages_fts, rank) VALUES ('rank', 'bm25(10.0, 6.0, 4.0, 1.0, 2.0, 0.5)')",
+    """CREATE TRIGGER ouvrages_fts_ai AFTER INSERT ON ouvrages BEGIN
+        INSERT INTO ouvrages_fts(rowid, titre, auteur, isbn, editeur, categorie, description)
+        VALUES (new.id, new.titre, new.auteur, new.isbn, new.editeur, new.categorie, new.description);
+    END""",
+    """CREATE TRIGGER ouvrages_fts_ad AFTER DELETE ON ouvrages BEGIN
+        INSERT INTO ouvrages_fts(ouvrages_fts, rowid, titre, auteur, isbn, editeur, categorie, description)
+        VALUES ('delete', old.id, old.titre, old.auteur, old.isbn, old.editeur, old.categorie, old.description);
+    END""",
+    f"""CREATE TRIGGER ouvrages_fts_au AFTER UPDATE OF {COLONNES_FTS} ON ouvrages BEGIN
+        INSERT INTO ouvrages_fts(ouvrages_fts, rowid, titre, auteur, isbn, editeur, categorie, description)
+        VALUES ('delete', old.id, old.titre, old.auteur, old.isbn, old.editeur, old.categorie, old.description);
+        INSERT INTO ouvrages_fts(rowid, titre, auteur, isbn, editeur, categorie, description)
+        VALUES (new.id, new.titre, new.auteur, new.isbn, new.editeur, new.categorie, new.description);
+    END""",
+    "INSERT INTO ouvrages_fts(ouvrages_fts) VALUES ('rebuild')",
+]
+
+
+def _inspecteur():
+    return sa.inspect(op.get_bind())
+
+
+def _sqlite():
+    return op.get_bind().dialect.name == 'sqlite'
+
+
+def _creer_table(nom, *elements):
+    """Cree la table si elle manque ; retourne False si elle existait deja."""
+    if _inspecteur().has_table(nom):
+        return False
+    op.create_table(nom, *elements)
+    return True
+
+
+def _ajouter_colonnes(table, *colonnes):
+    """Ajoute a une table existante les colonnes apparues depuis sa creation."""
+    presentes = {c['name'] for c in _inspecteur().get_columns(table)}
+    ajoutees = []
+    for colonne in colonnes:
+        if colonne.name not in presentes:
+            op.add_column(table, colonne)
+            ajoutees.append(colonne.name)
+    return ajoutees
+
+
+class DoublonsActifs(RuntimeError):
+    """Des lignes actives en double empechent de creer un index unique partiel."""
+
+
+def _verifier_unicite(nom, table, colonnes, where=None):
+    """Leve ``DoublonsActifs`` si des lignes violent l'index unique ``nom`` a creer."""
+    liste = ', '.join(colonnes)
+    filtre = f'WHERE {where} ' if where else ''
+    doublons = op.get_bind().execute(sa.text(
+        f'SELECT {liste}, count(*) FROM {table} {filtre}GROUP BY {liste} HAVING count(*) > 1'
+    )).all()
+    if doublons:
+        exemples = ', '.join(str(tuple(ligne[:-1])) for ligne in doublons[:10])
+        raise DoublonsActifs(
+            f'Index {nom} impossible : {len(doublons)} valeur(s) de ({liste}) en double dans {table}'
+            f'{" (" + where + ")" if where else ""}, par exemple {exemples}. '
+            f'Cloturer les lignes en trop puis relancer la migration.'
+        )
+
+
+def _creer_index(nom, table, colonnes, unique=False, where=None):
+    if nom in {i['name'] for i in _inspecteur().get_indexes(table)}:
+        return
+    if unique:
+        # Une ancienne base peut contenir des doublons : la migration s'arrete avant d'etre enregistree
+        _verifier_unicite(nom, table, colonnes, where)
+    conditions = {'sqlite_where': sa.text(where), 'postgresql_where': sa.text(where)} if where else {}
+    op.create_index(nom, table, colonnes, unique=unique, **conditions)
+
+
+def _reconcilier_compteurs():
+    """Recalcule les compteurs de disponibilite (colonnes tout juste ajoutees)."""
+    op.execute(f"""
+        UPDATE exemplaires SET emprunt_courant_id = (
+            SELECT max(e.id) FROM emprunts e WHERE e.exemplaire_id = exemplaires.id AND e.{EMPRUNT_ACTIF}
+        )
+    """)
+    op.execute(f"""
+        UPDATE ouvrages SET copies_available = coalesce(nombre_exemplaires, 0) - (
+            SELECT count(DISTINCT e.exemplaire_id) FROM emprunts e JOIN exemplaires x ON e.exemplaire_id = x.id
+            WHERE x.ouvrage_id = ouvrages.id AND e.{EMPRUNT_ACTIF}
+        )
+    """)
+
+
+def upgrade():
+    _creer_table(
+        'bibliothecaires',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('nom', sa.String(length=100), nullable=False),
+        sa.Column('prenom', sa.String(length=100), nullable=False),
+        sa.Column('login', sa.String(length=80), nullable=False),
+        sa.Column('password_hash', sa.String(length=200), nullable=True),
+        sa.Column('date_creation', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('login'),
+    )
+
+    compteurs_ajoutes = False
+    if not _creer_table(
+        'ouvrages',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('titre', sa.String(length=200), nullable=False),
+        sa.Column('auteur', sa.String(length=200), nullable=False),
+        sa.Column('isbn', sa.String(length=20), nullable=True),
+        sa.Column('annee_publication', sa.Integer(), nullable=True),
+        sa.Column('editeur', sa.String(length=100), nullable=True),
+        sa.Column('categorie', sa.String(length=50), nullable=True),
+        sa.Column('description', sa.Text(), nullable=True),
+        sa.Column('nombre_exemplaires', sa.Integer(), nullable=True),
+        sa.Column('copies_available', sa.Integer(), nullable=True),
+        sa.Column('date_ajout', sa.DateTime(), nullable=True),
+        sa.Column('version', sa.Integer(), server_default='1', nullable=False),
+        sa.Column('date_modification', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('isbn'),
+    ):
+        ajoutees = _ajouter_colonnes(
+            'ouvrages',
+            sa.Column('copies_available', sa.Integer(), nullable=True),
+            sa.Column('version', sa.Integer(), server_default='1', nullable=False),
+            sa.Column('date_modification', sa.DateTime(), nullable=True),
+        )
+        compteurs_ajoutes = 'copies_available' in ajoutees
+    _creer_index('ix_ouvrages_titre', 'ouvrages', ['titre'])
+    _creer_index('ix_ouvrages_date_ajout', 'ouvrages', ['date_ajout'])
+    _creer_index('ix_ouvrages_categorie', 'ouvrages', ['categorie'])
+
+    if not _creer_table(
+        'usagers',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('nom', sa.String(length=100), nullable=False),
+        sa.Column('prenom', sa.String(length=100), nullable=False),
+        sa.Column('email', sa.String(length=120), nullable=False),
+        sa.Column('telephone', sa.String(length=20), nullable=True),
+        sa.Column('adresse', sa.Text(), nullable=True),
+        sa.Column('password_hash', sa.String(length=200), nullable=True),
+        sa.Column('date_inscription', sa.DateTime(), nullable=True),
+        sa.Column('statut', sa.String(length=20), nullable=True),
+        sa.Column('version', sa.Integer(), server_default='1', nullable=False),
+        sa.Column('date_modification', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('email'),
+    ):
+        _ajouter_colonnes(
+            'usagers',
+            sa.Column('password_hash', sa.String(length=200), nullable=True),
+            sa.Column('version', sa.Integer(), server_default='1', nullable=False),
+            sa.Column('date_modification', sa.DateTime(), nullable=True),
+        )
+    _creer_index('ix_usagers_nom', 'usagers', ['nom'])
+
+    _creer_table(
+        'demandes_usager',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('usager_id', sa.Integer(), nullable=False),
+        sa.Column('ouvrage_id', sa.Integer(), nullable=False),
+        sa.Column('type_demande', sa.String(length=20), nullable=False),
+        sa.Column('statut', sa.String(length=20), nullable=True),
+        sa.Column('commentaire', sa.Text(), nullable=True),
+        sa.Column('commentaire_admin', sa.Text(), nullable=True),
+        sa.Column('date_creation', sa.DateTime(), nullable=True),
+        sa.Column('date_traitement', sa.DateTime(), nullable=True),
+        sa.Column('bibliothecaire_id', sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(['bibliothecaire_id'], ['bibliothecaires.id']),
+        sa.ForeignKeyConstraint(['ouvrage_id'], ['ouvrages.id']),
+        sa.ForeignKeyConstraint(['usager_id'], ['usagers.id']),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    _creer_index('ix_demandes_statut_date', 'demandes_usager', ['statut', 'date_creation'])
+    _creer_index('ix_demandes_usager_date', 'demandes_usager', ['usager_id', 'date_creation'])
+    _creer_index('ix_demandes_usager_statut_date', 'demandes_usager', ['usager_id', 'statut', 'date_creation'])
+
+    # La cle etrangere vers emprunts (cycle exemplaires <-> emprunts) est ajoutee
+    # apres coup ailleurs que sous SQLite, qui ne sait pas la creer par ALTER
+    fk_emprunt = [
+        sa.ForeignKeyConstraint(['emprunt_courant_id'], ['emprunts.id'], name='fk_exemplaires_emprunt_courant')
+    ] if _sqlite() else []
+    exemplaires_crees = _creer_table(
+        'exemplaires',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('ouvrage_id', sa.Integer(), nullable=False),
+        sa.Column('numero', sa.String(length=50), nullable=False),
+        sa.Column('etat', sa.String(length=20), nullable=True),
+        sa.Column('date_acquisition', sa.DateTime(), nullable=True),
+        sa.Column('emprunt_courant_id', sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(['ouvrage_id'], ['ouvrages.id']),
+        *fk_emprunt,
+        sa.PrimaryKeyConstraint('id'),
+    )
+    pointeur_ajoute = False
+    if not exemplaires_crees:
+        colonnes = {c['name'] for c in _inspecteur().get_columns('exemplaires')}
+        if 'emprunt_courant_id' not in colonnes:
+            if _sqlite():
+                op.execute('ALTER TABLE exemplaires ADD COLUMN emprunt_courant_id INTEGER REFERENCES emprunts (id)')
+            else:
+                op.add_column('exemplaires', sa.Column('emprunt_courant_id', sa.Integer(), nullable=True))
+            pointeur_ajoute = True
+    _creer_index('ix_exemplaires_ouvrage_libre', 'exemplaires', ['ouvrage_id', 'emprunt_courant_id'])
+
+    _creer_table(
+        'reservations',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('usager_id', sa.Integer(), nullable=False),
+        sa.Column('ouvrage_id', sa.Integer(), nullable=False),
+        sa.Column('date_reservation', sa.DateTime(), nullable=True),
+        sa.Column('date_expiration', sa.DateTime(), nullable=True),
+        sa.Column('statut', sa.String(length=20), nullable=True),
+        sa.Column('priorite', sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(['ouvrage_id'], ['ouvrages.id']),
+        sa.ForeignKeyConstraint(['usager_id'], ['usagers.id']),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    _creer_index('ix_reservations_file', 'reservations', ['ouvrage_id', 'statut', 'priorite', 'date_reservation'])
+    _creer_index('ix_reservations_statut_date', 'reservations', ['statut', 'date_reservation'])
+    _creer_index('ix_reservations_statut_expiration', 'reservations', ['statut', 'date_expiration'])
+    _creer_index('ix_reservations_usager_statut', 'reservations', ['usager_id', 'statut'])
+    _creer_index(
+        'ux_reservations_usager_actif', 'reservations', ['usager_id', 'ouvrage_id'],
+        unique=True, where=RESERVATION_ACTIVE,
+    )
+
+    _creer_table(
+        'emprunts',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('usager_id', sa.Integer(), nullable=False),
+        sa.Column('exemplaire_id', sa.Integer(), nullable=False),
+        sa.Column('date_emprunt', sa.DateTime(), nullable=True),
+        sa.Column('date_retour_prevue', sa.DateTime(), nullable=True),
+        sa.Column('date_retour_reelle', sa.DateTime(), nullable=True),
+        sa.Column('statut', sa.String(length=20), nullable=True),
+        sa.Column('prolongations', sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(['exemplaire_id'], ['exemplaires.id']),
+        sa.ForeignKeyConstraint(['usager_id'], ['usagers.id']),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    _creer_index('ix_emprunts_date_emprunt', 'emprunts', ['date_emprunt'])
+    _creer_index('ix_emprunts_exemplaire_statut', 'emprunts', ['exemplaire_id', 'statut'])
+    _creer_index('ix_emprunts_statut_retour', 'emprunts', ['statut', 'date_retour_prevue'])
+    _creer_index('ix_emprunts_statut_usager', 'emprunts', ['statut', 'usager_id'])
+    _creer_index('ix_emprunts_usager_date', 'emprunts', ['usager_id', 'date_emprunt'])
+    _creer_index('ux_emprunts_exemplaire_actif', 'emprunts', ['exemplaire_id'], unique=True, where=EMPRUNT_ACTIF)
+
+    if not _sqlite():
+        cles = {fk['name'] for fk in _inspecteur().get_foreign_keys('exemplaires')}
+        if 'fk_exemplaires_emprunt_courant' not in cles:
+            op.create_foreign_key(
+                'fk_exemplaires_emprunt_courant', 'exemplaires', 'emprunts', ['emprunt_courant_id'], ['id']
+            )
+
+    if compteurs_ajoutes or pointeur_ajoute:
+        _reconcilier_compteurs()
+
+    if _sqlite() and not _inspecteur().has_table('ouvrages_fts'):
+        for instruction in INSTRUCTIONS_FTS:
+            op.execute(instruction)
+
+
+def downgrade():
+    if _sqlite():
+        for trigger in ('ouvrages_fts_ai', 'ouvrages_fts_ad', 'ouvrages_fts_au'):
+            op.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+        op.execute('DROP TABLE IF EXISTS ouvrages_fts')
+    else:
+        op.drop_constraint('fk_exemplaires_emprunt_courant', 'exemplaires', type_='foreignkey')
+    for table in ('emprunts', 'reservations', 'exemplaires', 'demandes_usager', 'usagers', 'ouvrages', 'bibliothecaires'):
+        op.drop_table(table)
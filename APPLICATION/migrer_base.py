@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Script de migration du schéma de la base (étape de déploiement)
+Exécutez: python migrer_base.py [--verifier] [--revision head]
+
+À lancer une seule fois, avant de démarrer ou de recharger les workers :
+ceux-ci ne font que comparer la révision de la base à celle du code, et
+répondent 503 tant qu'elle est en retard. Une base créée par une version
+antérieure de l'application est reprise telle quelle par la migration
+initiale. Équivaut à « flask --app app db upgrade ».
+"""
+
+import argparse
+
+from flask_migrate import upgrade
+
+from app import app
+from database import DOSSIER_MIGRATIONS, init_migrations, verifier_schema
+
+
+def migrer(revision='head', verifier=False):
+    """Applique les migrations en attente ; retourne True si la base est à jour"""
+
+    a_jour = verifier_schema(app, journaliser=False)
+    etat = app.extensions['schema']
+
+    print("=" * 60)
+    print("🗄️  MIGRATION DU SCHÉMA")
+    print("=" * 60)
+    print(f"  📌 Révision de la base : {etat['base'] or 'aucune'}")
+    print(f"  🎯 Révision du code    : {etat['attendue']}")
+
+    if a_jour:
+        print("\n✨ Base déjà à jour")
+    elif verifier:
+        print("\n❌ Migration en attente")
+    else:
+        init_migrations(app)
+        try:
+            with app.app_context():
+                upgrade(directory=DOSSIER_MIGRATIONS, revision=revision)
+        except SystemExit:
+            # Flask-Migrate a journalisé l'erreur (doublons empêchant un index unique...)
+            print(f"\n❌ Migration interrompue : base toujours en révision {etat['base'] or 'aucune'}")
+            print("=" * 60)
+            return False
+        a_jour = verifier_schema(app, journaliser=False)
+        print(f"\n{'✨' if a_jour else '⚠️ '} Base en révision {app.extensions['schema']['base']}")
+    print("=" * 60)
+    return a_jour
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--verifier', action='store_true', help='ne rien modifier (code retour 1 si migration en attente)')
+    parser.add_argument('--revision', default='head', help='révision cible (head par défaut)')
+    args = parser.parse_args()
+
+    raise SystemExit(0 if migrer(args.revision, args.verifier) else 1)
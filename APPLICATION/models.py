@@ -1,12 +1,24 @@
 ﻿from database import db
 from datetime import datetime, timedelta
+from itertools import chain
 from flask_login import UserMixin
-from werkzeug.security import generate_password_hash, check_password_hash
+from sqlalchemy import and_, event, text, update
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.hybrid import hybrid_property
+from securite import hacher_mot_de_passe, verifier_mot_de_passe
+
+# Statuts d'emprunt qui immobilisent un exemplaire
+STATUTS_EMPRUNT_ACTIFS = ('en_cours', 'en_retard')
+_RESERVATION_ACTIVE = text("statut = 'active'")
+_EMPRUNT_ACTIF = text('statut IN ({})'.format(', '.join(f"'{s}'" for s in STATUTS_EMPRUNT_ACTIFS)))
 
 
 class Usager(db.Model):
     """Modele pour les usagers de la bibliotheque"""
     __tablename__ = 'usagers'
+    __table_args__ = (
+        db.Index('ix_usagers_nom', 'nom'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     nom = db.Column(db.String(100), nullable=False)
@@ -17,6 +29,9 @@ class Usager(db.Model):
     password_hash = db.Column(db.String(200))
     date_inscription = db.Column(db.DateTime, default=datetime.utcnow)
     statut = db.Column(db.String(20), default='actif')  # actif, suspendu, inactif
+    # Incrementee a chaque changement d'un emprunt, d'une reservation ou d'une demande de l'usager
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    date_modification = db.Column(db.DateTime, default=datetime.utcnow)
 
     # Relations
     emprunts = db.relationship('Emprunt', backref='usager', lazy=True)
@@ -27,18 +42,24 @@ class Usager(db.Model):
         return f'<Usager {self.prenom} {self.nom}>'
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = hacher_mot_de_passe(password)
 
     def check_password(self, password):
-        return bool(self.password_hash) and check_password_hash(self.password_hash, password)
+        """Verifie le mot de passe ; un hash d'ancienne methode est remplace (a valider par l'appelant)"""
+        valide, nouveau_hash = verifier_mot_de_passe(self.password_hash, password)
+        if nouveau_hash:
+            self.password_hash = nouveau_hash
+        return valide
 
     def peut_emprunter(self):
         """Verifie si l'usager peut emprunter un livre"""
         if self.statut != 'actif':
             return False, 'Compte non actif'
 
-        emprunts_actifs = [e for e in self.emprunts if e.statut == 'en_cours']
-        if len(emprunts_actifs) >= 5:  # Limite de 5 emprunts simultanes
+        emprunts_actifs = Emprunt.query.filter(
+            Emprunt.usager_id == self.id, Emprunt.statut.in_(STATUTS_EMPRUNT_ACTIFS)
+        ).count()
+        if emprunts_actifs >= 5:  # Limite de 5 emprunts simultanes
             return False, 'Limite d emprunts atteinte'
 
         return True, 'OK'
@@ -47,6 +68,11 @@ class Usager(db.Model):
 class Ouvrage(db.Model):
     """Modele pour les ouvrages (livres)"""
     __tablename__ = 'ouvrages'
+    __table_args__ = (
+        db.Index('ix_ouvrages_titre', 'titre'),
+        db.Index('ix_ouvrages_date_ajout', 'date_ajout'),
+        db.Index('ix_ouvrages_categorie', 'categorie'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     titre = db.Column(db.String(200), nullable=False)
@@ -57,7 +83,11 @@ class Ouvrage(db.Model):
     categorie = db.Column(db.String(50))
     description = db.Column(db.Text)
     nombre_exemplaires = db.Column(db.Integer, default=1)
+    copies_available = db.Column(db.Integer)  # Maintenu par circulation.py
     date_ajout = db.Column(db.DateTime, default=datetime.utcnow)
+    # Incrementee a chaque changement de l'ouvrage ou de ses exemplaires (ETag)
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    date_modification = db.Column(db.DateTime, default=datetime.utcnow)
 
     # Relations
     exemplaires = db.relationship('Exemplaire', backref='ouvrage', lazy=True)
@@ -67,11 +97,23 @@ class Ouvrage(db.Model):
     def __repr__(self):
         return f'<Ouvrage {self.titre}>'
 
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        if self.nombre_exemplaires is None:
+            self.nombre_exemplaires = 1
+        if self.copies_available is None:
+            self.copies_available = self.nombre_exemplaires
+
     def exemplaires_disponibles(self):
         """Retourne le nombre d'exemplaires disponibles"""
+        if self.copies_available is not None:
+            return self.copies_available
+
+        # Compteur absent (base non reconciliee) : recomptage complet
         total = self.nombre_exemplaires
         empruntes = sum(
-            1 for e in self.exemplaires if any(emp.statut == 'en_cours' for emp in e.emprunts)
+            1 for e in self.exemplaires
+            if any(emp.statut in STATUTS_EMPRUNT_ACTIFS for emp in e.emprunts)
         )
         return total - empruntes
 
@@ -83,28 +125,49 @@ class Ouvrage(db.Model):
 class Exemplaire(db.Model):
     """Modele pour les exemplaires individuels d'un ouvrage"""
     __tablename__ = 'exemplaires'
+    __table_args__ = (
+        # Exemplaires d'un ouvrage, et exemplaire libre d'un ouvrage sans parcourir les autres
+        db.Index('ix_exemplaires_ouvrage_libre', 'ouvrage_id', 'emprunt_courant_id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     ouvrage_id = db.Column(db.Integer, db.ForeignKey('ouvrages.id'), nullable=False)
     numero = db.Column(db.String(50), nullable=False)  # Numero d'inventaire
     etat = db.Column(db.String(20), default='bon')  # bon, abime, perdu
     date_acquisition = db.Column(db.DateTime, default=datetime.utcnow)
+    emprunt_courant_id = db.Column(
+        db.Integer,
+        db.ForeignKey('emprunts.id', use_alter=True, name='fk_exemplaires_emprunt_courant'),
+    )  # Emprunt actif, NULL si l'exemplaire est en rayon
 
     # Relations
-    emprunts = db.relationship('Emprunt', backref='exemplaire', lazy=True)
+    emprunts = db.relationship(
+        'Emprunt', backref='exemplaire', lazy=True, foreign_keys='Emprunt.exemplaire_id'
+    )
 
     def __repr__(self):
         return f'<Exemplaire {self.numero} de {self.ouvrage.titre}>'
 
     def est_disponible(self):
         """Verifie si cet exemplaire est disponible"""
-        emprunts_actifs = [e for e in self.emprunts if e.statut == 'en_cours']
-        return len(emprunts_actifs) == 0
+        return self.emprunt_courant_id is None
 
 
 class Emprunt(db.Model):
     """Modele pour les emprunts"""
     __tablename__ = 'emprunts'
+    __table_args__ = (
+        db.Index('ix_emprunts_statut_usager', 'statut', 'usager_id'),
+        db.Index('ix_emprunts_exemplaire_statut', 'exemplaire_id', 'statut'),
+        db.Index('ix_emprunts_usager_date', 'usager_id', 'date_emprunt'),
+        db.Index('ix_emprunts_date_emprunt', 'date_emprunt'),
+        db.Index('ix_emprunts_statut_retour', 'statut', 'date_retour_prevue'),
+        # Au plus un emprunt actif par exemplaire, garanti par la base
+        db.Index(
+            'ux_emprunts_exemplaire_actif', 'exemplaire_id', unique=True,
+            sqlite_where=_EMPRUNT_ACTIF, postgresql_where=_EMPRUNT_ACTIF,
+        ),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     usager_id = db.Column(db.Integer, db.ForeignKey('usagers.id'), nullable=False)
@@ -123,11 +186,33 @@ class Emprunt(db.Model):
         if not self.date_retour_prevue:
             self.date_retour_prevue = datetime.utcnow() + timedelta(days=21)  # 3 semaines
 
+    @hybrid_property
+    def en_retard(self):
+        """Emprunt actif dont la date de retour prevue est depassee.
+
+        Utilisable en Python comme dans une requete :
+        ``Emprunt.query.filter(Emprunt.en_retard)``.
+        """
+        return (
+            self.statut in STATUTS_EMPRUNT_ACTIFS
+            and self.date_retour_prevue is not None
+            and self.date_retour_prevue < datetime.utcnow()
+        )
+
+    @en_retard.expression
+    def en_retard(cls):
+        return and_(cls.statut.in_(STATUTS_EMPRUNT_ACTIFS), cls.date_retour_prevue < datetime.utcnow())
+
+    @property
+    def jours_de_retard(self):
+        """Nombre de jours ecoules depuis la date de retour prevue (0 si a l'heure)"""
+        if not self.en_retard:
+            return 0
+        return (datetime.utcnow() - self.date_retour_prevue).days
+
     def est_en_retard(self):
         """Verifie si l'emprunt est en retard"""
-        if self.statut in ('retourne', 'retourn\u00e9'):
-            return False
-        return datetime.utcnow() > self.date_retour_prevue
+        return self.en_retard
 
     def peut_prolonger(self):
         """Verifie si l'emprunt peut etre prolonge"""
@@ -150,6 +235,17 @@ class Emprunt(db.Model):
 class Reservation(db.Model):
     """Modele pour les reservations"""
     __tablename__ = 'reservations'
+    __table_args__ = (
+        db.Index('ix_reservations_file', 'ouvrage_id', 'statut', 'priorite', 'date_reservation'),
+        db.Index('ix_reservations_usager_statut', 'usager_id', 'statut'),
+        db.Index('ix_reservations_statut_date', 'statut', 'date_reservation'),
+        db.Index('ix_reservations_statut_expiration', 'statut', 'date_expiration'),
+        # Au plus une reservation active par usager et par ouvrage
+        db.Index(
+            'ux_reservations_usager_actif', 'usager_id', 'ouvrage_id', unique=True,
+            sqlite_where=_RESERVATION_ACTIVE, postgresql_where=_RESERVATION_ACTIVE,
+        ),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     usager_id = db.Column(db.Integer, db.ForeignKey('usagers.id'), nullable=False)
@@ -162,6 +258,19 @@ class Reservation(db.Model):
     def __repr__(self):
         return f'<Reservation {self.id}>'
 
+    @hybrid_property
+    def expiree(self):
+        """Reservation encore active dont la date d'expiration est passee"""
+        return (
+            self.statut == 'active'
+            and self.date_expiration is not None
+            and self.date_expiration < datetime.utcnow()
+        )
+
+    @expiree.expression
+    def expiree(cls):
+        return and_(cls.statut == 'active', cls.date_expiration < datetime.utcnow())
+
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         if not self.date_expiration:
@@ -171,6 +280,11 @@ class Reservation(db.Model):
 class DemandeUsager(db.Model):
     """Demandes envoyees par l'usager et traitees par l'admin"""
     __tablename__ = 'demandes_usager'
+    __table_args__ = (
+        db.Index('ix_demandes_usager_statut_date', 'usager_id', 'statut', 'date_creation'),
+        db.Index('ix_demandes_usager_date', 'usager_id', 'date_creation'),
+        db.Index('ix_demandes_statut_date', 'statut', 'date_creation'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     usager_id = db.Column(db.Integer, db.ForeignKey('usagers.id'), nullable=False)
@@ -202,12 +316,56 @@ class Bibliothecaire(db.Model, UserMixin):
 
     def set_password(self, password):
         """Hash le mot de passe"""
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = hacher_mot_de_passe(password)
 
     def check_password(self, password):
-        """Verifie le mot de passe"""
-        return check_password_hash(self.password_hash, password)
+        """Verifie le mot de passe ; un hash d'ancienne methode est remplace (a valider par l'appelant)"""
+        valide, nouveau_hash = verifier_mot_de_passe(self.password_hash, password)
+        if nouveau_hash:
+            self.password_hash = nouveau_hash
+        return valide
 
     def __repr__(self):
         return f'<Bibliothecaire {self.login}>'
 
+
+def _incrementer_versions(connexion, modele, ids):
+    table = modele.__table__
+    connexion.execute(
+        update(table)
+        .where(table.c.id.in_(ids))
+        .values(version=table.c.version + 1, date_modification=datetime.utcnow())
+    )
+
+
+def incrementer_versions_usagers(connexion, usager_ids):
+    """Signale un changement aux tableaux de bord des usagers donnes.
+
+    ``usager_ids`` peut etre une liste ou un ``select`` d'ids ; a appeler
+    apres toute ecriture ensembliste sur leurs emprunts, reservations ou demandes.
+    """
+    _incrementer_versions(connexion, Usager, usager_ids)
+
+
+def incrementer_versions_ouvrages(connexion, ouvrage_ids):
+    """Invalide les ETag des ouvrages donnes (liste ou ``select`` d'ids)."""
+    _incrementer_versions(connexion, Ouvrage, ouvrage_ids)
+
+
+@event.listens_for(Session, 'after_flush')
+def _suivre_versions(session, contexte):
+    usager_ids, ouvrage_ids = set(), set()
+    for objet in chain(session.new, session.dirty, session.deleted):
+        if objet in session.dirty and not session.is_modified(objet):
+            continue
+        if isinstance(objet, (Emprunt, Reservation, DemandeUsager)) and objet.usager_id is not None:
+            usager_ids.add(objet.usager_id)
+        elif isinstance(objet, Exemplaire) and objet.ouvrage_id is not None:
+            ouvrage_ids.add(objet.ouvrage_id)
+        elif isinstance(objet, Ouvrage) and objet in session.dirty:
+            ouvrage_ids.add(objet.id)
+
+    if usager_ids:
+        incrementer_versions_usagers(session.connection(), usager_ids)
+    if ouvrage_ids:
+        incrementer_versions_ouvrages(session.connection(), ouvrage_ids)
@@ -0,0 +1,177 @@
+"""Pagination par curseur (keyset) des listes.
+
+Une page est definie par une cle de tri stable, par exemple
+``(date_emprunt DESC, id DESC)``. Le curseur transporte les valeurs de cette
+cle pour la premiere ou la derniere ligne affichee. La page suivante est
+obtenue par ``WHERE cle > curseur`` au lieu d'un ``OFFSET``, si bien que le
+cout d'une page ne depend pas de sa position dans la liste.
+"""
+
+import base64
+import binascii
+import json
+from datetime import datetime
+
+from flask import current_app, request, url_for
+from sqlalchemy import and_, or_
+
+TAILLE_PAGE_DEFAUT = 50
+TAILLE_PAGE_MAX = 200
+
+
+class CurseurInvalide(ValueError):
+    """Curseur illisible ou altere."""
+
+
+class Page:
+    """Une page de resultats et les curseurs qui l'encadrent."""
+
+    def __init__(self, elements, limite, suivant=None, precedent=None):
+        self.elements = elements
+        self.limite = limite
+        self.suivant = suivant
+        self.precedent = precedent
+
+    def __iter__(self):
+        return iter(self.elements)
+
+    def __len__(self):
+        return len(self.elements)
+
+    def __bool__(self):
+        return bool(self.elements)
+
+    def meta(self):
+        """Informations de pagination pour une reponse JSON."""
+        return {
+            'limite': self.limite,
+            'suivant': self.suivant,
+            'precedent': self.precedent,
+        }
+
+
+def _valeur_json(valeur):
+    if isinstance(valeur, datetime):
+        return {'dt': valeur.isoformat()}
+    return valeur
+
+
+def _valeur_python(valeur):
+    if isinstance(valeur, dict) and 'dt' in valeur:
+        return datetime.fromisoformat(valeur['dt'])
+    return valeur
+
+
+def encoder_curseur(valeurs, sens):
+    """Encode les valeurs de cle d'une ligne ; sens vaut 'apres' ou 'avant'."""
+    brut = json.dumps({'s': sens, 'v': [_valeur_json(v) for v in valeurs]}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(brut.encode()).decode().rstrip('=')
+
+
+def decoder_curseur(jeton):
+    """Retourne (sens, valeurs) pour un curseur produit par encoder_curseur."""
+    try:
+        brut = base64.urlsafe_b64decode(jeton + '=' * (-len(jeton) % 4))
+        donnees = json.loads(brut)
+        sens, valeurs = donnees['s'], [_valeur_python(v) for v in donnees['v']]
+    except (binascii.Error, ValueError, KeyError, TypeError) as exc:
+        raise CurseurInvalide(jeton) from exc
+    if sens not in ('apres', 'avant'):
+        raise CurseurInvalide(jeton)
+    return sens, valeurs
+
+
+def _au_dela(cles, valeurs, sens):
+    """Predicat 'strictement apres (ou avant) la ligne de valeurs donnees'."""
+    conditions = []
+    for i, (expression, descendant) in enumerate(cles):
+        vers_le_haut = descendant == (sens == 'avant')
+        comparaison = expression > valeurs[i] if vers_le_haut else expression < valeurs[i]
+        egalites = [cles[j][0] == valeurs[j] for j in range(i)]
+        conditions.append(and_(*egalites, comparaison))
+
+    # Borne redondante sur la premiere cle : permet une recherche par index
+    premiere, descendant = cles[0]
+    if descendant == (sens == 'avant'):
+        borne = premiere >= valeurs[0]
+    else:
+        borne = premiere <= valeurs[0]
+    return and_(borne, or_(*conditions))
+
+
+def paginer(query, cles, curseur=None, limite=TAILLE_PAGE_DEFAUT, element=None):
+    """Retourne une Page de ``query`` triee selon ``cles``.
+
+    ``cles`` est une liste de couples ``(expression, descendant)`` dont le
+    dernier element doit etre unique (en general la cle primaire). Un curseur
+    invalide est ignore et ramene a la premiere page. ``element`` transforme
+    chaque ligne avant de la placer dans la page, par exemple pour ne garder
+    que l'objet ORM d'une ligne qui porte aussi une colonne de tri.
+    """
+    sens, valeurs = 'apres', None
+    if curseur:
+        try:
+            sens, valeurs = decoder_curseur(curseur)
+        except CurseurInvalide:
+            sens, valeurs = 'apres', None
+        if valeurs is not None and len(valeurs) != len(cles):
+            sens, valeurs = 'apres', None
+
+    inverse = sens == 'avant'
+    ordre = [
+        expression.desc() if descendant != inverse else expression.asc()
+        for expression, descendant in cles
+    ]
+    query = query.order_by(None).order_by(*ordre)
+    if valeurs is not None:
+        query = query.filter(_au_dela(cles, valeurs, sens))
+
+    lignes = query.limit(limite + 1).all()
+    encore = len(lignes) > limite
+    lignes = lignes[:limite]
+    if inverse:
+        lignes.reverse()
+
+    def cle_de(ligne):
+        return [_extraire(ligne, expression) for expression, _ in cles]
+
+    suivant = precedent = None
+    if lignes:
+        if encore or inverse:
+            suivant = encoder_curseur(cle_de(lignes[-1]), 'apres')
+        if (encore and inverse) or (valeurs is not None and not inverse):
+            precedent = encoder_curseur(cle_de(lignes[0]), 'avant')
+
+    if element is not None:
+        lignes = [element(ligne) for ligne in lignes]
+    return Page(lignes, limite, suivant=suivant, precedent=precedent)
+
+
+def _extraire(ligne, expression):
+    """Lit la valeur d'une cle de tri sur un objet ORM ou une ligne."""
+    nom = getattr(expression, 'key', None) or expression.name
+    entite = getattr(expression, 'class_', None)
+    est_ligne = hasattr(ligne, '_mapping')
+    if entite is not None:
+        for objet in (ligne if est_ligne else (ligne,)):
+            if isinstance(objet, entite):
+                return getattr(objet, nom)
+    if est_ligne:
+        return ligne._mapping[nom]
+    return getattr(ligne, nom)
+
+
+def taille_page():
+    """Taille de page demandee (?limite=), bornee par la configuration."""
+    defaut = current_app.config.get('PAGE_TAILLE', TAILLE_PAGE_DEFAUT)
+    maximum = current_app.config.get('PAGE_TAILLE_MAX', TAILLE_PAGE_MAX)
+    limite = request.args.get('limite', defaut, type=int)
+    return max(1, min(limite or defaut, maximum))
+
+
+def url_curseur(curseur):
+    """URL de la vue courante avec le curseur donne, filtres conserves."""
+    arguments = request.args.to_dict()
+    arguments.pop('curseur', None)
+    arguments.update(request.view_args or {})
+    return url_for(request.endpoint, curseur=curseur, **arguments)
@@ -0,0 +1,93 @@
+"""Recherche plein texte dans le catalogue (SQLite FTS5).
+
+L'index ``ouvrages_fts`` est une table FTS5 a contenu externe adossee a
+``ouvrages`` : il ne stocke que l'index, tenu a jour par des triggers SQL
+(ils couvrent aussi les scripts qui ecrivent sans passer par l'ORM). Le
+tokenizer ``unicode61 remove_diacritics 2`` rend la recherche insensible aux
+accents, et chaque mot saisi est cherche comme prefixe. La table, ses poids
+bm25 et ses triggers sont definis par la migration initiale
+(``migrations/versions/0001_schema_initial.py``) et nulle part ailleurs : ce
+module ne fait que les interroger et reconstruire leur contenu.
+
+Sur un autre moteur que SQLite, la recherche retombe sur des ``ILIKE`` dont
+le motif echappe ``%`` et ``_`` : la saisie est cherchee telle quelle.
+"""
+
+import re
+
+from sqlalchemy import column, false, literal_column, or_, table, text
+
+from database import db
+from models import Ouvrage
+
+TABLE_INDEX = 'ouvrages_fts'
+# Caractere d'echappement des motifs LIKE de la recherche de repli
+ECHAPPEMENT = '\\'
+
+_index = table(TABLE_INDEX, column('rowid'), column('rank'))
+_mot = re.compile(r'\w+', re.UNICODE)
+
+# Score de pertinence bm25 (plus petit = plus pertinent), cle de tri des resultats
+PERTINENCE = _index.c.rank
+
+
+def index_disponible():
+    """Indique si le moteur courant supporte l'index FTS5."""
+    return db.engine.dialect.name == 'sqlite'
+
+
+def reconstruire_index():
+    """Reconstruit entierement l'index a partir de la table ouvrages (base migree)."""
+    if not index_disponible():
+        return False
+    db.session.execute(text(f"INSERT INTO {TABLE_INDEX}({TABLE_INDEX}) VALUES ('rebuild')"))
+    db.session.execute(text(f"INSERT INTO {TABLE_INDEX}({TABLE_INDEX}) VALUES ('optimize')"))
+    db.session.commit()
+    return True
+
+
+def expression_fts(saisie):
+    """Transforme une saisie libre en requete FTS5 (tous les mots, en prefixe)."""
+    mots = _mot.findall(saisie or '')
+    return ' '.join(f'"{mot}"*' for mot in mots)
+
+
+def motif_like(saisie):
+    """Motif ``LIKE`` contenant la saisie telle quelle : ``%``, ``_`` et ``\\`` sont echappes."""
+    echappee = (saisie or '').replace(ECHAPPEMENT, ECHAPPEMENT * 2)
+    echappee = echappee.replace('%', ECHAPPEMENT + '%').replace('_', ECHAPPEMENT + '_')
+    return f'%{echappee}%'
+
+
+def filtrer_ouvrages(query, saisie, colonnes_repli=(Ouvrage.titre, Ouvrage.auteur)):
+    """Restreint une requete sur Ouvrage a la saisie, triee par pertinence."""
+    if not index_disponible():
+        motif = motif_like(saisie)
+        return query.filter(or_(*(c.ilike(motif, escape=ECHAPPEMENT) for c in colonnes_repli)))
+
+    expression = expression_fts(saisie)
+    if not expression:
+        return query.filter(false())
+
+    return (
+        query.join(_index, _index.c.rowid == Ouvrage.id)
+        .filter(literal_column(TABLE_INDEX).op('MATCH')(expression))
+        .order_by(_index.c.rank, Ouvrage.id)
+    )
+
+
+def requete_catalogue(saisie, colonnes_repli=(Ouvrage.titre, Ouvrage.auteur)):
+    """Prepare la requete paginable du catalogue.
+
+    Retourne ``(query, cles, element)`` pour ``pagination.paginer`` : tri par
+    titre sans recherche, par pertinence avec l'index FTS5.
+    """
+    if not saisie:
+        return Ouvrage.query, [(Ouvrage.titre, False), (Ouvrage.id, False)], None
+
+    query = filtrer_ouvrages(Ouvrage.query, saisie, colonnes_repli)
+    if not index_disponible() or not expression_fts(saisie):
+        return query, [(Ouvrage.titre, False), (Ouvrage.id, False)], None
+
+    cles = [(PERTINENCE, False), (Ouvrage.id, False)]
+    return query.add_columns(PERTINENCE), cles, lambda ligne: ligne[0]
@@ -0,0 +1,43 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Script pour reconstruire les compteurs de disponibilité à partir des emprunts
+Exécutez: python reconcilier_disponibilites.py [--verifier]
+"""
+
+import argparse
+
+from app import app
+from disponibilite import reconcilier_compteurs
+
+
+def reconcilier(appliquer=True):
+    """Mesure les écarts et, si demandé, recalcule les compteurs"""
+
+    with app.app_context():
+        print("=" * 60)
+        print("🔄 RÉCONCILIATION DES DISPONIBILITÉS")
+        print("=" * 60)
+
+        ecarts = reconcilier_compteurs(appliquer=appliquer)
+
+        print(f"  📋 Exemplaires en écart : {ecarts['exemplaires']}")
+        print(f"  📚 Ouvrages en écart    : {ecarts['ouvrages']}")
+        if appliquer:
+            print("\n✨ Compteurs reconstruits !")
+        else:
+            print("\nℹ️  Mode vérification : aucune modification appliquée")
+        print("=" * 60)
+
+        return ecarts
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--verifier', action='store_true',
+                        help='mesure les écarts sans les corriger')
+    args = parser.parse_args()
+
+    ecarts = reconcilier(appliquer=not args.verifier)
+    raise SystemExit(1 if args.verifier and any(ecarts.values()) else 0)
@@ -0,0 +1,32 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Script pour reconstruire l'index de recherche plein texte du catalogue
+Exécutez: python reconstruire_index_recherche.py
+"""
+
+from app import app
+from models import Ouvrage
+from recherche import reconstruire_index
+
+
+def reconstruire():
+    """Recrée l'index FTS5 à partir de la table des ouvrages"""
+
+    with app.app_context():
+        print("=" * 60)
+        print("🔎 RECONSTRUCTION DE L'INDEX DE RECHERCHE")
+        print("=" * 60)
+
+        if not reconstruire_index():
+            print("  ⏭️  Moteur sans FTS5 : la recherche utilise LIKE, rien à faire")
+            return
+
+        print(f"  📚 Ouvrages indexés : {Ouvrage.query.count()}")
+        print("\n✨ Index reconstruit !")
+        print("=" * 60)
+
+
+if __name__ == '__main__':
+    reconstruire()
@@ -0,0 +1,41 @@
+"""Registre differe des routes et des crochets de l'application.
+
+Les vues sont declarees au niveau du module avec ``@routes.route(...)``,
+``@routes.before_request``... comme elles le seraient sur ``app`` ; rien
+n'est attache tant que ``routes.installer(app)`` n'est pas appele par la
+fabrique ``create_app``. Contrairement a un Blueprint, les noms d'endpoint
+restent inchanges (``url_for('login')``).
+"""
+
+
+class Registre:
+    """Enregistre les decorateurs de ``Flask`` pour les rejouer sur une application."""
+
+    def __init__(self):
+        self._enregistrements = []
+
+    def _differer(self, methode, *args, **kwargs):
+        def decorateur(fonction):
+            self._enregistrements.append((methode, args, kwargs, fonction))
+            return fonction
+
+        return decorateur
+
+    def route(self, regle, **options):
+        return self._differer('route', regle, **options)
+
+    def errorhandler(self, code_ou_exception):
+        return self._differer('errorhandler', code_ou_exception)
+
+    def before_request(self, fonction):
+        return self._differer('before_request')(fonction)
+
+    def context_processor(self, fonction):
+        return self._differer('context_processor')(fonction)
+
+    def installer(self, app):
+        """Attache a ``app``, dans l'ordre de declaration, tout ce qui a ete enregistre."""
+        for methode, args, kwargs, fonction in self._enregistrements:
+            attacher = getattr(app, methode)
+            (attacher(*args, **kwargs) if args or kwargs else attacher)(fonction)
+        return app
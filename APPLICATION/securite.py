@@ -0,0 +1,135 @@
+"""Hachage des mots de passe dans un pool borne.
+
+PBKDF2 et scrypt (``hashlib``) relachent le GIL pendant le calcul : executes
+dans un petit pool de threads, ils n'empechent plus les autres threads du
+worker de servir leurs requetes. Le pool limite le nombre de hachages
+simultanes (``HACHAGE_THREADS``) et la file d'attente (``HACHAGE_FILE_MAX``) :
+au-dela, ``HachageSature`` est levee et la requete recoit un 503 immediat au
+lieu d'attendre derriere une rafale de connexions.
+
+Le cout est fixe par ``HACHAGE_METHODE`` (syntaxe de werkzeug, par exemple
+``pbkdf2:sha256:600000`` ou ``scrypt:32768:8:1``) ; un hash produit avec
+d'autres parametres est recalcule a la connexion suivante.
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as DelaiDepasse
+
+from flask import current_app, has_app_context
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, check_password_hash, generate_password_hash
+
+METHODE_DEFAUT = f'pbkdf2:sha256:{DEFAULT_PBKDF2_ITERATIONS}'
+THREADS_DEFAUT = 2
+FILE_MAX_DEFAUT = 16
+DELAI_DEFAUT = 10
+
+
+class HachageSature(RuntimeError):
+    """Trop de hachages en attente : reessayer plus tard."""
+
+
+class PoolHachage:
+    """Pool de ``threads`` threads acceptant au plus ``file_max`` hachages en attente."""
+
+    def __init__(self, threads=THREADS_DEFAUT, file_max=FILE_MAX_DEFAUT, delai=DELAI_DEFAUT):
+        self.threads = threads
+        self.file_max = file_max
+        self.delai = delai
+        self.executes = 0
+        self.refus = 0
+        self._places = threading.BoundedSemaphore(threads + file_max)
+        self._executeur = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='hachage')
+
+    def executer(self, fonction, *args):
+        """Execute ``fonction(*args)`` dans le pool et attend son resultat."""
+        if not self._places.acquire(blocking=False):
+            self.refus += 1
+            raise HachageSature('File de hachage pleine')
+        try:
+            futur = self._executeur.submit(fonction, *args)
+        except BaseException:
+            self._places.release()
+            raise
+        futur.add_done_callback(lambda _: self._places.release())
+
+        try:
+            resultat = futur.result(timeout=self.delai)
+        except DelaiDepasse:
+            futur.cancel()
+            self.refus += 1
+            raise HachageSature('Hachage trop long a obtenir')
+        self.executes += 1
+        return resultat
+
+    def arreter(self):
+        self._executeur.shutdown(wait=False, cancel_futures=True)
+
+
+_pool = None
+_verrou = threading.Lock()
+
+
+def pool_hachage():
+    """Pool du processus, cree avec les valeurs par defaut si ``init_securite`` n'a pas ete appele."""
+    global _pool
+    if _pool is None:
+        with _verrou:
+            if _pool is None:
+                _pool = PoolHachage()
+    return _pool
+
+
+def init_securite(app):
+    """Cree le pool de hachage du processus d'apres la configuration."""
+    global _pool
+    with _verrou:
+        if _pool is not None:
+            _pool.arreter()
+        _pool = PoolHachage(
+            app.config.get('HACHAGE_THREADS', THREADS_DEFAUT),
+            app.config.get('HACHAGE_FILE_MAX', FILE_MAX_DEFAUT),
+            app.config.get('HACHAGE_DELAI', DELAI_DEFAUT),
+        )
+    app.extensions['hachage'] = _pool
+    return _pool
+
+
+def normaliser_methode(methode):
+    """Complete les parametres omis comme le fait werkzeug ('pbkdf2' -> 'pbkdf2:sha256:600000')."""
+    parties = methode.split(':')
+    if parties[0] == 'pbkdf2':
+        defauts = ['pbkdf2', 'sha256', str(DEFAULT_PBKDF2_ITERATIONS)]
+    elif parties[0] == 'scrypt':
+        defauts = ['scrypt', '32768', '8', '1']
+    else:
+        return methode
+    return ':'.join(parties + defauts[len(parties):])
+
+
+def methode_courante():
+    if has_app_context():
+        return normaliser_methode(current_app.config.get('HACHAGE_METHODE') or METHODE_DEFAUT)
+    return METHODE_DEFAUT
+
+
+def a_rehacher(hash_mot_de_passe, methode=None):
+    """Vrai si le hash n'a pas ete produit avec la methode configuree."""
+    return hash_mot_de_passe.split('$', 1)[0] != (methode or methode_courante())
+
+
+def hacher_mot_de_passe(mot_de_passe, methode=None):
+    return pool_hachage().executer(generate_password_hash, mot_de_passe, methode or methode_courante())
+
+
+def verifier_mot_de_passe(hash_mot_de_passe, mot_de_passe):
+    """Retourne ``(valide, nouveau_hash)`` ; ``nouveau_hash`` n'est fourni que
+    si le mot de passe est valide et que son hash doit etre mis a niveau."""
+    if not hash_mot_de_passe:
+        return False, None
+    if not pool_hachage().executer(check_password_hash, hash_mot_de_passe, mot_de_passe):
+        return False, None
+
+    methode = methode_courante()
+    if a_rehacher(hash_mot_de_passe, methode):
+        return True, hacher_mot_de_passe(mot_de_passe, methode)
+    return True, None
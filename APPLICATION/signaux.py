@@ -0,0 +1,60 @@
+"""Notification des ecritures validees en base.
+
+Pendant un flush, les tables et cles primaires des objets ajoutes, modifies
+ou supprimes sont notees dans la session ; apres le commit, chaque abonne
+recoit ``{nom_de_table: {ids}}``. Un rollback oublie ce qui a ete note.
+
+Les ecritures faites hors ORM (``UPDATE`` ensemblistes) doivent appeler
+``publier()`` elles-memes, ou ``noter()`` pour attendre le commit ; un
+ensemble d'ids vide signifie "lignes inconnues, toute la table est concernee".
+"""
+
+from itertools import chain
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+_abonnes = []
+_CLE_SESSION = 'changements_en_attente'
+
+
+def abonner(fonction):
+    """Enregistre une fonction appelee apres chaque commit (utilisable en decorateur)."""
+    _abonnes.append(fonction)
+    return fonction
+
+
+def publier(changements):
+    """Transmet des changements a tous les abonnes."""
+    if not changements:
+        return
+    for fonction in list(_abonnes):
+        fonction(changements)
+
+
+def noter(session, table, ids=()):
+    """Note un changement fait hors flush, publie avec le prochain commit de la session."""
+    session.info.setdefault(_CLE_SESSION, {}).setdefault(table, set()).update(ids)
+
+
+@event.listens_for(Session, 'after_flush')
+def _noter_changements(session, contexte):
+    en_attente = session.info.setdefault(_CLE_SESSION, {})
+    for objet in chain(session.new, session.dirty, session.deleted):
+        table = getattr(objet, '__tablename__', None)
+        if table is None:
+            continue
+        identite = inspect(objet).identity
+        ids = en_attente.setdefault(table, set())
+        if identite:
+            ids.add(identite[0])
+
+
+@event.listens_for(Session, 'after_commit')
+def _publier_changements(session):
+    publier(session.info.pop(_CLE_SESSION, None))
+
+
+@event.listens_for(Session, 'after_rollback')
+def _oublier_changements(session):
+    session.info.pop(_CLE_SESSION, None)
@@ -30,10 +30,25 @@ document.addEventListener('DOMContentLoaded', function () {
         );
     });
 
+    // GET conditionnel : renvoie l'ETag connu et reutilise la reponse gardee sur un 304
+    const reponsesConnues = new Map();
+    const fetchConditionnel = (url) => {
+        const connue = reponsesConnues.get(url);
+        const headers = connue ? { 'If-None-Match': connue.etag } : {};
+        return fetch(url, { headers, cache: 'no-store' }).then((response) => {
+            if (response.status === 304 && connue) return connue.data;
+            if (!response.ok) throw new Error(response.status);
+            return response.json().then((data) => {
+                const etag = response.headers.get('ETag');
+                if (etag) reponsesConnues.set(url, { etag, data });
+                return data;
+            });
+        });
+    };
+
     // Verification disponibilite ouvrage
     window.checkDisponibilite = function (ouvrageId) {
-        fetch(`/api/ouvrage/${ouvrageId}/disponibilite`)
-            .then((response) => response.json())
+        fetchConditionnel(`/api/ouvrage/${ouvrageId}/disponibilite`)
             .then((data) => {
                 if (data.disponible) {
                     alert(`Disponible : ${data.exemplaires_disponibles}/${data.total_exemplaires} exemplaires`);
@@ -43,57 +58,159 @@ document.addEventListener('DOMContentLoaded', function () {
             });
     };
 
-    // Rafraichissement dynamique dashboard usager
+    // Disponibilites groupees : les demandes faites dans le meme cycle partent en un seul appel
+    const DISPONIBILITES_MAX_IDS = 200;
+    let idsEnAttente = new Map();
+    window.chargerDisponibilites = function (ids) {
+        const promesses = ids.map((id) => {
+            const id_ = String(id);
+            if (!idsEnAttente.has(id_)) {
+                let resoudre, rejeter;
+                const promesse = new Promise((res, rej) => { resoudre = res; rejeter = rej; });
+                idsEnAttente.set(id_, { promesse, resoudre, rejeter });
+            }
+            return idsEnAttente.get(id_).promesse.then((d) => [id_, d]);
+        });
+
+        if (!window.chargerDisponibilites.planifie) {
+            window.chargerDisponibilites.planifie = true;
+            setTimeout(() => {
+                const lot = idsEnAttente;
+                idsEnAttente = new Map();
+                window.chargerDisponibilites.planifie = false;
+                const tous = Array.from(lot.keys());
+                for (let i = 0; i < tous.length; i += DISPONIBILITES_MAX_IDS) {
+                    const tranche = tous.slice(i, i + DISPONIBILITES_MAX_IDS);
+                    fetch(`/api/ouvrages/disponibilites?ids=${tranche.join(',')}`)
+                        .then((res) => {
+                            if (!res.ok) throw new Error(res.status);
+                            return res.json();
+                        })
+                        .then((payload) => tranche.forEach((id) => lot.get(id).resoudre(payload.disponibilites[id] || null)))
+                        .catch((err) => tranche.forEach((id) => lot.get(id).rejeter(err)));
+                }
+            }, 0);
+        }
+
+        return Promise.all(promesses).then((paires) => Object.fromEntries(paires));
+    };
+
+    // Met a jour en un appel tous les badges [data-disponibilite-ouvrage] de la page
+    const libelleDisponibilite = (badge, d) => {
+        if (badge.dataset.libelle === 'court') return `${d.exemplaires_disponibles} disponible(s)`;
+        return d.disponible
+            ? `<i class="bi bi-check-circle"></i> Disponible (${d.exemplaires_disponibles}/${d.total_exemplaires})`
+            : '<i class="bi bi-x-circle"></i> Indisponible';
+    };
+    const rafraichirDisponibilites = () => {
+        const badges = Array.from(document.querySelectorAll('[data-disponibilite-ouvrage]'));
+        if (badges.length === 0) return;
+        window.chargerDisponibilites(badges.map((b) => b.dataset.disponibiliteOuvrage))
+            .then((dispos) => {
+                badges.forEach((badge) => {
+                    const d = dispos[badge.dataset.disponibiliteOuvrage];
+                    if (!d) return;
+                    badge.classList.toggle('bg-success', d.disponible);
+                    badge.classList.toggle('bg-danger', !d.disponible);
+                    badge.innerHTML = libelleDisponibilite(badge, d);
+                });
+            })
+            .catch(() => {
+                // Les badges rendus par le serveur restent affiches
+            });
+    };
+    // Au retour sur un onglet reste ouvert, les disponibilites ont pu changer
+    document.addEventListener('visibilitychange', () => {
+        if (document.visibilityState === 'visible') rafraichirDisponibilites();
+    });
+
+    // Rafraichissement dynamique dashboard usager : flux SSE, ou interrogation espacee a defaut
     const userDashboard = document.querySelector('[data-user-dashboard="true"]');
     if (userDashboard) {
-        const updateDashboard = () => {
-            fetch('/api/espace-usager/dashboard')
-                .then((res) => res.json())
-                .then((payload) => {
-                    if (!payload || !payload.stats) return;
-
-                    const stats = payload.stats;
-                    const emprunts = document.getElementById('kpi-emprunts');
-                    const retards = document.getElementById('kpi-retards');
-                    const reservations = document.getElementById('kpi-reservations');
-                    const demandes = document.getElementById('kpi-demandes');
-
-                    if (emprunts) emprunts.textContent = stats.emprunts_en_cours;
-                    if (retards) retards.textContent = stats.emprunts_en_retard;
-                    if (reservations) reservations.textContent = stats.reservations_actives;
-                    if (demandes) demandes.textContent = stats.demandes_en_attente;
-
-                    const list = document.getElementById('demandes-live-list');
-                    if (list && Array.isArray(payload.demandes)) {
-                        if (payload.demandes.length === 0) {
-                            list.innerHTML = '<div class="p-4 text-muted">Aucune demande pour le moment.</div>';
-                            return;
-                        }
-
-                        list.innerHTML = payload.demandes
-                            .map((d) => {
-                                let badgeClass = 'bg-warning text-dark';
-                                if (d.statut === 'acceptee') badgeClass = 'bg-success';
-                                if (d.statut === 'refusee') badgeClass = 'bg-danger';
-
-                                return `
-                                <div class="list-group-item">
-                                    <div class="d-flex justify-content-between align-items-center">
-                                        <strong>${d.ouvrage}</strong>
-                                        <span class="badge ${badgeClass}">${d.statut}</span>
-                                    </div>
-                                    <small>${d.type_demande} - ${d.date_creation}</small>
-                                </div>`;
-                            })
-                            .join('');
+        const renderDashboard = (payload) => {
+            if (!payload || !payload.stats) return;
+
+            const stats = payload.stats;
+            const emprunts = document.getElementById('kpi-emprunts');
+            const retards = document.getElementById('kpi-retards');
+            const reservations = document.getElementById('kpi-reservations');
+            const demandes = document.getElementById('kpi-demandes');
+
+            if (emprunts) emprunts.textContent = stats.emprunts_en_cours;
+            if (retards) retards.textContent = stats.emprunts_en_retard;
+            if (reservations) reservations.textContent = stats.reservations_actives;
+            if (demandes) demandes.textContent = stats.demandes_en_attente;
+
+            const list = document.getElementById('demandes-live-list');
+            if (list && Array.isArray(payload.demandes)) {
+                if (payload.demandes.length === 0) {
+                    list.innerHTML = '<div class="p-4 text-muted">Aucune demande pour le moment.</div>';
+                    return;
+                }
+
+                list.innerHTML = payload.demandes
+                    .map((d) => {
+                        let badgeClass = 'bg-warning text-dark';
+                        if (d.statut === 'acceptee') badgeClass = 'bg-success';
+                        if (d.statut === 'refusee') badgeClass = 'bg-danger';
+
+                        return `
+                        <div class="list-group-item">
+                            <div class="d-flex justify-content-between align-items-center">
+                                <strong>${d.ouvrage}</strong>
+                                <span class="badge ${badgeClass}">${d.statut}</span>
+                            </div>
+                            <small>${d.type_demande} - ${d.date_creation}</small>
+                        </div>`;
+                    })
+                    .join('');
+            }
+        };
+
+        // Interrogation conditionnelle (ETag) : 15 s apres un changement, jusqu'a 2 min sinon
+        const DELAI_MIN = 15000;
+        const DELAI_MAX = 120000;
+        let delai = DELAI_MIN;
+        let etag = null;
+
+        const poll = () => {
+            const headers = etag ? { 'If-None-Match': etag } : {};
+            fetch('/api/espace-usager/dashboard', { headers, cache: 'no-store' })
+                .then((res) => {
+                    if (res.status === 304) {
+                        delai = Math.min(delai * 2, DELAI_MAX);
+                        return null;
                     }
+                    if (!res.ok) throw new Error(res.status);
+                    etag = res.headers.get('ETag');
+                    delai = DELAI_MIN;
+                    return res.json();
                 })
+                .then(renderDashboard)
                 .catch(() => {
                     // Laisse l'etat actuel en cas d'erreur reseau ponctuelle
-                });
+                    delai = Math.min(delai * 2, DELAI_MAX);
+                })
+                .finally(() => setTimeout(poll, delai));
         };
 
-        updateDashboard();
-        setInterval(updateDashboard, 15000);
+        if (window.EventSource) {
+            const source = new EventSource('/api/espace-usager/flux');
+            let echecs = 0;
+            source.onopen = () => {
+                echecs = 0;
+            };
+            source.addEventListener('dashboard', (event) => renderDashboard(JSON.parse(event.data)));
+            source.onerror = () => {
+                // Le navigateur se reconnecte seul ; apres 3 echecs consecutifs, retour a l'interrogation
+                echecs += 1;
+                if (source.readyState === EventSource.CLOSED || echecs > 3) {
+                    source.close();
+                    poll();
+                }
+            };
+        } else {
+            poll();
+        }
     }
 });
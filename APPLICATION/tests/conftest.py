@@ -0,0 +1,87 @@
+"""Fixtures communes : application au profil Test, base migree et peuplee.
+
+La base (``TEST_DATABASE_URL``, en memoire par defaut) est migree puis
+remplie une fois par session par le jeu de donnees synthetique a la plus
+petite echelle, avec une date de reference fixe. Une base PostgreSQL est
+videe au prealable (schema ``public`` recree). Les tests qui ecrivent
+doivent le faire dans leurs propres lignes.
+"""
+
+import os
+import sys
+import tempfile
+from datetime import datetime
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('BIBLIOTHEQUE_PROFIL', 'test')
+_TEMPORAIRE = tempfile.mkdtemp(prefix='bibliotheque-tests-')
+os.environ.setdefault('METRIQUES_DOSSIER', os.path.join(_TEMPORAIRE, 'metriques'))
+os.environ.setdefault('IDENTITE_MARQUEUR', os.path.join(_TEMPORAIRE, 'identites.marqueur'))
+
+from flask_migrate import upgrade  # noqa: E402
+
+from app import create_app  # noqa: E402
+from database import DOSSIER_MIGRATIONS, db, init_migrations, verifier_schema  # noqa: E402
+from donnees_synthetiques import ECHELLE_MIN, MOT_DE_PASSE, generer  # noqa: E402
+from models import Bibliothecaire, Emprunt, Usager, STATUTS_EMPRUNT_ACTIFS  # noqa: E402
+
+REFERENCE = datetime(2026, 1, 1)
+ADMIN = {'login': 'admin', 'password': 'admin123'}
+
+
+@pytest.fixture(scope='session')
+def app():
+    application = create_app('test')
+    init_migrations(application)
+    with application.app_context():
+        if db.engine.dialect.name == 'postgresql':
+            db.session.execute(db.text('DROP SCHEMA public CASCADE'))
+            db.session.execute(db.text('CREATE SCHEMA public'))
+            db.session.commit()
+        upgrade(directory=DOSSIER_MIGRATIONS)
+        admin = Bibliothecaire(nom='Admin', prenom='Test', login=ADMIN['login'])
+        admin.set_password(ADMIN['password'])
+        db.session.add(admin)
+        db.session.commit()
+        generer(ECHELLE_MIN, graine=1, reference=REFERENCE)
+    assert verifier_schema(application)
+
+    yield application
+
+    application.extensions['metriques'].arreter()
+    with application.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def client_admin(app):
+    client = app.test_client()
+    reponse = client.post('/login', data=ADMIN)
+    assert reponse.status_code == 302
+    return client
+
+
+@pytest.fixture
+def client_usager(app):
+    """Client connecte comme l'usager qui a le plus d'emprunts en cours"""
+    with app.app_context():
+        email = db.session.scalar(
+            db.select(Usager.email)
+            .join(Emprunt, Emprunt.usager_id == Usager.id)
+            .where(Emprunt.statut.in_(STATUTS_EMPRUNT_ACTIFS))
+            .group_by(Usager.id)
+            .order_by(db.func.count().desc())
+            .limit(1)
+        )
+    client = app.test_client()
+    reponse = client.post('/espace-usager/connexion', data={'email': email, 'password': MOT_DE_PASSE})
+    assert reponse.status_code == 302
+    return client
@@ -0,0 +1,40 @@
+"""Prolongation d'un emprunt par un bibliothecaire."""
+
+from datetime import datetime, timedelta
+
+import pytest
+
+from database import db
+from models import Emprunt, Exemplaire, Ouvrage, Usager
+
+
+def _emprunt_en_retard(nom, jours_de_retard):
+    ouvrage = Ouvrage(titre=f'Prolongation {nom}', auteur='Test', nombre_exemplaires=1, copies_available=0)
+    usager = Usager(nom='Prolongation', prenom=nom, email=f'prolongation-{nom}@exemple.fr', statut='actif')
+    db.session.add_all([ouvrage, usager])
+    db.session.flush()
+    exemplaire = Exemplaire(ouvrage_id=ouvrage.id, numero=f'PROL-{nom}')
+    db.session.add(exemplaire)
+    db.session.flush()
+    emprunt = Emprunt(
+        usager_id=usager.id, exemplaire_id=exemplaire.id, statut='en_retard',
+        date_retour_prevue=datetime.utcnow() - timedelta(days=jours_de_retard),
+    )
+    db.session.add(emprunt)
+    db.session.commit()
+    return emprunt.id
+
+
+@pytest.mark.parametrize('jours_de_retard, statut', [(3, 'en_cours'), (10, 'en_retard')])
+def test_prolongation_d_un_emprunt_en_retard(app, client_admin, jours_de_retard, statut):
+    with app.app_context():
+        emprunt_id = _emprunt_en_retard(f'retard-{jours_de_retard}', jours_de_retard)
+
+    reponse = client_admin.get(f'/admin/emprunt/prolonger/{emprunt_id}')
+    assert reponse.status_code == 302
+
+    with app.app_context():
+        emprunt = db.session.get(Emprunt, emprunt_id)
+        assert emprunt.prolongations == 1
+        # Echeance de nouveau dans le futur : en cours ; toujours depassee : reste en retard
+        assert emprunt.statut == statut
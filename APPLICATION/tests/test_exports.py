@@ -0,0 +1,46 @@
+"""Exports en flux : en-tetes et neutralisation des formules dans le CSV."""
+
+import csv
+import io
+import json
+
+from database import db
+from models import Usager
+
+FORMULE = '=HYPERLINK("http://exemple.invalid","clic")'
+
+
+def _creer_usager_piege(app):
+    with app.app_context():
+        usager = db.session.scalar(db.select(Usager).where(Usager.email == 'formule@exemple.fr'))
+        if usager is None:
+            usager = Usager(nom=FORMULE, prenom='@SOMME(A1)', email='formule@exemple.fr', telephone='+22370000000')
+            usager.set_password('secret1')
+            db.session.add(usager)
+            db.session.commit()
+        return usager.id
+
+
+def test_en_tetes_csv(client_admin):
+    reponse = client_admin.get('/admin/export/usagers.csv')
+    assert reponse.status_code == 200
+    assert reponse.headers['Content-Type'] == 'text/csv; charset=utf-8'
+    assert reponse.headers['Content-Disposition'].startswith('attachment;')
+
+
+def test_formules_neutralisees_en_csv(app, client_admin):
+    usager_id = _creer_usager_piege(app)
+    lignes = list(csv.DictReader(io.StringIO(client_admin.get('/admin/export/usagers.csv').get_data(as_text=True))))
+    ligne = next(ligne for ligne in lignes if ligne['id'] == str(usager_id))
+    assert ligne['nom'] == "'" + FORMULE
+    assert ligne['prenom'] == "'@SOMME(A1)"
+    assert ligne['telephone'] == "'+22370000000"
+    assert ligne['email'] == 'formule@exemple.fr'
+
+
+def test_jsonl_inchange(app, client_admin):
+    usager_id = _creer_usager_piege(app)
+    reponse = client_admin.get('/admin/export/usagers.jsonl')
+    assert reponse.headers['Content-Type'] == 'application/x-ndjson; charset=utf-8'
+    lignes = [json.loads(ligne) for ligne in reponse.get_data(as_text=True).splitlines()]
+    assert next(ligne for ligne in lignes if ligne['id'] == usager_id)['nom'] == FORMULE
@@ -0,0 +1,44 @@
+"""Cache des identites : une modification faite par un autre worker est vue a la requete suivante."""
+
+import os
+import time
+
+from sqlalchemy import update
+
+import identite
+from database import db
+from models import Usager
+
+
+def _modifier_par_un_autre_worker(app, usager_id, **valeurs):
+    """Ecriture hors ORM (aucun signal dans ce processus), puis marqueur touche comme le ferait l'autre worker"""
+    with app.app_context():
+        db.session.execute(update(Usager).where(Usager.id == usager_id).values(**valeurs))
+        db.session.commit()
+        chemin = identite._chemin_marqueur()
+    os.makedirs(os.path.dirname(chemin), exist_ok=True)
+    with open(chemin, 'a'):
+        pass
+    maintenant = time.time_ns()
+    os.utime(chemin, ns=(maintenant, maintenant))
+
+
+def test_modification_vue_par_les_autres_workers(app):
+    with app.app_context():
+        usager = Usager(nom='Marqueur', prenom='Avant', email='marqueur@exemple.fr', statut='actif')
+        usager.set_password('secret1')
+        db.session.add(usager)
+        db.session.commit()
+        usager_id = usager.id
+    client = app.test_client()
+    client.post('/espace-usager/connexion', data={'email': 'marqueur@exemple.fr', 'password': 'secret1'})
+    assert b'Avant' in client.get('/espace-usager/dashboard').data
+
+    # Sans marqueur touche, l'instantane du cache est servi
+    with app.app_context():
+        db.session.execute(update(Usager).where(Usager.id == usager_id).values(prenom='Ignore'))
+        db.session.commit()
+    assert b'Avant' in client.get('/espace-usager/dashboard').data
+
+    _modifier_par_un_autre_worker(app, usager_id, prenom='Apres')
+    assert b'Apres' in client.get('/espace-usager/dashboard').data
@@ -0,0 +1,49 @@
+"""Taches de maintenance : changements publies aux caches apres le commit de chaque lot."""
+
+from datetime import datetime
+
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+
+import signaux
+from database import db
+from maintenance import purger_demandes
+from models import DemandeUsager, Ouvrage, Usager
+
+
+def test_purge_publiee_apres_commit(app):
+    with app.app_context():
+        demande = DemandeUsager(
+            usager_id=db.session.scalar(select(Usager.id).limit(1)),
+            ouvrage_id=db.session.scalar(select(Ouvrage.id).limit(1)),
+            type_demande='emprunt', date_creation=datetime(2000, 1, 1),
+        )
+        db.session.add(demande)
+        db.session.commit()
+        demande_id = demande.id
+
+        commits, publications = [], []
+
+        def compter(session):
+            commits.append(session)
+
+        def relever(changements):
+            publications.append((changements, len(commits)))
+
+        # Compte chaque commit avant que signaux ne publie ce qu'il a note
+        event.listen(Session, 'after_commit', compter, insert=True)
+        signaux.abonner(relever)
+        try:
+            # Seules les demandes anterieures a 2001 sont assez anciennes : celle du test
+            delai = (datetime.utcnow() - datetime(2001, 1, 1)).days
+            assert purger_demandes(delai_jours=delai) == 1
+        finally:
+            signaux._abonnes.remove(relever)
+            event.remove(Session, 'after_commit', compter)
+        assert db.session.get(DemandeUsager, demande_id).statut == 'refusee'
+
+    purges = [(changements, commits_faits) for changements, commits_faits in publications
+              if 'demandes_usager' in changements]
+    assert [changements['demandes_usager'] for changements, _ in purges] == [{demande_id}]
+    # Publiee par le commit du lot, pas avant
+    assert purges[0][1] == 1
@@ -0,0 +1,49 @@
+"""Migration initiale appliquee a une ancienne base contenant des doublons."""
+
+import pytest
+from flask_migrate import upgrade
+from sqlalchemy import inspect, text
+
+from app import create_app
+from database import DOSSIER_MIGRATIONS, db, init_migrations
+
+
+def _index(nom_table):
+    return {index['name'] for index in inspect(db.engine).get_indexes(nom_table)}
+
+
+def test_doublons_actifs_interrompent_la_migration(tmp_path):
+    application = create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path / "ancienne.db"}'})
+    init_migrations(application)
+    with application.app_context():
+        upgrade(directory=DOSSIER_MIGRATIONS)
+        # Base anterieure aux migrations : ni revision ni index unique, deux emprunts actifs du meme exemplaire
+        with db.engine.begin() as connexion:
+            connexion.execute(text('DROP INDEX ux_emprunts_exemplaire_actif'))
+            connexion.execute(text('DELETE FROM alembic_version'))
+            connexion.execute(text("INSERT INTO ouvrages (id, titre, auteur, version) VALUES (1, 'Titre', 'Auteur', 1)"))
+            connexion.execute(text("INSERT INTO exemplaires (id, ouvrage_id, numero) VALUES (1, 1, 'EX-1')"))
+            for usager_id in (1, 2):
+                connexion.execute(text(
+                    "INSERT INTO usagers (id, nom, prenom, email, version) "
+                    f"VALUES ({usager_id}, 'Doublon', 'Test', 'doublon{usager_id}@exemple.fr', 1)"
+                ))
+                connexion.execute(text(
+                    f"INSERT INTO emprunts (usager_id, exemplaire_id, statut) VALUES ({usager_id}, 1, 'en_cours')"
+                ))
+
+        with pytest.raises(SystemExit):
+            upgrade(directory=DOSSIER_MIGRATIONS)
+        with db.engine.connect() as connexion:
+            assert connexion.scalar(text('SELECT count(*) FROM alembic_version')) == 0
+        assert 'ux_emprunts_exemplaire_actif' not in _index('emprunts')
+
+        # Doublon cloture : la migration relancee cree l'index et enregistre la revision
+        with db.engine.begin() as connexion:
+            connexion.execute(text("UPDATE emprunts SET statut = 'retourne' WHERE usager_id = 2"))
+        upgrade(directory=DOSSIER_MIGRATIONS)
+        with db.engine.connect() as connexion:
+            assert connexion.scalar(text('SELECT version_num FROM alembic_version')) == '0001'
+        assert 'ux_emprunts_exemplaire_actif' in _index('emprunts')
+        db.engine.dispose()
+    application.extensions['metriques'].arreter()
@@ -0,0 +1,215 @@
+"""Plans d'execution SQLite des requetes construites par l'application.
+
+Chaque cas appelle le vrai code (disponibilite, recherche, pagination, file
+de reservation, liste des emprunts, tableaux de bord usager et
+administrateur), releve les instructions executees et
+les passe a EXPLAIN QUERY PLAN. Les acces attendus ``(operation, table,
+index)`` doivent figurer dans le plan ; tout autre ``SCAN``, de la table
+entiere comme d'un index entier, fait echouer le test.
+"""
+
+import re
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event, func, select
+
+from controllers import GestionBibliotheque
+from database import db
+from disponibilite import compter_exemplaires_empruntes, disponibilites_par_ids
+from file_reservations import tete_de_file
+from donnees_synthetiques import MOT_DE_PASSE
+from models import DemandeUsager, Emprunt, Exemplaire, Reservation, Usager, STATUTS_EMPRUNT_ACTIFS
+from pagination import paginer
+from recherche import requete_catalogue
+
+PAGE = 20
+
+_ACCES = re.compile(
+    r'^(?P<operation>SEARCH|SCAN) (?P<table>\w+)'
+    r'(?: USING (?:COVERING )?INDEX (?P<index>\w+)| USING (?P<cle>INTEGER PRIMARY KEY)| (?P<virtuelle>VIRTUAL TABLE))?'
+)
+_CURSEUR = re.compile(r'[?&]curseur=([^"&]+)')
+
+
+@contextmanager
+def instructions_executees():
+    """Releve les SELECT executes dans le bloc, avec leurs parametres"""
+    releve = []
+
+    def noter(connexion, curseur, instruction, parametres, contexte, executemany):
+        if instruction.lstrip().upper().startswith('SELECT'):
+            releve.append((instruction, parametres))
+
+    event.listen(db.engine, 'before_cursor_execute', noter)
+    try:
+        yield releve
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', noter)
+
+
+def acces(instruction, parametres):
+    """Acces aux tables du plan : ``(operation, table, index)``, index None pour une table lue en entier"""
+    connexion = db.session.connection()
+    resultat = []
+    for ligne in connexion.exec_driver_sql(f'EXPLAIN QUERY PLAN {instruction}', parametres):
+        correspondance = _ACCES.match(ligne[-1])
+        if correspondance is None or correspondance['table'] == 'CONSTANT':
+            continue
+        index = correspondance['index'] or correspondance['cle'] or correspondance['virtuelle']
+        resultat.append((correspondance['operation'], correspondance['table'], index))
+    return resultat
+
+
+def _ouvrages_empruntes():
+    return db.session.scalars(
+        select(Exemplaire.ouvrage_id)
+        .join(Emprunt, Emprunt.exemplaire_id == Exemplaire.id)
+        .where(Emprunt.statut.in_(STATUTS_EMPRUNT_ACTIFS))
+        .distinct()
+        .limit(50)
+    ).all()
+
+
+def _ouvrage_le_plus_reserve():
+    return db.session.scalar(
+        select(Reservation.ouvrage_id)
+        .where(Reservation.statut == 'active')
+        .group_by(Reservation.ouvrage_id)
+        .order_by(func.count().desc())
+        .limit(1)
+    )
+
+
+# Chaque preparation lit ses valeurs dans la base puis retourne la fonction dont le plan est verifie
+
+def _exemplaires_empruntes(client):
+    ids = _ouvrages_empruntes()
+    return lambda: compter_exemplaires_empruntes(ids)
+
+
+def _disponibilite_par_ids(client):
+    ids = _ouvrages_empruntes()
+    return lambda: disponibilites_par_ids(ids)
+
+
+def _premiere_page_catalogue(client):
+    query, cles, element = requete_catalogue('')
+    return lambda: paginer(query, cles, None, PAGE, element)
+
+
+def _page_suivante(saisie):
+    def preparer(client):
+        query, cles, element = requete_catalogue(saisie)
+        premiere = paginer(query, cles, None, PAGE, element)
+        assert premiere.suivant
+        return lambda: paginer(query, cles, premiere.suivant, PAGE, element)
+    return preparer
+
+
+def _tete_de_file(client):
+    ouvrage_id = _ouvrage_le_plus_reserve()
+    return lambda: tete_de_file(ouvrage_id)
+
+
+def _page_suivante_emprunts(client):
+    page = client.get(f'/admin/emprunts?limite={PAGE}').get_data(as_text=True)
+    curseur = _CURSEUR.search(page)
+    assert curseur is not None
+    return lambda: client.get(f'/admin/emprunts?limite={PAGE}&curseur={curseur.group(1)}')
+
+
+def _tableau_de_bord_usager(client):
+    # L'usager qui a le plus de demandes, connecte sur un client a lui
+    email = db.session.scalar(
+        select(Usager.email)
+        .join(DemandeUsager, DemandeUsager.usager_id == Usager.id)
+        .group_by(Usager.id)
+        .order_by(func.count().desc())
+        .limit(1)
+    )
+    usager = client.application.test_client()
+    reponse = usager.post('/espace-usager/connexion', data={'email': email, 'password': MOT_DE_PASSE})
+    assert reponse.status_code == 302
+    return lambda: usager.get('/api/espace-usager/dashboard')
+
+
+def _statistiques_admin(client):
+    return lambda: GestionBibliotheque.get_statistiques(utiliser_cache=False)
+
+
+# Nom : (preparation, acces attendus)
+CAS = {
+    'exemplaires empruntes par ouvrage': (
+        _exemplaires_empruntes,
+        [('SEARCH', 'exemplaires', 'ix_exemplaires_ouvrage_libre'), ('SEARCH', 'emprunts', 'ix_emprunts_exemplaire_statut')],
+    ),
+    'disponibilite par ids': (
+        _disponibilite_par_ids,
+        [('SEARCH', 'ouvrages', 'INTEGER PRIMARY KEY')],
+    ),
+    # Parcours dans l'ordre de l'index, arrete par LIMIT
+    'premiere page du catalogue': (
+        _premiere_page_catalogue,
+        [('SCAN', 'ouvrages', 'ix_ouvrages_titre')],
+    ),
+    'page suivante du catalogue': (
+        _page_suivante(''),
+        [('SEARCH', 'ouvrages', 'ix_ouvrages_titre')],
+    ),
+    'recherche plein texte, page suivante': (
+        _page_suivante('jardin'),
+        [('SCAN', 'ouvrages_fts', 'VIRTUAL TABLE'), ('SEARCH', 'ouvrages', 'INTEGER PRIMARY KEY')],
+    ),
+    'tete de file de reservation': (
+        _tete_de_file,
+        [('SEARCH', 'reservations', 'ix_reservations_file')],
+    ),
+    'page suivante des emprunts': (
+        _page_suivante_emprunts,
+        [('SEARCH', 'emprunts', 'ix_emprunts_date_emprunt'), ('SEARCH', 'usagers_1', 'INTEGER PRIMARY KEY')],
+    ),
+    # Version (ETag) puis indicateurs et dernieres demandes de l'usager
+    'tableau de bord usager': (
+        _tableau_de_bord_usager,
+        [
+            ('SEARCH', 'usagers', 'INTEGER PRIMARY KEY'),
+            ('SEARCH', 'emprunts', 'ix_emprunts_statut_usager'),
+            ('SEARCH', 'reservations', 'ix_reservations_usager_statut'),
+            ('SEARCH', 'demandes_usager', 'ix_demandes_usager_statut_date'),
+            ('SEARCH', 'demandes_usager', 'ix_demandes_usager_date'),
+            ('SEARCH', 'ouvrages', 'INTEGER PRIMARY KEY'),
+        ],
+    ),
+    # Totaux des tables entieres par leur plus petit index, comptes filtres par les index de statut
+    'statistiques du tableau de bord': (
+        _statistiques_admin,
+        [
+            ('SCAN', 'ouvrages', 'ix_ouvrages_date_ajout'),
+            ('SCAN', 'exemplaires', 'ix_exemplaires_ouvrage_libre'),
+            ('SCAN', 'usagers', 'ix_usagers_nom'),
+            ('SEARCH', 'emprunts', 'ix_emprunts_statut_usager'),
+            ('SEARCH', 'emprunts', 'ix_emprunts_statut_retour'),
+            ('SEARCH', 'reservations', 'ix_reservations_statut_expiration'),
+            ('SEARCH', 'demandes_usager', 'ix_demandes_statut_date'),
+        ],
+    ),
+}
+
+
+@pytest.mark.parametrize('nom', list(CAS))
+def test_plan_utilise_les_index_attendus(app, client_admin, nom):
+    preparer, attendus = CAS[nom]
+    with app.test_request_context():
+        if db.engine.dialect.name != 'sqlite':
+            pytest.skip('plans EXPLAIN QUERY PLAN propres a SQLite')
+        executer = preparer(client_admin)
+        with instructions_executees() as releve:
+            executer()
+        assert releve, 'aucune requete executee'
+        plan = [a for instruction, parametres in releve for a in acces(instruction, parametres)]
+
+    manquants = [a for a in attendus if a not in plan]
+    parcours = [a for a in plan if a[0] == 'SCAN' and a not in attendus]
+    assert not manquants, f'{nom} : acces attendus absents {manquants}, plan {plan}'
+    assert not parcours, f'{nom} : parcours complet {parcours}, plan {plan}'
@@ -0,0 +1,161 @@
+"""Verrous de ligne et ``UPDATE ... FROM`` sous PostgreSQL.
+
+SQLite ignore ``FOR UPDATE SKIP LOCKED`` (un seul ecrivain a la fois) : ces
+tests ne tournent qu'avec ``TEST_DATABASE_URL`` pointant sur une base
+PostgreSQL, et sont sautes sinon. Deux contextes d'application tiennent
+deux sessions, donc deux transactions, sur des connexions distinctes.
+"""
+
+import threading
+import time
+from datetime import datetime
+
+import pytest
+from sqlalchemy import select, text
+
+from circulation import allouer_exemplaire
+from database import db
+from demandes import reclamer_demandes
+from file_reservations import renumeroter_file
+from models import DemandeUsager, Exemplaire, Ouvrage, Reservation, Usager
+
+# Attente maximale d'un verrou : un test qui bloquerait echoue au lieu de pendre
+ATTENTE_VERROU = '5s'
+ATTENTE_MAX = 5
+
+
+@pytest.fixture(autouse=True)
+def postgresql(app):
+    with app.app_context():
+        if db.engine.dialect.name != 'postgresql':
+            pytest.skip('verrous de ligne propres a PostgreSQL (TEST_DATABASE_URL)')
+
+
+def _limiter_attente():
+    db.session.execute(text(f"SET LOCAL lock_timeout = '{ATTENTE_VERROU}'"))
+
+
+def _ouvrage(nom, exemplaires=0):
+    ouvrage = Ouvrage(titre=f'Verrous {nom}', auteur='Test', nombre_exemplaires=exemplaires,
+                      copies_available=exemplaires)
+    db.session.add(ouvrage)
+    db.session.flush()
+    for numero in range(exemplaires):
+        db.session.add(Exemplaire(ouvrage_id=ouvrage.id, numero=f'PG-{nom}-{numero}'))
+    return ouvrage
+
+
+def _usagers(nom, nombre):
+    usagers = [
+        Usager(nom='Verrous', prenom=f'{nom} {numero}', email=f'pg-{nom}-{numero}@exemple.fr', statut='actif')
+        for numero in range(nombre)
+    ]
+    db.session.add_all(usagers)
+    db.session.flush()
+    return [usager.id for usager in usagers]
+
+
+def _instruction_bloquee():
+    """Attend qu'une autre transaction soit bloquee sur un verrou de ligne ; retourne son instruction, ou None"""
+    fin = time.monotonic() + ATTENTE_MAX
+    while time.monotonic() < fin:
+        # Nouvelle connexion a chaque tour : pg_stat_activity est fige pour la duree d'une transaction
+        with db.engine.connect() as connexion:
+            instruction = connexion.scalar(text(
+                "SELECT query FROM pg_stat_activity"
+                " WHERE datname = current_database() AND wait_event = 'transactionid' LIMIT 1"
+            ))
+        if instruction:
+            return instruction
+        time.sleep(0.05)
+    return None
+
+
+def test_reclamer_demandes_saute_les_demandes_verrouillees(app):
+    with app.app_context():
+        ouvrage = _ouvrage('demandes')
+        usagers = _usagers('demandes', 3)
+        # Plus anciennes que le jeu de donnees : ce sont elles qui sont reclamees en premier
+        demandes = [
+            DemandeUsager(usager_id=usager_id, ouvrage_id=ouvrage.id, type_demande='reservation',
+                          date_creation=datetime(2000, 1, 1, 0, minute))
+            for minute, usager_id in enumerate(usagers)
+        ]
+        db.session.add_all(demandes)
+        db.session.commit()
+        attendues = [demande.id for demande in demandes]
+
+    with app.app_context():
+        premier = [demande.id for demande in reclamer_demandes(limite=2)]
+        with app.app_context():
+            _limiter_attente()
+            second = [demande.id for demande in reclamer_demandes(limite=2)]
+            db.session.rollback()
+        db.session.rollback()
+
+    assert premier == attendues[:2]
+    assert second[0] == attendues[2]
+    assert not set(premier) & set(second)
+
+
+def test_allocation_concurrente_prend_deux_exemplaires(app):
+    with app.app_context():
+        ouvrage_id = _ouvrage('allocation', exemplaires=2).id
+        usagers = _usagers('allocation', 2)
+        db.session.commit()
+
+    resultats = {}
+
+    def second_worker():
+        with app.app_context():
+            _limiter_attente()
+            emprunt = allouer_exemplaire(usagers[1], ouvrage_id)
+            resultats['second'] = emprunt.exemplaire_id if emprunt else None
+            db.session.commit()
+
+    with app.app_context():
+        emprunt = allouer_exemplaire(usagers[0], ouvrage_id)
+        resultats['premier'] = emprunt.exemplaire_id
+        worker = threading.Thread(target=second_worker)
+        worker.start()
+        # Le second worker a saute l'exemplaire verrouille et n'attend que la ligne de l'ouvrage
+        instruction = _instruction_bloquee()
+        assert instruction is not None
+        assert instruction.lstrip().upper().startswith('UPDATE OUVRAGES'), instruction
+        db.session.commit()
+    worker.join(ATTENTE_MAX)
+
+    assert not worker.is_alive()
+    assert resultats['second'] is not None
+    assert resultats['premier'] != resultats['second']
+    with app.app_context():
+        assert db.session.get(Ouvrage, ouvrage_id).copies_available == 0
+        libres = db.session.scalar(
+            select(db.func.count()).select_from(Exemplaire)
+            .where(Exemplaire.ouvrage_id == ouvrage_id, Exemplaire.emprunt_courant_id.is_(None))
+        )
+        assert libres == 0
+
+
+def test_renumeroter_file_compacte_les_priorites(app):
+    with app.app_context():
+        ouvrage = _ouvrage('file')
+        usagers = _usagers('file', 4)
+        priorites = [2, 5, 9, 4]
+        statuts = ['active', 'active', 'active', 'annulee']
+        db.session.add_all([
+            Reservation(usager_id=usager_id, ouvrage_id=ouvrage.id, priorite=priorite, statut=statut)
+            for usager_id, priorite, statut in zip(usagers, priorites, statuts)
+        ])
+        db.session.commit()
+
+        assert renumeroter_file(ouvrage.id) == 3
+        db.session.commit()
+        file = db.session.execute(
+            select(Reservation.usager_id, Reservation.priorite)
+            .where(Reservation.ouvrage_id == ouvrage.id, Reservation.statut == 'active')
+            .order_by(Reservation.priorite)
+        ).all()
+        assert [tuple(ligne) for ligne in file] == [(usagers[0], 1), (usagers[1], 2), (usagers[2], 3)]
+        # File deja dense : aucune ligne reecrite
+        assert renumeroter_file(ouvrage.id) == 0
@@ -0,0 +1,33 @@
+"""Recherche de repli (``ILIKE``) des moteurs sans index FTS5."""
+
+import pytest
+
+import recherche
+from database import db
+from models import Ouvrage
+
+AUTEUR = 'Test motif'
+TITRES = ['Remise de 100% garantie', 'Remise de 1000 euros', 'nom_de_fichier', 'nom de fichier', 'C:\\dossier']
+
+
+@pytest.fixture
+def repli(app, monkeypatch):
+    """Ouvrages du test, recherche forcee sur le repli quel que soit le moteur"""
+    monkeypatch.setattr(recherche, 'index_disponible', lambda: False)
+    with app.app_context():
+        if not Ouvrage.query.filter_by(auteur=AUTEUR).first():
+            db.session.add_all([Ouvrage(titre=titre, auteur=AUTEUR) for titre in TITRES])
+            db.session.commit()
+        yield
+
+
+@pytest.mark.parametrize('saisie, attendus', [
+    ('100%', ['Remise de 100% garantie']),
+    ('_', ['nom_de_fichier']),
+    ('nom_de', ['nom_de_fichier']),
+    ('\\', ['C:\\dossier']),
+    ('remise', ['Remise de 1000 euros', 'Remise de 100% garantie']),
+])
+def test_caracteres_speciaux_cherches_tels_quels(repli, saisie, attendus):
+    query = recherche.filtrer_ouvrages(Ouvrage.query.filter_by(auteur=AUTEUR), saisie)
+    assert sorted(ouvrage.titre for ouvrage in query) == sorted(attendus)
@@ -0,0 +1,87 @@
+"""Pages principales rendues sous le profil Test.
+
+Le profil Test fixe ``SQL_REPETITIONS_ACTION = 'echouer'`` : une page qui
+charge paresseusement une relation dans une boucle (N+1) leve
+``RequetesRepetees`` et fait echouer son test.
+"""
+
+import pytest
+from sqlalchemy import event, func, select
+
+from database import db
+from diagnostics import RequetesRepetees, fermer_releve, ouvrir_releve, statistiques
+from models import Emprunt
+
+# Instructions SQL au plus par page, quelle que soit la taille de la page
+INSTRUCTIONS_MAX = 10
+
+
+def _instructions(app, endpoint):
+    with app.app_context():
+        totaux = {ligne['endpoint']: ligne for ligne in statistiques().endpoints_tries()}
+    return totaux[endpoint]['instructions_max']
+
+
+@pytest.fixture(autouse=True)
+def statistiques_vides(app):
+    with app.app_context():
+        statistiques().vider()
+
+
+def test_profil_test_echoue_sur_requetes_repetees(app):
+    assert app.config['SQL_REPETITIONS_ACTION'] == 'echouer'
+
+
+@pytest.mark.parametrize('url', ['/catalogue', '/catalogue?limite=100', '/catalogue?search=jardin'])
+def test_catalogue(app, client, url):
+    reponse = client.get(url)
+    assert reponse.status_code == 200
+    assert _instructions(app, 'catalogue') <= INSTRUCTIONS_MAX
+
+
+@pytest.mark.parametrize('statut', ['tous', 'en_cours', 'retourne', 'en_retard'])
+def test_liste_emprunts(app, client_admin, statut):
+    reponse = client_admin.get(f'/admin/emprunts?statut={statut}&limite=100')
+    assert reponse.status_code == 200
+    assert _instructions(app, 'liste_emprunts') <= INSTRUCTIONS_MAX
+
+
+def test_usager_dashboard(app, client_usager):
+    reponse = client_usager.get('/espace-usager/dashboard')
+    assert reponse.status_code == 200
+    assert _instructions(app, 'usager_dashboard') <= INSTRUCTIONS_MAX
+
+
+def test_reponse_en_flux_comptee_jusqu_a_la_fin(app, client_admin):
+    executees = []
+
+    def noter(*args):
+        executees.append(args[2])
+
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', noter)
+    try:
+        reponse = client_admin.get('/admin/export/emprunts.csv')
+        assert reponse.status_code == 200
+        assert reponse.is_streamed
+        reponse.get_data()
+        reponse.close()
+    finally:
+        with app.app_context():
+            event.remove(db.engine, 'before_cursor_execute', noter)
+    assert _instructions(app, 'exporter_donnees') == len(executees)
+    assert 'Server-Timing' in reponse.headers
+
+
+def test_chargement_paresseux_en_boucle_detecte(app):
+    with app.test_request_context('/essai'):
+        ouvrir_releve()
+        # Un emprunt par usager, puis un SELECT usagers par emprunt : ce que les gabarits ne doivent pas faire
+        premiers = select(func.min(Emprunt.id)).group_by(Emprunt.usager_id)
+        emprunts = db.session.scalars(
+            select(Emprunt).where(Emprunt.id.in_(premiers)).limit(app.config['SQL_REPETITIONS_MAX'] + 1)
+        ).all()
+        assert len({emprunt.usager.id for emprunt in emprunts}) == len(emprunts)
+        with pytest.raises(RequetesRepetees):
+            fermer_releve()
+        db.session.remove()
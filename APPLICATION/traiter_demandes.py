@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Worker de la file des demandes usager : accepte celles qui peuvent l'être
+Exécutez: python traiter_demandes.py [--lot 20] [--type emprunt|reservation] [--boucle SECONDES]
+
+Chaque lot est réclamé avec FOR UPDATE SKIP LOCKED (PostgreSQL) : plusieurs
+workers et les administrateurs peuvent traiter la file en même temps sans
+s'attendre. Les demandes impossibles à satisfaire restent en attente pour
+un bibliothécaire.
+"""
+
+import argparse
+import time
+
+from app import app
+from database import db
+from demandes import accepter_demande_en_attente, reclamer_demandes
+
+COMMENTAIRE_AUTOMATIQUE = 'Traitee automatiquement'
+
+
+def traiter(lot=20, type_demande=None):
+    """Examine une fois chaque demande en attente et affiche le bilan"""
+
+    with app.app_context():
+        print("=" * 60)
+        print(f"📨 TRAITEMENT DES DEMANDES ({time.strftime('%d/%m/%Y %H:%M:%S')})")
+        print("=" * 60)
+
+        vues = set()
+        acceptees = 0
+        erreurs = 0
+        while True:
+            demandes = reclamer_demandes(lot, type_demande, exclure=vues)
+            if not demandes:
+                break
+            echec = False
+            acceptees_lot = 0
+            for demande in demandes:
+                vues.add(demande.id)
+                try:
+                    succes, message = accepter_demande_en_attente(demande, None, COMMENTAIRE_AUTOMATIQUE)
+                except Exception as e:
+                    # Le lot entier est annule : ses demandes seront reprises a la prochaine passe
+                    db.session.rollback()
+                    print(f"  ❌ Demande {demande.id} : {e}")
+                    erreurs += 1
+                    echec = True
+                    break
+                if succes:
+                    acceptees_lot += 1
+                    print(f"  ✅ Demande {demande.id} ({demande.type_demande}) acceptée")
+                else:
+                    print(f"  ⏭️  Demande {demande.id} laissée en attente : {message}")
+            if echec:
+                break
+            # Le commit libère les verrous du lot
+            db.session.commit()
+            acceptees += acceptees_lot
+
+        print("=" * 60)
+        print(f"📊 {len(vues)} demande(s) examinée(s), {acceptees} acceptée(s), {erreurs} erreur(s)")
+        print("=" * 60)
+
+        return acceptees, erreurs
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--lot', type=int, default=20, help='demandes réclamées par transaction')
+    parser.add_argument('--type', dest='type_demande', choices=['emprunt', 'reservation'],
+                        help='ne traiter que ce type de demande')
+    parser.add_argument('--boucle', type=float, metavar='SECONDES',
+                        help='relance le traitement à cet intervalle au lieu de sortir')
+    args = parser.parse_args()
+
+    acceptees, erreurs = traiter(args.lot, args.type_demande)
+    while args.boucle:
+        time.sleep(args.boucle)
+        acceptees, erreurs = traiter(args.lot, args.type_demande)
+
+    raise SystemExit(1 if erreurs else 0)